@@ -0,0 +1,55 @@
+"""add lookup indexes
+
+Revision ID: 2b8d5f3e6c71
+Revises: 7c4e2b9f0a18
+Create Date: 2026-10-18 00:31:05.842913
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "2b8d5f3e6c71"
+down_revision: Union[str, None] = "7c4e2b9f0a18"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = [
+    ("ix_theme__title", "theme", ["_title"]),
+    ("ix_article__updated_at_id", "article", ["_updated_at", "_id"]),
+    ("ix_association_theme_id_created_at", "association", ["theme_id", "created_at"]),
+    ("ix_association_created_at", "association", ["created_at"]),
+    ("ix_browsed__logged_at_article_id", "browsed", ["_logged_at", "_article_id"]),
+    ("ix_browsed__browse_id", "browsed", ["_browse_id"]),
+    ("ix_recurrent_related_id", "recurrent", ["related_id"]),
+    ("ix_sporadic_related_id", "sporadic", ["related_id"]),
+]
+# single column indexes the composite indexes above lead with
+REPLACED_INDEXES = [
+    ("ix_association_theme_id", "association", ["theme_id"]),
+    ("ix_browsed__logged_at", "browsed", ["_logged_at"]),
+]
+
+
+def upgrade() -> None:
+    # built concurrently so writes are not blocked
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(
+                name, table, columns, unique=False, postgresql_concurrently=True
+            )
+        for name, table, _ in REPLACED_INDEXES:
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, columns in REPLACED_INDEXES:
+            op.create_index(
+                name, table, columns, unique=False, postgresql_concurrently=True
+            )
+        for name, table, _ in INDEXES:
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
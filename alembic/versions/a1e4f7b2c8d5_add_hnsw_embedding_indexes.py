@@ -0,0 +1,44 @@
+"""add hnsw embedding indexes
+
+Revision ID: a1e4f7b2c8d5
+Revises: 5d7c9e1b3a26
+Create Date: 2026-10-17 14:22:18.360574
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "a1e4f7b2c8d5"
+down_revision: Union[str, None] = "5d7c9e1b3a26"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # built concurrently so writes to article and theme are not blocked
+    with op.get_context().autocommit_block():
+        for table in ("article", "theme"):
+            op.create_index(
+                f"ix_{table}__embedding_hnsw",
+                table,
+                ["_embedding"],
+                unique=False,
+                postgresql_using="hnsw",
+                postgresql_with={"m": 16, "ef_construction": 64},
+                postgresql_ops={"_embedding": "vector_cosine_ops"},
+                postgresql_concurrently=True,
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for table in ("article", "theme"):
+            op.drop_index(
+                f"ix_{table}__embedding_hnsw",
+                table_name=table,
+                postgresql_concurrently=True,
+            )
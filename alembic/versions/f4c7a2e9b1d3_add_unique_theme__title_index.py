@@ -0,0 +1,71 @@
+"""add unique theme _title index
+
+Revision ID: f4c7a2e9b1d3
+Revises: 2b8d5f3e6c71
+Create Date: 2026-10-18 02:20:41.518223
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "f4c7a2e9b1d3"
+down_revision: Union[str, None] = "2b8d5f3e6c71"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # fold duplicate themes per title into the oldest before the unique index is built
+    op.execute("""
+        CREATE TEMPORARY TABLE duplicate_theme ON COMMIT DROP AS
+        SELECT _id, keep_id FROM (
+            SELECT _id, first_value(_id) OVER (
+                PARTITION BY _title ORDER BY _created_at, _id
+            ) AS keep_id
+            FROM theme
+            WHERE _title IS NOT NULL
+        ) ranked
+        WHERE _id <> keep_id
+        """)
+    op.execute("""
+        INSERT INTO association (article_id, theme_id, created_at, _updated_at)
+        SELECT a.article_id, d.keep_id, a.created_at, a._updated_at
+        FROM association a JOIN duplicate_theme d ON a.theme_id = d._id
+        ON CONFLICT DO NOTHING
+        """)
+    for table in ("recurrent", "sporadic"):
+        op.execute(f"""
+            INSERT INTO {table} (theme_id, related_id, created_at, _updated_at)
+            SELECT coalesce(t.keep_id, r.theme_id), coalesce(rt.keep_id, r.related_id),
+                r.created_at, r._updated_at
+            FROM {table} r
+            LEFT JOIN duplicate_theme t ON r.theme_id = t._id
+            LEFT JOIN duplicate_theme rt ON r.related_id = rt._id
+            WHERE (t._id IS NOT NULL OR rt._id IS NOT NULL)
+                AND coalesce(t.keep_id, r.theme_id) <> coalesce(rt.keep_id, r.related_id)
+            ON CONFLICT DO NOTHING
+            """)
+        op.execute(f"""
+            DELETE FROM {table}
+            WHERE theme_id IN (SELECT _id FROM duplicate_theme)
+                OR related_id IN (SELECT _id FROM duplicate_theme)
+            """)
+    op.execute(
+        "DELETE FROM association WHERE theme_id IN (SELECT _id FROM duplicate_theme)"
+    )
+    # the stats of the kept themes are recomputed by the next refresh_stats, run by build_themes
+    op.execute(
+        "DELETE FROM theme_stats WHERE _theme_id IN (SELECT _id FROM duplicate_theme)"
+    )
+    op.execute("DELETE FROM theme WHERE _id IN (SELECT _id FROM duplicate_theme)")
+    op.drop_index("ix_theme__title", table_name="theme")
+    op.create_index("ix_theme__title", "theme", ["_title"], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_theme__title", table_name="theme")
+    op.create_index("ix_theme__title", "theme", ["_title"], unique=False)
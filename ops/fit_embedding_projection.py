@@ -0,0 +1,46 @@
+"""
+Fits the projection of the local query embedding model onto the stored OpenAI embeddings.
+
+    PYTHONPATH=python/lambda DB_SECRET_ARN=... DB_CLUSTER_ENDPOINT=... \
+        python ops/fit_embedding_projection.py python/local_embedding/projection.npy
+
+Article titles and summaries are embedded locally and paired with the stored embeddings of the same articles. Saved
+to python/local_embedding, the matrix is copied into the docker image and the search function, which has fastembed,
+gets its path in LOCAL_EMBEDDING_PROJECTION.
+"""
+
+import argparse
+import numpy as np
+from lambda_init_context import LambdaInitContext
+from services.embedding_backends import LocalEmbeddingBackend, fit_projection
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("output")
+    parser.add_argument("--model", default=LocalEmbeddingBackend.MODEL)
+    parser.add_argument("--articles", type=int, default=5000)
+    args = parser.parse_args()
+
+    from fastembed import TextEmbedding
+
+    article_repo = LambdaInitContext(langfuse_enabled=False).article_repo
+    articles = [
+        article
+        for article in article_repo.get(limit=args.articles, min_token_count=0)
+        if article.embedding is not None
+    ]
+    # queries are short, so the local side is fitted on titles and summaries rather than whole texts
+    texts = [f"{article.title or ''}. {article.summary or ''}" for article in articles]
+    source = np.asarray(list(TextEmbedding(args.model).embed(texts)))
+    target = np.asarray([article.embedding for article in articles])
+    projection = fit_projection(source, target)
+    residual = np.linalg.norm(source @ projection - target) / np.linalg.norm(target)
+    np.save(args.output, projection)
+    print(
+        f"fitted {projection.shape} on {len(articles)} articles, relative residual {residual:.3f}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,302 @@
+"""
+Query plans of the repository methods before and after the lookup indexes, against a local Postgres with pgvector.
+
+    docker run -d -p 5432:5432 -e POSTGRES_PASSWORD=postgres pgvector/pgvector:pg16
+    PYTHONPATH=python/lambda python ops/query_plans.py
+
+A scratch database is created from the models and seeded with the same random data on every run. The SELECTs each
+repository method issues are captured and run with EXPLAIN (ANALYZE, BUFFERS), first without the indexes of the
+lookup index migration and then with them.
+"""
+
+import argparse
+from datetime import datetime, timedelta
+import importlib.util
+import json
+from pathlib import Path
+import random
+import statistics
+import uuid
+
+from sqlalchemy import create_engine, event, insert, text
+
+from models.models import Association, Base, Browsed, Recurrent, Sporadic
+from models.article import Article, ArticleType
+from models.theme import Theme, ThemeType
+from models.browse import Browse
+from article_repo import ArticleRepository
+from theme_repo import ThemeRepository
+from browse_repo import BrowseRepository
+from repos import BrowsedRepository, get_engine
+
+MIGRATION = (
+    Path(__file__).parent.parent
+    / "alembic"
+    / "versions"
+    / "2b8d5f3e6c71_add_lookup_indexes.py"
+)
+EMBEDDING_SIZE = 1536
+
+
+def load_migration():
+    spec = importlib.util.spec_from_file_location("lookup_indexes", MIGRATION)
+    migration = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(migration)
+    return migration
+
+
+def create_database(args):
+    admin = create_engine(
+        f"postgresql://{args.user}:{args.password}@{args.host}/postgres",
+        isolation_level="AUTOCOMMIT",
+    )
+    with admin.connect() as connection:
+        connection.execute(text(f'DROP DATABASE IF EXISTS "{args.dbname}"'))
+        connection.execute(text(f'CREATE DATABASE "{args.dbname}"'))
+    admin.dispose()
+    engine = create_engine(
+        f"postgresql://{args.user}:{args.password}@{args.host}/{args.dbname}"
+    )
+    with engine.begin() as connection:
+        connection.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+    Base.metadata.create_all(engine)
+    return engine
+
+
+def random_embedding(rng):
+    return [rng.uniform(-1, 1) for _ in range(EMBEDDING_SIZE)]
+
+
+def seed(engine, args):
+    rng = random.Random(args.seed)
+    # relative to now so the recent browse and association windows select rows
+    now = datetime.now()
+    articles = [
+        {
+            "_id": uuid.UUID(int=rng.getrandbits(128)),
+            "_title": f"article {i}",
+            "_type": ArticleType.ARTICLE,
+            "_url": f"https://example.com/{i}",
+            "_text": f"text of article {i} " * 20,
+            "_token_count": rng.randint(0, 2000),
+            "_embedding": random_embedding(rng),
+            "_created_at": now - timedelta(minutes=rng.randint(0, 60 * 24 * 90)),
+            "_logged_at": now - timedelta(minutes=rng.randint(0, 60 * 24 * 90)),
+            "_updated_at": now - timedelta(minutes=rng.randint(0, 60 * 24 * 90)),
+        }
+        for i in range(args.articles)
+    ]
+    themes = [
+        {
+            "_id": uuid.UUID(int=rng.getrandbits(128)),
+            "_title": f"theme+{i}",
+            "_source": rng.choice(list(ThemeType)),
+            "_embedding": random_embedding(rng),
+            "_created_at": now - timedelta(minutes=rng.randint(0, 60 * 24 * 90)),
+            "_updated_at": now - timedelta(minutes=rng.randint(0, 60 * 24 * 90)),
+        }
+        for i in range(args.themes)
+    ]
+    browses = [
+        {
+            "_id": uuid.UUID(int=rng.getrandbits(128)),
+            "_tab_id": f"tab-{i}",
+            "_logged_at": now - timedelta(minutes=rng.randint(0, 60 * 24 * 90)),
+        }
+        for i in range(args.browses)
+    ]
+    associations = {
+        (article["_id"], theme["_id"]): {
+            "article_id": article["_id"],
+            "theme_id": theme["_id"],
+            "created_at": article["_created_at"],
+        }
+        for article in articles
+        for theme in rng.sample(themes, 5)
+    }
+    browsed = {
+        (article["_id"], browse["_id"]): {
+            "_article_id": article["_id"],
+            "_browse_id": browse["_id"],
+            "_logged_at": browse["_logged_at"],
+        }
+        for browse in browses
+        for article in rng.sample(articles, 3)
+    }
+    related = [
+        {"theme_id": theme["_id"], "related_id": rng.choice(themes)["_id"]}
+        for theme in themes
+    ]
+    with engine.begin() as connection:
+        connection.execute(insert(Article), articles)
+        connection.execute(insert(Theme), themes)
+        connection.execute(insert(Browse), browses)
+        connection.execute(insert(Association), list(associations.values()))
+        connection.execute(insert(Browsed), list(browsed.values()))
+        connection.execute(insert(Recurrent), related)
+        connection.execute(insert(Sporadic), related)
+    theme_repo = repository(ThemeRepository, args)
+    theme_repo.refresh_stats()
+    with engine.begin() as connection:
+        connection.execute(text("ANALYZE"))
+    return articles, themes, browses
+
+
+def repository(repository_class, args):
+    return repository_class(args.user, args.password, args.dbname, args.host)
+
+
+def cases(args, articles, themes, browses):
+    article_repo = repository(ArticleRepository, args)
+    theme_repo = repository(ThemeRepository, args)
+    browse_repo = repository(BrowseRepository, args)
+    browsed_repo = repository(BrowsedRepository, args)
+    article = articles[len(articles) // 2]
+    theme = themes[len(themes) // 2]
+    browse = browses[len(browses) // 2]
+    _, article_cursor = article_repo.get_page(
+        20, sort_by="updated_at", min_token_count=0, projection=True
+    )
+    return {
+        "ArticleRepository.get_by_url": lambda: article_repo.get_by_url(
+            article["_url"]
+        ),
+        "ArticleRepository.get_page": lambda: article_repo.get_page(
+            20,
+            cursor=article_cursor,
+            sort_by="updated_at",
+            min_token_count=0,
+            projection=True,
+        ),
+        "ThemeRepository.get_by_title": lambda: theme_repo.get_by_title(
+            theme["_title"]
+        ),
+        "ThemeRepository.get": lambda: theme_repo.get(20, with_stats=True).all(),
+        "ThemeRepository.get recently_browsed": lambda: theme_repo.get(
+            20, recent_browsed_days=14, sort_by="recently_browsed"
+        ).all(),
+        "ThemeRepository.get association_days": lambda: theme_repo.get(
+            100, association_days=1, min_associations=0
+        ).all(),
+        "BrowseRepository.get_recently_browsed": lambda: browse_repo.get_recently_browsed(
+            limit=20, days=7
+        ),
+        "BrowseRepository.get_by_tab_id": lambda: browse_repo.get_by_tab_id(
+            browse["_tab_id"]
+        ),
+        "BrowsedRepository.get_by_browse_and_article": lambda: browsed_repo.get_by_browse_and_article(
+            browse["_id"], article["_id"]
+        ),
+    }
+
+
+def capture(engine, call):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, many):
+        if (
+            statement.lstrip().upper().startswith(("SELECT", "WITH"))
+            and "set_config" not in statement
+        ):
+            statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        call()
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+    return statements
+
+
+def plan_nodes(plan):
+    node = plan["Node Type"]
+    if "Index Name" in plan:
+        node += f" using {plan['Index Name']}"
+    elif "Relation Name" in plan:
+        node += f" on {plan['Relation Name']}"
+    nodes = [node] if "Scan" in plan["Node Type"] else []
+    for child in plan.get("Plans", []):
+        nodes += plan_nodes(child)
+    return nodes
+
+
+def explain(engine, statements, repeat):
+    """Median execution time over repeat runs, summed over the statements, and the scans of the plans."""
+    times = []
+    scans = []
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        for _ in range(repeat):
+            total = 0.0
+            scans = []
+            for statement, parameters in statements:
+                cursor.execute(
+                    "EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + statement, parameters
+                )
+                result = cursor.fetchone()[0]
+                result = json.loads(result) if isinstance(result, str) else result
+                total += result[0]["Execution Time"]
+                scans += plan_nodes(result[0]["Plan"])
+            times.append(total)
+        connection.rollback()
+    finally:
+        connection.close()
+    return statistics.median(times), scans
+
+
+def set_indexes(engine, migration, present):
+    """Puts the database in the state before (present=False) or after the lookup index migration."""
+    with engine.begin() as connection:
+        added, removed = (
+            (migration.INDEXES, migration.REPLACED_INDEXES)
+            if present
+            else (migration.REPLACED_INDEXES, migration.INDEXES)
+        )
+        for name, table, _ in removed:
+            connection.execute(text(f"DROP INDEX IF EXISTS {name}"))
+        for name, table, columns in added:
+            connection.execute(
+                text(
+                    f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"
+                )
+            )
+        connection.execute(text("ANALYZE"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--host", default="localhost:5432")
+    parser.add_argument("--user", default="postgres")
+    parser.add_argument("--password", default="postgres")
+    parser.add_argument("--dbname", default="dassie_query_plans")
+    parser.add_argument("--articles", type=int, default=5000)
+    parser.add_argument("--themes", type=int, default=1000)
+    parser.add_argument("--browses", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    migration = load_migration()
+    engine = create_database(args)
+    articles, themes, browses = seed(engine, args)
+    # the engine the repositories share, whose statements are captured
+    repository_engine = get_engine(
+        f"postgresql://{args.user}:{args.password}@{args.host}/{args.dbname}"
+    )
+    results = {}
+    for present in (False, True):
+        set_indexes(engine, migration, present)
+        for name, call in cases(args, articles, themes, browses).items():
+            statements = capture(repository_engine, call)
+            results.setdefault(name, []).append(
+                explain(engine, statements, args.repeat)
+            )
+
+    for name, ((before_ms, before_scans), (after_ms, after_scans)) in results.items():
+        print(f"{name}\n  before {before_ms:9.2f} ms  {', '.join(before_scans)}")
+        print(f"  after  {after_ms:9.2f} ms  {', '.join(after_scans)}")
+
+
+if __name__ == "__main__":
+    main()
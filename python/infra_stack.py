@@ -124,7 +124,8 @@ class InfraStack(Stack):
             ),
             billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
             time_to_live_attribute="ttl",
-            stream=dynamodb.StreamViewType.OLD_IMAGE,  # Enable DynamoDB Streams
+            # new images for build_articles_stream, old ones for archive_navlog
+            stream=dynamodb.StreamViewType.NEW_AND_OLD_IMAGES,
         )
         ddb.add_global_secondary_index(
             partition_key=dynamodb.Attribute(
@@ -1,7 +1,12 @@
 from datetime import datetime, timedelta
-from sqlalchemy.orm.strategy_options import joinedload
+from sqlalchemy.orm.strategy_options import (
+    defer,
+    joinedload,
+    undefer,
+    with_expression,
+)
 from sqlalchemy import func
-from contextlib import closing
+from sqlalchemy.dialects.postgresql import insert
 from typing import List
 from models.models import Association, Browsed
 from models.theme import Theme
@@ -12,26 +17,32 @@ from uuid import UUID as PyUUID
 
 
 class ArticleRepository(BasePostgresRepository):
-    def __init__(self, username, password, dbname, db_cluster_endpoint):
-        super().__init__(username, password, dbname, db_cluster_endpoint)
+    def __init__(
+        self, username, password, dbname, db_cluster_endpoint, engine_options=None
+    ):
+        super().__init__(
+            username, password, dbname, db_cluster_endpoint, engine_options
+        )
         self.model = Article
 
     def get_by_id(self, id: str):
-        with closing(self._session()) as session:
+        with self._session_scope() as session:
             return (
                 session.query(self.model)
                 .options(
                     joinedload(self.model._themes),
+                    undefer(self.model._text),
+                    undefer(self.model._embedding),
                 )
                 .filter(self.model._id == PyUUID(id))
                 .one()
             )
 
     def get_by_url(self, url):
-        with closing(self._session()) as session:
+        with self._session_scope() as session:
             articles = (
                 session.query(self.model)
-                .options(joinedload(self.model._themes))
+                .options(joinedload(self.model._themes), undefer(self.model._text))
                 .filter_by(_url=url)
                 .all()
             )
@@ -39,25 +50,48 @@ class ArticleRepository(BasePostgresRepository):
                 detached = session.merge(articles[0])
                 return detached
 
+    def get_texts(self, ids):
+        """Texts of the articles with the ids, by id, for articles loaded with their text deferred."""
+        with self._session_scope() as session:
+            rows = (
+                session.query(self.model._id, self.model._text)
+                .filter(self.model._id.in_(ids))
+                .all()
+            )
+            return {id: text for id, text in rows}
+
     def get_or_insert(self, model):
         existing = self.get_by_url(model.url)
         if existing is not None:
             return existing
-        with closing(self._session()) as session:
+        with self._session_scope() as session:
             session.add(model)
-            session.commit()
+            self._commit(session)
             detached = session.merge(model)
             return detached
 
+    def upsert_by_url(self, model):
+        """Inserts the article unless one with its url exists, returning the stored row either way."""
+        with self._session_scope() as session:
+            statement = insert(self.model).values(**self._column_values(model))
+            statement = statement.on_conflict_do_update(
+                index_elements=[self.model._url],
+                # no-op update so that RETURNING yields the existing row
+                set_={"_url": statement.excluded._url},
+            )
+            return self._upsert(session, statement.options(undefer(self.model._text)))
+
     def enhance(self, article: Article, themes: List[Theme], embedding: List[float]):
-        with closing(self._session()) as session:
+        with self._session_scope() as session:
             for theme in themes:
                 association = Association(article.id, theme._id)
                 session.add(association)
-                session.commit()
+                self._commit(session)
             article.embedding = embedding
             detached = session.merge(article)
-            session.commit()
+            session.flush()
+            self._refresh_theme_stats(session, [theme._id for theme in themes])
+            self._commit(session)
             return detached
 
     def get(
@@ -71,57 +105,120 @@ class ArticleRepository(BasePostgresRepository):
         threshold: float = 0.8,
         days: int = None,
         min_token_count: int = 75,
+        ef_search: int = BasePostgresRepository.EF_SEARCH,
+        two_phase: bool = False,
+        projection: bool = False,
+        snippet_length: int = 0,
+        cursor: str = None,
+        include_sort_key: bool = False,
     ):
-        with closing(self._session()) as session:
-            query = session.query(self.model)
-            query = (
-                session.query(
-                    self.model, 1 - Article._embedding.cosine_distance(filter_embedding)
+        """
+        With two_phase the embedding search takes the nearest candidates from the vector index first and
+        applies the threshold and other filters to those, approximate but without a full scan.
+        With projection the text and embeddings of articles and their themes are not loaded, for list views
+        serialised with json(include_text=False); snippet_length > 0 loads that many leading characters of text.
+        cursor and include_sort_key are used by get_page for keyset pagination.
+        """
+        with self._session_scope() as session:
+
+            def run_query(candidates=None):
+                query = session.query(self.model)
+                query = (
+                    session.query(
+                        self.model,
+                        1 - Article._embedding.cosine_distance(filter_embedding),
+                    )
+                    if include_score_in_results
+                    else query
                 )
-                if include_score_in_results
-                else query
-            )
-            query = (
-                query.where(
-                    (1 - Article._embedding.cosine_distance(filter_embedding))
-                    > threshold
+                query = (
+                    query.where(
+                        Article._embedding.cosine_distance(filter_embedding)
+                        < 1 - threshold
+                    )
+                    if filter_embedding is not None
+                    else query
                 )
-                if filter_embedding is not None
-                else query
-            )
-            query = (
-                query.where(Article._created_at > datetime.now() - timedelta(days=days))
-                if days is not None
-                else query
-            )
-            if type is not None:
-                query = query.where(Article._type.in_(type))
-            if min_token_count > 0:
-                query = query.where(Article._token_count >= min_token_count)
-            if sort_by is None:
-                sort_by = "logged_at"
-                if filter_embedding is not None:
-                    sort_by = "embedding"
-            query = self._append_sort_by(query, sort_by, descending, filter_embedding)
-            query = query.options(joinedload(self.model._themes))
-            logger.debug("embedding query", extra={"query": query})
-            return query.limit(limit).all()
+                if candidates is not None:
+                    query = query.where(Article._id.in_(candidates))
+                query = (
+                    query.where(
+                        Article._created_at > datetime.now() - timedelta(days=days)
+                    )
+                    if days is not None
+                    else query
+                )
+                if type is not None:
+                    query = query.where(Article._type.in_(type))
+                if min_token_count > 0:
+                    query = query.where(Article._token_count >= min_token_count)
+                query = self._append_sort_by(
+                    query,
+                    sort_by
+                    or ("logged_at" if filter_embedding is None else "embedding"),
+                    descending,
+                    filter_embedding,
+                    cursor,
+                    include_sort_key,
+                )
+                if projection:
+                    query = query.options(
+                        defer(Article._text),
+                        defer(Article._embedding),
+                        joinedload(self.model._themes).defer(Theme._embedding),
+                    )
+                    if snippet_length > 0:
+                        query = query.options(
+                            with_expression(
+                                Article._snippet,
+                                func.left(Article._text, snippet_length),
+                            )
+                        )
+                else:
+                    query = query.options(
+                        joinedload(self.model._themes),
+                        undefer(Article._text),
+                        undefer(Article._embedding),
+                    )
+                logger.debug("embedding query", extra={"query": query})
+                return query.limit(limit).all()
 
-    def _append_sort_by(self, query, sort_by, descending, filter_embedding=None):
+            if filter_embedding is None:
+                return run_query()
+            if two_phase:
+                return self._two_phase_search(
+                    session, run_query, filter_embedding, limit, ef_search
+                )
+            self._set_ef_search(session, ef_search)
+            return run_query()
+
+    def _append_sort_by(
+        self,
+        query,
+        sort_by,
+        descending,
+        filter_embedding=None,
+        cursor=None,
+        include_sort_key=False,
+    ):
+        aggregate = False
+        ascending = not descending
         if sort_by == "browse":
             query = query.join(Browsed).group_by(self.model._id)
-            order_by_func = func.count(Browsed._browse_id)
+            sort_key = func.count(Browsed._browse_id)
+            aggregate = True
         elif sort_by == "embedding":
-            order_by_func = 1 - Article._embedding.cosine_distance(filter_embedding)
+            # order on the raw distance, ascending, so the hnsw index can serve it
+            sort_key = Article._embedding.cosine_distance(filter_embedding)
+            ascending = descending
         else:
             try:
-                order_by_func = self.model.__dict__["_" + sort_by]
+                sort_key = self.model.__dict__["_" + sort_by]
             except KeyError:
-                order_by_func = self.model.__dict__["_logged_at"]
-        query = query.order_by(
-            order_by_func.desc() if descending else order_by_func.asc()
+                sort_key = self.model.__dict__["_logged_at"]
+        return self._order_by_keyset(
+            query, sort_key, ascending, cursor, aggregate, include_sort_key
         )
-        return query
 
     def get_last_7days(self):
         return self.get(days=7)
@@ -1,19 +1,24 @@
-from contextlib import closing
 from datetime import datetime, timedelta
 from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import joinedload
 from models.models import Browsed
+from models.article import Article
 from models.browse import Browse
 from repos import BasePostgresRepository
 
 
 class BrowseRepository(BasePostgresRepository):
-    def __init__(self, username, password, dbname, db_cluster_endpoint):
-        super().__init__(username, password, dbname, db_cluster_endpoint)
+    def __init__(
+        self, username, password, dbname, db_cluster_endpoint, engine_options=None
+    ):
+        super().__init__(
+            username, password, dbname, db_cluster_endpoint, engine_options
+        )
         self.model = Browse
 
     def get_by_tab_id(self, tab_id):
-        with closing(self._session()) as session:
+        with self._session_scope() as session:
             return (
                 session.query(self.model)
                 .options(joinedload(Browse._articles))
@@ -22,7 +27,7 @@ class BrowseRepository(BasePostgresRepository):
             )
 
     def get_recently_browsed(self, limit: int = 10, days=7, hours=0):
-        with closing(self._session()) as session:
+        with self._session_scope() as session:
             cut_off_date = datetime.now() - timedelta(days=days, hours=hours)
             subquery = (
                 session.query(
@@ -35,7 +40,11 @@ class BrowseRepository(BasePostgresRepository):
             return (
                 session.query(self.model)
                 .join(subquery, self.model._id == subquery.c._browse_id)
-                .options(joinedload(Browse._articles))
+                # themes are built from the text and embeddings of browsed articles
+                .options(
+                    joinedload(Browse._articles).undefer(Article._text),
+                    joinedload(Browse._articles).undefer(Article._embedding),
+                )
                 .limit(limit)
                 .all()
             )
@@ -46,3 +55,24 @@ class BrowseRepository(BasePostgresRepository):
             return self.add(model)
         else:
             return existing
+
+    def upsert_by_tab_id(self, model):
+        """
+        Inserts the browse unless one with its tab id exists, in which case a missing title or
+        logged_at is filled in from the model. Returns the stored row.
+        """
+        with self._session_scope() as session:
+            statement = insert(self.model).values(**self._column_values(model))
+            statement = statement.on_conflict_do_update(
+                index_elements=[self.model._tab_id],
+                set_={
+                    "_title": func.coalesce(
+                        self.model._title, statement.excluded._title
+                    ),
+                    "_logged_at": func.coalesce(
+                        self.model._logged_at, statement.excluded._logged_at
+                    ),
+                    "_updated_at": datetime.now(),
+                },
+            )
+            return self._upsert(session, statement)
@@ -1,13 +1,47 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import datetime, timedelta
 import json
+import os
+import time
 from lambda_init_context import LambdaInitContext
 from aws_lambda_powertools.logging import correlation_paths
 from dassie_logger import logger
 from services.articles_service import ArticlesService
+from services.ingestion_pipeline import IngestionPipeline
 from services.opencypher_translator import OpenCypherTranslatorClient
+from services.sweep_checkpoint import SweepCheckpoint
 
 init_context = None
 articles_service = None
+pipeline = None
+checkpoint = None
+# navlogs processed in parallel, each worker blocks on LLM, Postgres and Neptune calls
+MAX_CONCURRENT_NAVLOGS = int(os.getenv("BUILD_ARTICLES_CONCURRENCY", "4"))
+# no further page is read with less time left, its key is saved for the next run to resume from
+MIN_REMAINING_TIME_MS = 60000
+CHECKPOINT_PARAMETER_VARIABLE = "BUILD_ARTICLES_CHECKPOINT_PARAMETER"
+
+
+def _process_navlog(navlog):
+    logger.debug("processing navlog", extra={"navlog": navlog})
+    articles_service.process_navlog(navlog)
+    init_context.navlog_service.delete_navlog(navlog["id"])
+
+
+def _collect(done, futures):
+    """Removes the done futures, returning the number that failed."""
+    errors = 0
+    for future in done:
+        navlog = futures.pop(future)
+        try:
+            future.result()
+        except Exception as error:
+            logger.exception(
+                "Error processing navlog",
+                extra={"error": str(error), "navlog_id": navlog.get("id")},
+            )
+            errors += 1
+    return errors
 
 
 @logger.inject_lambda_context(
@@ -24,11 +58,16 @@ def lambda_handler(
     openai_client=None,
     neptune_client=None,
     opencypher_translator_client=OpenCypherTranslatorClient(),
+    max_workers=MAX_CONCURRENT_NAVLOGS,
+    ingestion_pipeline=None,
+    sweep_checkpoint=None,
     useGlobal=True,
 ):
     logger.debug("build_articles")
     global init_context
     global articles_service
+    global pipeline
+    global checkpoint
     if init_context is None or not useGlobal:
         init_context = LambdaInitContext(
             navlog_service=navlog_service,
@@ -49,33 +88,95 @@ def lambda_handler(
             init_context.neptune_client,
             opencypher_translator_client,
         )
+    # with the ingestion queues configured navlogs are queued for the pipeline stages
+    if pipeline is None or not useGlobal:
+        pipeline = ingestion_pipeline or IngestionPipeline.from_init_context(
+            init_context, opencypher_translator_client
+        )
+    if checkpoint is None or not useGlobal:
+        checkpoint = sweep_checkpoint
+        if checkpoint is None and CHECKPOINT_PARAMETER_VARIABLE in os.environ:
+            checkpoint = SweepCheckpoint(os.environ[CHECKPOINT_PARAMETER_VARIABLE])
 
     try:
-        navlogs = init_context.navlog_service.get_content_navlogs()
+        started = time.monotonic()
+        start_key = event.get("startKey")
+        if start_key is None and checkpoint is not None:
+            start_key = checkpoint.load()
+        # pages are processed as they arrive, resuming from where an interrupted run stopped,
+        # the query applies the rules of ArticlesService.should_skip too, and leaves out
+        # navlogs the pipeline still has queued
+        pages = init_context.navlog_service.iter_content_navlog_pages(
+            created_after=datetime.now()
+            - timedelta(days=ArticlesService.MAX_NAVLOG_AGE_DAYS),
+            min_body_length=ArticlesService.MIN_BODY_LENGTH,
+            with_url=True,
+            attributes=init_context.navlog_service.CONTENT_NAVLOG_ATTRIBUTES,
+            start_key=start_key,
+            enqueued_before=(
+                None
+                if pipeline is None
+                else datetime.now()
+                - timedelta(hours=IngestionPipeline.REQUEUE_AFTER_HOURS)
+            ),
+        )
+        next_key = None
         count = 0
         skipped = 0
         errors = 0
-        for navlog in navlogs:
-            try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {}
+            for navlog_page, last_key in pages:
+                if pipeline is not None:
+                    navlog_ids = [
+                        navlog["id"]
+                        for navlog in navlog_page
+                        if not ArticlesService.should_skip(navlog)
+                    ]
+                    pipeline.enqueue_navlogs(navlog_ids)
+                    count += len(navlog_ids)
+                    skipped += len(navlog_page) - len(navlog_ids)
+                else:
+                    for navlog in navlog_page:
+                        try:
+                            if ArticlesService.should_skip(navlog):
+                                skipped += 1
+                                continue
+                            count += 1
+                            futures[executor.submit(_process_navlog, navlog)] = navlog
+                        except Exception as error:
+                            logger.exception(
+                                "Error processing navlog", extra={"error": str(error)}
+                            )
+                            errors += 1
+                        # bounds the navlogs held in memory to those queued for the workers
+                        if len(futures) >= max_workers * 2:
+                            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                            errors += _collect(done, futures)
                 if (
-                    len(navlog["body_text"]) < 100
-                    or "url" not in navlog
-                    or datetime.strptime(navlog["created_at"], "%Y-%m-%dT%H:%M:%S.%f")
-                    < datetime.now() - timedelta(days=2)
+                    last_key is not None
+                    and context.get_remaining_time_in_millis() < MIN_REMAINING_TIME_MS
                 ):
-                    skipped += 1
-                    continue
-                logger.debug("processing navlog", extra={"navlog": navlog})
-                count += 1
-                articles_service.process_navlog(navlog)
-                init_context.navlog_service.delete_navlog(navlog["id"])
-            except Exception as error:
-                logger.exception("Error processing navlog", extra={"error": str(error)})
-                errors += 1
+                    next_key = last_key
+                    break
+            errors += _collect(wait(futures).done, futures)
+        if checkpoint is not None:
+            # cleared once the last page was read, so the next sweep starts from the top
+            checkpoint.save(next_key)
+        duration = time.monotonic() - started
+        throughput = count / duration * 60 if duration > 0 else 0
 
         logger.info(
             "Processing complete",
-            extra={"processed": count, "skipped": skipped, "errors": errors},
+            extra={
+                "processed": count,
+                "skipped": skipped,
+                "errors": errors,
+                "max_workers": max_workers,
+                "duration_seconds": round(duration, 2),
+                "navlogs_per_minute": round(throughput, 2),
+                "next_key": next_key,
+            },
         )
         statusCode = 200
         if errors > 0:
@@ -92,6 +193,9 @@ def lambda_handler(
                     "processed": count,
                     "skipped": skipped,
                     "errors": errors,
+                    "duration_seconds": round(duration, 2),
+                    "navlogs_per_minute": round(throughput, 2),
+                    "nextKey": next_key,
                 }
             ),
         }
@@ -0,0 +1,111 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+from lambda_init_context import LambdaInitContext
+from dassie_logger import logger
+from services.articles_service import ArticlesService
+from services.ingestion_pipeline import IngestionPipeline
+from services.opencypher_translator import OpenCypherTranslatorClient
+
+init_context = None
+articles_service = None
+pipeline = None
+# same setting as build_articles, records of a batch are processed in parallel
+MAX_CONCURRENT_NAVLOGS = int(os.getenv("BUILD_ARTICLES_CONCURRENCY", "4"))
+
+
+def _process_record(record):
+    """Builds the article of an inserted navlog, returning False when the navlog is skipped."""
+    navlog = init_context.navlog_service.get_stream_navlog(record)
+    if (
+        navlog is None
+        or navlog.get("type") != "content"
+        or ArticlesService.should_skip(navlog)
+    ):
+        return False
+    if pipeline is not None:
+        pipeline.enqueue_navlogs([navlog["id"]])
+        return True
+    logger.debug("processing navlog", extra={"navlog_id": navlog["id"]})
+    articles_service.process_navlog(navlog)
+    init_context.navlog_service.delete_navlog(navlog["id"])
+    return True
+
+
+# navlog inserts from the table stream, in micro-batches, the hourly build_articles sweeps up the rest
+@logger.inject_lambda_context
+def lambda_handler(
+    event,
+    context,
+    navlog_service=None,
+    article_repo=None,
+    theme_repo=None,
+    browse_repo=None,
+    browsed_repo=None,
+    openai_client=None,
+    neptune_client=None,
+    opencypher_translator_client=OpenCypherTranslatorClient(),
+    max_workers=MAX_CONCURRENT_NAVLOGS,
+    ingestion_pipeline=None,
+    useGlobal=True,
+):
+    global init_context
+    global articles_service
+    global pipeline
+    if init_context is None or not useGlobal:
+        init_context = LambdaInitContext(
+            navlog_service=navlog_service,
+            article_repo=article_repo,
+            theme_repo=theme_repo,
+            browse_repo=browse_repo,
+            browsed_repo=browsed_repo,
+            openai_client=openai_client,
+            neptune_client=neptune_client,
+        )
+    if articles_service is None or not useGlobal:
+        articles_service = ArticlesService(
+            init_context.article_repo,
+            init_context.theme_repo,
+            init_context.browse_repo,
+            init_context.browsed_repo,
+            init_context.openai_client,
+            init_context.neptune_client,
+            opencypher_translator_client,
+        )
+    if pipeline is None or not useGlobal:
+        pipeline = ingestion_pipeline or IngestionPipeline.from_init_context(
+            init_context, opencypher_translator_client
+        )
+
+    records = [record for record in event["Records"] if record["eventName"] == "INSERT"]
+    processed = 0
+    failures = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(_process_record, record): record for record in records
+        }
+        for future, record in futures.items():
+            try:
+                processed += future.result()
+            except Exception as error:
+                logger.exception(
+                    "Error processing navlog",
+                    extra={
+                        "error": str(error),
+                        "navlog_id": record["dynamodb"]["Keys"]["id"]["S"],
+                    },
+                )
+                # the stream retries from the earliest failed record, later ones that succeeded are
+                # replayed but skipped, as their navlogs are read from the table after being deleted
+                failures.append(
+                    {"itemIdentifier": record["dynamodb"]["SequenceNumber"]}
+                )
+    logger.info(
+        "Stream batch complete",
+        extra={
+            "records": len(event["Records"]),
+            "processed": processed,
+            "skipped": len(records) - processed - len(failures),
+            "errors": len(failures),
+        },
+    )
+    return {"batchItemFailures": failures}
@@ -100,6 +100,9 @@ def lambda_handler(
                 logger.exception("Error processing browse", extra={"error": str(e)})
                 errors_browses += 1
 
+        # recent browse counts age out without writes to the themes
+        init_context.theme_service.theme_repo.refresh_stats()
+
         logger.info(
             "Processing complete",
             extra={
@@ -0,0 +1,33 @@
+from contextlib import closing, contextmanager
+from models.models import CachedCompletion
+from repos import BasePostgresRepository
+
+
+class CompletionCacheRepository(BasePostgresRepository):
+    def __init__(
+        self, username, password, dbname, db_cluster_endpoint, engine_options=None
+    ):
+        super().__init__(
+            username, password, dbname, db_cluster_endpoint, engine_options
+        )
+        self.model = CachedCompletion
+
+    @contextmanager
+    def _session_scope(self):
+        # cache reads and writes are independent of any surrounding unit of work
+        with closing(self._session()) as session:
+            yield session
+
+    def get_by_key(self, key):
+        with self._session_scope() as session:
+            return session.query(self.model).filter_by(_key=key).first()
+
+    def put(self, key, model, result, expires_at):
+        with self._session_scope() as session:
+            session.merge(CachedCompletion(key, model, result, expires_at))
+            self._commit(session)
+
+    def delete(self, key):
+        with self._session_scope() as session:
+            session.query(self.model).filter_by(_key=key).delete()
+            self._commit(session)
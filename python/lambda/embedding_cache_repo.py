@@ -0,0 +1,28 @@
+from contextlib import closing, contextmanager
+from models.models import CachedEmbedding
+from repos import BasePostgresRepository
+
+
+class EmbeddingCacheRepository(BasePostgresRepository):
+    def __init__(
+        self, username, password, dbname, db_cluster_endpoint, engine_options=None
+    ):
+        super().__init__(
+            username, password, dbname, db_cluster_endpoint, engine_options
+        )
+        self.model = CachedEmbedding
+
+    @contextmanager
+    def _session_scope(self):
+        # cache reads and writes are independent of any surrounding unit of work
+        with closing(self._session()) as session:
+            yield session
+
+    def get_by_key(self, key):
+        with self._session_scope() as session:
+            return session.query(self.model).filter_by(_key=key).first()
+
+    def put(self, key, model, embedding):
+        with self._session_scope() as session:
+            session.merge(CachedEmbedding(key, model, embedding))
+            self._commit(session)
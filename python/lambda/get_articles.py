@@ -11,6 +11,8 @@ VALID_SORT_FIELDS = [
     "count_association",
     "browse",
 ]
+# the cursor of the next page is returned in a header so the body stays a plain array
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
 init_context = None
 
 
@@ -28,7 +30,13 @@ def lambda_handler(
         )
     openai_client = init_context.openai_client
     article_repo = init_context.article_repo
-    response = {"statusCode": 200, "headers": {"Access-Control-Allow-Origin": "*"}}
+    response = {
+        "statusCode": 200,
+        "headers": {
+            "Access-Control-Allow-Origin": "*",
+            "Access-Control-Expose-Headers": NEXT_CURSOR_HEADER,
+        },
+    }
     try:
         sort_field = "updated_at"
         max = 10
@@ -49,6 +57,8 @@ def lambda_handler(
         )
         filter = params["filter"] if "filter" in params else filter
         max = int(params["max"]) if "max" in params else max
+        snippet = int(params["snippet"]) if "snippet" in params else 0
+        cursor = params["cursor"] if "cursor" in params else None
         if sort_order not in VALID_SORT_ORDERS:
             raise ValueError("Invalid sort order")
         if sort_field not in VALID_SORT_FIELDS:
@@ -65,18 +75,23 @@ def lambda_handler(
                 response["statusCode"] = 404
             return response
         if filter is not None and filter != "":
-            filter_embedding = openai_client.get_embedding(filter)
+            filter_embedding = openai_client.get_query_embedding(filter)
             logger.debug("filter by embedding", extra={"filter": filter})
-        result = article_repo.get(
-            limit=max,
+        result, next_cursor = article_repo.get_page(
+            max,
+            cursor=cursor,
             sort_by=sort_field,
             descending=sort_order == "desc",
             filter_embedding=filter_embedding,
             min_token_count=0,
+            projection=True,
+            snippet_length=snippet,
         )
         response["body"] = "[{}]".format(
-            ",".join([article.json() for article in result])
+            ",".join([article.json(include_text=False) for article in result])
         )
+        if next_cursor is not None:
+            response["headers"][NEXT_CURSOR_HEADER] = next_cursor
     except ValueError as error:
         logger.exception("ValueError")
         response["body"] = {"message": str(error)}
@@ -1,3 +1,4 @@
+import json
 from lambda_init_context import LambdaInitContext
 from dassie_logger import logger
 from aws_lambda_powertools.logging import correlation_paths
@@ -12,6 +13,7 @@ VALID_SORT_FIELDS = [
     "browse",
     "recently_browsed",
 ]
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
 init_context = None
 
 
@@ -25,7 +27,13 @@ def lambda_handler(event, context, theme_repo=None, openai_client=None, useGloba
         )
     theme_repo = init_context.theme_repo
     openai_client = init_context.openai_client
-    response = {"statusCode": 200, "headers": {"Access-Control-Allow-Origin": "*"}}
+    response = {
+        "statusCode": 200,
+        "headers": {
+            "Access-Control-Allow-Origin": "*",
+            "Access-Control-Expose-Headers": NEXT_CURSOR_HEADER,
+        },
+    }
     try:
         sort_field = "updated_at"
         max = 10
@@ -48,6 +56,7 @@ def lambda_handler(event, context, theme_repo=None, openai_client=None, useGloba
         )
         result = []
         max = int(params["max"]) if "max" in params else 10
+        cursor = params["cursor"] if "cursor" in params else None
         title = event["path"].split("/")[-1]
         response["body"] = None
         if title != "themes":
@@ -65,15 +74,33 @@ def lambda_handler(event, context, theme_repo=None, openai_client=None, useGloba
         if sort_field == "recently_browsed":
             recent_browsed_days = 14
         if filter != "":
-            filter_embedding = openai_client.get_embedding(filter)
-        result = theme_repo.get(
+            filter_embedding = openai_client.get_query_embedding(filter)
+        result, next_cursor = theme_repo.get_page(
             max,
-            source,
+            cursor=cursor,
+            source=source,
             filter_embedding=filter_embedding,
             sort_by=sort_field,
             recent_browsed_days=recent_browsed_days,
+            with_stats=True,
         )
-        response["body"] = "[{}]".format(",".join([theme.json() for theme in result]))
+        response["body"] = json.dumps(
+            [
+                {
+                    **theme.json(dump=False),
+                    "association_count": association_count,
+                    "last_associated_at": (
+                        last_associated_at.isoformat()
+                        if last_associated_at is not None
+                        else ""
+                    ),
+                    "score": score,
+                }
+                for theme, association_count, last_associated_at, score in result
+            ]
+        )
+        if next_cursor is not None:
+            response["headers"][NEXT_CURSOR_HEADER] = next_cursor
     except ValueError as error:
         logger.error("ValueError: {}".format(error), extra={"error": error})
         response["statusCode"] = 400
@@ -0,0 +1,25 @@
+import os
+from dassie_logger import logger
+from lambda_init_context import LambdaInitContext
+from services.ingestion_pipeline import IngestionPipeline
+from services.opencypher_translator import OpenCypherTranslatorClient
+
+STAGE_VARIABLE = "INGESTION_STAGE"
+pipeline = None
+
+
+# Processes queued messages of the ingestion stage named by INGESTION_STAGE, one function per stage.
+@logger.inject_lambda_context(log_event=True)
+def lambda_handler(
+    event,
+    context,
+    ingestion_pipeline=None,
+    opencypher_translator_client=OpenCypherTranslatorClient(),
+    useGlobal=True,
+):
+    global pipeline
+    if pipeline is None or not useGlobal:
+        pipeline = ingestion_pipeline or IngestionPipeline.from_init_context(
+            LambdaInitContext(), opencypher_translator_client
+        )
+    return pipeline.handle(os.environ[STAGE_VARIABLE], event)
@@ -1,6 +1,12 @@
 from repos import BrowsedRepository
 from browse_repo import BrowseRepository
 from article_repo import ArticleRepository
+from completion_cache_repo import CompletionCacheRepository
+from datetime import timedelta
+from embedding_cache_repo import EmbeddingCacheRepository
+from services.completion_cache import CompletionCache
+from services.embedding_backends import LocalEmbeddingBackend
+from services.embedding_cache import EmbeddingCache
 from services.navlogs_service import NavlogService
 from services.openai_client import OpenAIClient
 from services.themes_service import ThemesService
@@ -17,6 +23,14 @@ class LambdaInitContext:
     OPENAI_SECRET_KEY = "OPENAI_API_KEY"
     LANGFUSE_SECRET_KEY = "langfuse_secret_key"
     DB_NAME = "dassie"
+    # variable -> (engine option, parser), overriding repos.DEFAULT_ENGINE_OPTIONS when set
+    DB_ENGINE_VARIABLES = {
+        "DB_POOL_SIZE": ("pool_size", int),
+        "DB_MAX_OVERFLOW": ("max_overflow", int),
+        "DB_POOL_TIMEOUT": ("pool_timeout", int),
+        "DB_POOL_RECYCLE": ("pool_recycle", int),
+        "DB_POOL_PRE_PING": ("pool_pre_ping", lambda value: value.lower() == "true"),
+    }
 
     def __init__(
         self,
@@ -34,6 +48,10 @@ class LambdaInitContext:
         lang_fuse_secret=None,
         langfuse_enabled=True,
         browsed_repo=None,
+        db_engine_options=None,
+        embedding_cache=None,
+        completion_cache=None,
+        query_embedding_backend=None,
         release="dev",
     ):
         logger.info("init lambda context ", extra={"release": release})
@@ -45,6 +63,10 @@ class LambdaInitContext:
         self._theme_service = theme_service
         self._browse_repo = browse_repo
         self._browsed_repo = browsed_repo
+        self._db_engine_options = db_engine_options
+        self._embedding_cache = embedding_cache
+        self._completion_cache = completion_cache
+        self._query_embedding_backend = query_embedding_backend
         self._navlog_service = navlog_service
         self._boto_event_client = boto_event_client
         self._neptune_client = neptune_client
@@ -89,6 +111,7 @@ class LambdaInitContext:
             self._browsed_repo = BrowsedRepository(
                 *self.db_secrets,
                 os.getenv("DB_CLUSTER_ENDPOINT"),
+                engine_options=self.db_engine_options,
             )
         logger.debug("retrieved browsed repo")
         return self._browsed_repo
@@ -100,6 +123,7 @@ class LambdaInitContext:
             self._browse_repo = BrowseRepository(
                 *self.db_secrets,
                 os.getenv("DB_CLUSTER_ENDPOINT"),
+                engine_options=self.db_engine_options,
             )
         logger.debug("retrieved browse repo")
         return self._browse_repo
@@ -126,6 +150,18 @@ class LambdaInitContext:
         logger.debug("retrieved db secrets")
         return self._db_secrets
 
+    @property
+    def db_engine_options(self) -> dict:
+        # only the overrides, get_engine merges them over its defaults
+        if self._db_engine_options is None:
+            self._db_engine_options = {
+                option: parse(os.environ[variable])
+                for variable, (option, parse) in self.DB_ENGINE_VARIABLES.items()
+                if variable in os.environ
+            }
+            logger.info("init db engine options", extra=self._db_engine_options)
+        return self._db_engine_options
+
     @property
     def article_repo(self) -> ArticleRepository:
         if self._article_repo is None:
@@ -133,6 +169,7 @@ class LambdaInitContext:
             self._article_repo = ArticleRepository(
                 *self.db_secrets,
                 os.environ["DB_CLUSTER_ENDPOINT"],
+                engine_options=self.db_engine_options,
             )
         logger.debug("retrieved article repo")
         return self._article_repo
@@ -174,10 +211,74 @@ class LambdaInitContext:
                     "langfuse_secret_arn": os.environ["LANGFUSE_SECRET_ARN"],
                 },
             )
-            self._openai_client = OpenAIClient(self.openai_secret)
+            self._openai_client = OpenAIClient(
+                self.openai_secret,
+                embedding_cache=self.embedding_cache,
+                completion_cache=self.completion_cache,
+                query_embedding_backend=self.query_embedding_backend,
+            )
         logger.debug("retrieved openai client")
         return self._openai_client
 
+    @property
+    def embedding_cache(self) -> EmbeddingCache:
+        if self._embedding_cache is None:
+            logger.info("init embedding cache")
+            repo = None
+            # without a database the cache is in-memory only
+            if "DB_CLUSTER_ENDPOINT" in os.environ:
+                repo = EmbeddingCacheRepository(
+                    *self.db_secrets,
+                    os.environ["DB_CLUSTER_ENDPOINT"],
+                    engine_options=self.db_engine_options,
+                )
+            self._embedding_cache = EmbeddingCache(repo)
+        logger.debug("retrieved embedding cache")
+        return self._embedding_cache
+
+    @property
+    def completion_cache(self) -> CompletionCache:
+        # opt-in, enabled by setting a ttl in seconds
+        if self._completion_cache is None and "COMPLETION_CACHE_TTL" in os.environ:
+            logger.info(
+                "init completion cache",
+                extra={"ttl": os.environ["COMPLETION_CACHE_TTL"]},
+            )
+            repo = None
+            if "DB_CLUSTER_ENDPOINT" in os.environ:
+                repo = CompletionCacheRepository(
+                    *self.db_secrets,
+                    os.environ["DB_CLUSTER_ENDPOINT"],
+                    engine_options=self.db_engine_options,
+                )
+            self._completion_cache = CompletionCache(
+                repo, ttl=timedelta(seconds=int(os.environ["COMPLETION_CACHE_TTL"]))
+            )
+        return self._completion_cache
+
+    @property
+    def query_embedding_backend(self) -> LocalEmbeddingBackend:
+        # opt-in, enabled by the path of a projection fitted to the stored embeddings
+        if (
+            self._query_embedding_backend is None
+            and "LOCAL_EMBEDDING_PROJECTION" in os.environ
+        ):
+            try:
+                self._query_embedding_backend = (
+                    LocalEmbeddingBackend.from_projection_file(
+                        os.environ["LOCAL_EMBEDDING_PROJECTION"],
+                        os.getenv("LOCAL_EMBEDDING_MODEL", LocalEmbeddingBackend.MODEL),
+                        cache_dir=os.getenv("LOCAL_EMBEDDING_CACHE_DIR"),
+                    )
+                )
+            except Exception:
+                # fastembed, the model or the projection is missing, queries are embedded by OpenAI
+                logger.exception(
+                    "Error building local embedding backend",
+                    extra={"projection": os.environ["LOCAL_EMBEDDING_PROJECTION"]},
+                )
+        return self._query_embedding_backend
+
     @property
     def theme_repo(self) -> ThemeRepository:
         if self._theme_repo is None:
@@ -185,6 +286,7 @@ class LambdaInitContext:
             self._theme_repo = ThemeRepository(
                 *self.db_secrets,
                 os.environ["DB_CLUSTER_ENDPOINT"],
+                engine_options=self.db_engine_options,
             )
         logger.debug("retrieved theme repo")
         return self._theme_repo
@@ -1,11 +1,13 @@
 from datetime import datetime
 import enum
+import hashlib
 import json
 from urllib.parse import quote_plus, unquote_plus
 import uuid
-from sqlalchemy import UUID, Column, DateTime, Enum, Integer, String
+from sqlalchemy import UUID, Column, DateTime, Enum, Index, Integer, String
 from pgvector.sqlalchemy import Vector
-from sqlalchemy.orm import relationship
+from sqlalchemy import inspect
+from sqlalchemy.orm import deferred, query_expression, relationship
 from models.models import Base
 
 
@@ -16,20 +18,35 @@ class ArticleType(enum.Enum):
 
 class Article(Base):
     __tablename__ = "article"
+    __table_args__ = (
+        Index(
+            "ix_article__embedding_hnsw",
+            "_embedding",
+            postgresql_using="hnsw",
+            postgresql_with={"m": 16, "ef_construction": 64},
+            postgresql_ops={"_embedding": "vector_cosine_ops"},
+        ),
+        # default sort of article lists, with the keyset tie breaker
+        Index("ix_article__updated_at_id", "_updated_at", "_id"),
+    )
     _id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     _title = Column(String)
     _type = Column(Enum(ArticleType), default=ArticleType.ARTICLE)
     _summary = Column(String)
     _created_at = Column(DateTime, default=datetime.now())
     _logged_at = Column(DateTime, index=True)
-    _url = Column(String(2000))
+    _url = Column(String(2000), index=True, unique=True)
     _token_count = Column(Integer)
-    _text = Column(String)
+    # page text and embedding are large, loaded only by queries that undefer them
+    _text = deferred(Column(String))
     _themes = relationship("Theme", secondary="association", back_populates="_related")
     _browses = relationship("Browse", secondary="browsed", back_populates="_articles")
-    _embedding = Column(Vector(1536))
+    _embedding = deferred(Column(Vector(1536)))
     _image = Column(String)
     _source_navlog = Column(String)
+    _fingerprint = Column(String(64))
+    # leading characters of _text, only populated by queries that ask for it
+    _snippet = query_expression()
 
     def __init__(
         self,
@@ -51,7 +68,14 @@ class Article(Base):
             else ArticleType.SEARCH_RESULT
         )
 
-    def json(self, dump=True) -> str:
+    @staticmethod
+    def text_fingerprint(text):
+        """sha256 of the whitespace normalized text, None when there is no text."""
+        if text is None:
+            return None
+        return hashlib.sha256(" ".join(text.split()).encode("utf-8")).hexdigest()
+
+    def json(self, dump=True, include_text=True) -> str:
         json_obj = {
             "id": str(self._id),
             "title": self._title,
@@ -67,12 +91,15 @@ class Article(Base):
             "updated_at": (
                 "" if self._updated_at is None else self._updated_at.isoformat()
             ),
-            "text": self._text,
             "source": self._source_navlog,
             "image": self._image,
             "themes": [theme.json(dump=False) for theme in self._themes],
             "token_count": self._token_count,
         }
+        if include_text and "_text" not in inspect(self).unloaded:
+            json_obj["text"] = self._text
+        if self._snippet is not None:
+            json_obj["snippet"] = self._snippet
         return json.dumps(json_obj) if dump else json_obj
 
     @property
@@ -151,6 +178,18 @@ class Article(Base):
     def text(self, value):
         self._text = value
 
+    @property
+    def snippet(self):
+        return self._snippet
+
+    @property
+    def fingerprint(self):
+        return self._fingerprint
+
+    @fingerprint.setter
+    def fingerprint(self, value):
+        self._fingerprint = value
+
     @property
     def logged_at(self):
         return self._logged_at
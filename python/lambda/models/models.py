@@ -2,9 +2,20 @@ from datetime import datetime
 import json
 import uuid
 from sqlalchemy.orm import declarative_base, Session
-from sqlalchemy import Column, ForeignKey, Integer, DateTime, event
+from sqlalchemy import (
+    Column,
+    ForeignKey,
+    Float,
+    Index,
+    Integer,
+    DateTime,
+    JSON,
+    String,
+    event,
+)
 from sqlalchemy.orm import Session
 from sqlalchemy.dialects.postgresql import UUID
+from pgvector.sqlalchemy import Vector
 
 
 class CustomBase:
@@ -37,6 +48,11 @@ class JsonFunctionEncoder(json.JSONEncoder):
 
 class Browsed(Base):
     __tablename__ = "browsed"
+    __table_args__ = (
+        # recently browsed articles are read from the index alone
+        Index("ix_browsed__logged_at_article_id", "_logged_at", "_article_id"),
+        Index("ix_browsed__browse_id", "_browse_id"),
+    )
     _article_id = Column(
         UUID(as_uuid=True), ForeignKey("article._id"), primary_key=True
     )
@@ -49,7 +65,7 @@ class Browsed(Base):
     _count = Column(Integer, default=1)
     _time = Column(Integer, default=0)
     _created_at = Column(DateTime, default=datetime.now())
-    _logged_at = Column(DateTime, index=True)
+    _logged_at = Column(DateTime)
 
     def __init__(self, article_id, browse_id, logged_at):
         self.article_id = article_id
@@ -99,6 +115,10 @@ class Browsed(Base):
 
 class Association(Base):
     __tablename__ = "association"
+    __table_args__ = (
+        Index("ix_association_theme_id_created_at", "theme_id", "created_at"),
+        Index("ix_association_created_at", "created_at"),
+    )
     article_id = Column(
         UUID(as_uuid=True),
         ForeignKey("article._id"),
@@ -116,8 +136,69 @@ class Association(Base):
         self.theme_id = theme_id
 
 
+class ThemeStats(Base):
+    """
+    Per theme aggregates of its associations, for sorting theme lists. Recomputed when associations are written
+    and by refresh_stats. The recent browse count and last association of recently browsed articles are advanced
+    in place as articles are browsed, but only refresh_stats, run hourly by build_themes, ages out articles whose
+    last browse left the window. Between runs they can include articles browsed up to that long before it.
+    """
+
+    __tablename__ = "theme_stats"
+    __table_args__ = (
+        Index("ix_theme_stats__association_count", "_association_count", "_theme_id"),
+        Index("ix_theme_stats__last_associated_at", "_last_associated_at", "_theme_id"),
+        Index(
+            "ix_theme_stats__recent_browse_count", "_recent_browse_count", "_theme_id"
+        ),
+        Index(
+            "ix_theme_stats__recent_last_associated_at",
+            "_recent_last_associated_at",
+            "_theme_id",
+        ),
+    )
+    # window of _recent_browse_count, the days get_themes uses for recently browsed themes
+    RECENT_BROWSE_DAYS = 14
+    _theme_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey("theme._id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    _association_count = Column(Integer, default=0)
+    _last_associated_at = Column(DateTime)
+    _recent_browse_count = Column(Integer, default=0)
+    # last association of a recently browsed article, the recently browsed sort
+    _recent_last_associated_at = Column(DateTime)
+    _avg_article_distance = Column(Float, default=0.0)
+
+    @property
+    def theme_id(self):
+        return self._theme_id
+
+    @property
+    def association_count(self):
+        return self._association_count
+
+    @property
+    def last_associated_at(self):
+        return self._last_associated_at
+
+    @property
+    def recent_browse_count(self):
+        return self._recent_browse_count
+
+    @property
+    def recent_last_associated_at(self):
+        return self._recent_last_associated_at
+
+    @property
+    def avg_article_distance(self):
+        return self._avg_article_distance
+
+
 class Recurrent(Base):
     __tablename__ = "recurrent"
+    __table_args__ = (Index("ix_recurrent_related_id", "related_id"),)
     theme_id = Column(
         UUID(as_uuid=True),
         ForeignKey("theme._id"),
@@ -139,6 +220,7 @@ class Recurrent(Base):
 
 class Sporadic(Base):
     __tablename__ = "sporadic"
+    __table_args__ = (Index("ix_sporadic_related_id", "related_id"),)
     theme_id = Column(
         UUID(as_uuid=True),
         ForeignKey("theme._id"),
@@ -154,3 +236,71 @@ class Sporadic(Base):
     def __init__(self, theme_id, related_id):
         self.theme_id = theme_id
         self.related_id = related_id
+
+
+class CachedEmbedding(Base):
+    __tablename__ = "cached_embedding"
+    _key = Column(String(64), primary_key=True)
+    _model = Column(String)
+    _embedding = Column(Vector(1536))
+    _created_at = Column(DateTime, default=datetime.now)
+
+    def __init__(self, key, model, embedding):
+        self._key = key
+        self._model = model
+        self._embedding = embedding
+
+    @property
+    def key(self):
+        return self._key
+
+    @property
+    def model(self):
+        return self._model
+
+    @property
+    def embedding(self):
+        return self._embedding
+
+    @embedding.setter
+    def embedding(self, value):
+        self._embedding = value
+
+    @property
+    def created_at(self):
+        return self._created_at
+
+
+class CachedCompletion(Base):
+    __tablename__ = "cached_completion"
+    _key = Column(String(64), primary_key=True)
+    _model = Column(String)
+    _result = Column(JSON)
+    _created_at = Column(DateTime, default=datetime.now)
+    _expires_at = Column(DateTime)
+
+    def __init__(self, key, model, result, expires_at):
+        self._key = key
+        self._model = model
+        self._result = result
+        self._expires_at = expires_at
+
+    @property
+    def key(self):
+        return self._key
+
+    @property
+    def model(self):
+        return self._model
+
+    @property
+    def result(self):
+        return self._result
+
+    @property
+    def created_at(self):
+        return self._created_at
+
+    @property
+    def expires_at(self):
+        return self._expires_at
@@ -5,9 +5,9 @@ from typing import List
 from urllib.parse import quote_plus, unquote_plus
 import uuid
 import numpy as np
-from sqlalchemy import UUID, Column, DateTime, Enum, Float, String
+from sqlalchemy import UUID, Column, DateTime, Enum, Float, Index, String
 from pgvector.sqlalchemy import Vector
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import deferred, relationship
 from models.models import JsonFunctionEncoder, Recurrent, Sporadic
 from models.models import Base
 
@@ -26,12 +26,21 @@ class ThemeType(enum.Enum):
 
 class Theme(Base):
     __tablename__ = "theme"
+    __table_args__ = (
+        Index(
+            "ix_theme__embedding_hnsw",
+            "_embedding",
+            postgresql_using="hnsw",
+            postgresql_with={"m": 16, "ef_construction": 64},
+            postgresql_ops={"_embedding": "vector_cosine_ops"},
+        ),
+    )
     _id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     _source = Column(Enum(ThemeType), default=ThemeType.ARTICLE)
-    _title = Column(String)
+    _title = Column(String, index=True, unique=True)
     _summary = Column(String)
     _created_at = Column(DateTime, default=datetime.now())
-    _embedding = Column(Vector(1536))
+    _embedding = deferred(Column(Vector(1536)))
     _avg_article_distance = Column(Float, default=0.0)
     _related = relationship(
         "Article", secondary="association", order_by="Article._updated_at.desc()"
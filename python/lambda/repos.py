@@ -1,30 +1,324 @@
-from contextlib import closing
-from sqlalchemy import create_engine
-from models.models import Browsed
+import base64
+from contextlib import closing, contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+import json
+import uuid
+from threading import Lock
+from sqlalchemy import (
+    and_,
+    case,
+    create_engine,
+    exists,
+    func,
+    inspect,
+    literal,
+    or_,
+    select,
+    text,
+    tuple_,
+    update,
+)
+from models.models import Association, Browsed, ThemeStats
+from models.article import Article
+from models.theme import Theme
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import sessionmaker
 from dassie_logger import logger
 
+DEFAULT_ENGINE_OPTIONS = {
+    "pool_size": 5,
+    "max_overflow": 2,
+    "pool_timeout": 10,
+    "pool_pre_ping": True,
+    "pool_recycle": 300,
+}
+
+_engines = {}
+_engines_lock = Lock()
+_current_session = ContextVar("current_session", default=None)
+
+
+def get_engine(url, engine_options=None):
+    """
+    Returns the process-wide engine for the given connection url, creating it on first use.
+    All repositories connecting to the same database share one engine and so one connection pool.
+    """
+    with _engines_lock:
+        engine = _engines.get(url)
+        if engine is None:
+            options = {**DEFAULT_ENGINE_OPTIONS, **(engine_options or {})}
+            logger.info(
+                "Creating engine",
+                extra={key: str(value) for key, value in options.items()},
+            )
+            engine = create_engine(url, **options)
+            _engines[url] = engine
+        return engine
+
+
+def dispose_engines():
+    with _engines_lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
+
+
+@contextmanager
+def unit_of_work(session_factory):
+    """
+    Opens a session that every repository joins for the duration of the block.
+    Repository writes are flushed rather than committed, the session is committed once on exit
+    and rolled back if the block raises. Nested units of work join the outermost one.
+    """
+    session = _current_session.get()
+    if session is not None:
+        yield session
+        return
+    session = session_factory()
+    token = _current_session.set(session)
+    try:
+        yield session
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        _current_session.reset(token)
+        session.close()
+
+
+def encode_cursor(value, id):
+    """Opaque page cursor holding the sort key and id of the last row of a page."""
+    payload = {"id": str(id)}
+    if isinstance(value, datetime):
+        payload["datetime"] = value.isoformat()
+    else:
+        payload["value"] = value
+    return base64.urlsafe_b64encode(json.dumps(payload).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor):
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        value = (
+            datetime.fromisoformat(payload["datetime"])
+            if "datetime" in payload
+            else payload["value"]
+        )
+        return value, uuid.UUID(payload["id"])
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("Invalid cursor")
+
 
 class BasePostgresRepository:
-    def __init__(self, username, password, dbname, db_cluster_endpoint):
+    # hnsw candidate list size for embedding searches, pgvector's default
+    EF_SEARCH = 40
+    # initial and maximum candidate set size for two phase embedding searches
+    CANDIDATES_PER_RESULT = 4
+    MAX_CANDIDATES = 1000
+
+    def __init__(
+        self, username, password, dbname, db_cluster_endpoint, engine_options=None
+    ):
         logger.debug(f"Initializing BasePostgresRepository")
-        engine = create_engine(
+        engine = get_engine(
             f"postgresql://{username}:{password}@{db_cluster_endpoint}/{dbname}",
-            pool_timeout=10,
+            engine_options,
         )
         self._session = sessionmaker(bind=engine, expire_on_commit=False)
         # Base.metadata.create_all(engine)
 
-    def get_all(self):
+    def unit_of_work(self):
+        return unit_of_work(self._session)
+
+    @contextmanager
+    def _session_scope(self):
+        session = _current_session.get()
+        if session is not None:
+            yield session
+            return
         with closing(self._session()) as session:
+            yield session
+
+    def _commit(self, session):
+        if session is _current_session.get():
+            session.flush()
+        else:
+            session.commit()
+
+    def _set_ef_search(self, session, ef_search):
+        # transaction local, so pooled connections keep the server default
+        session.execute(
+            text("SELECT set_config('hnsw.ef_search', :ef_search, true)"),
+            {"ef_search": str(ef_search)},
+        )
+
+    def _nearest_candidates(self, filter_embedding, k):
+        return (
+            select(self.model._id)
+            .where(self.model._embedding.is_not(None))
+            .order_by(self.model._embedding.cosine_distance(filter_embedding))
+            .limit(k)
+        )
+
+    def _two_phase_search(self, session, run_query, filter_embedding, limit, ef_search):
+        """
+        Runs run_query restricted to the k nearest ids, which the hnsw index serves, so the remaining filters only
+        see the candidate set. k doubles until limit rows survive the filters or MAX_CANDIDATES is reached.
+        """
+        k = min(limit * self.CANDIDATES_PER_RESULT, self.MAX_CANDIDATES)
+        while True:
+            # hnsw returns at most ef_search rows
+            self._set_ef_search(session, max(ef_search, k))
+            results = run_query(self._nearest_candidates(filter_embedding, k))
+            if len(results) >= limit or k >= self.MAX_CANDIDATES:
+                return results
+            k = min(k * 2, self.MAX_CANDIDATES)
+            logger.debug(
+                "widening embedding candidates",
+                extra={"k": k, "results": len(results)},
+            )
+
+    def _column_values(self, model):
+        values = {}
+        for column in inspect(self.model).column_attrs:
+            value = getattr(model, column.key)
+            if value is not None:
+                values[column.key] = value
+        return values
+
+    def _upsert(self, session, statement):
+        upserted = session.scalars(
+            statement.returning(self.model),
+            execution_options={"populate_existing": True},
+        ).one()
+        self._commit(session)
+        return upserted
+
+    def _refresh_theme_stats(self, session, theme_ids=None):
+        """
+        Recomputes the theme_stats rows of the given themes, a list or select of ids, from their associations.
+        Only the written themes are refreshed, through the association theme_id index; None refreshes every theme.
+        """
+        recently_browsed = (
+            select(Browsed._article_id.label("article_id"))
+            .where(
+                Browsed._logged_at
+                > datetime.now() - timedelta(days=ThemeStats.RECENT_BROWSE_DAYS)
+            )
+            .distinct()
+            .subquery("recently_browsed")
+        )
+        stats = (
+            select(
+                Theme._id,
+                func.count(Association.article_id),
+                func.max(Association.created_at),
+                func.count(recently_browsed.c.article_id),
+                func.max(
+                    case(
+                        (
+                            recently_browsed.c.article_id.is_not(None),
+                            Association.created_at,
+                        )
+                    )
+                ),
+                func.coalesce(
+                    func.avg(Theme._embedding.cosine_distance(Article._embedding)),
+                    0.0,
+                ),
+                literal(datetime.now()),
+            )
+            .select_from(Theme)
+            .outerjoin(Association, Association.theme_id == Theme._id)
+            .outerjoin(Article, Article._id == Association.article_id)
+            .outerjoin(
+                recently_browsed,
+                recently_browsed.c.article_id == Association.article_id,
+            )
+            .group_by(Theme._id)
+        )
+        if theme_ids is not None:
+            stats = stats.where(Theme._id.in_(theme_ids))
+        columns = [
+            "_theme_id",
+            "_association_count",
+            "_last_associated_at",
+            "_recent_browse_count",
+            "_recent_last_associated_at",
+            "_avg_article_distance",
+            "_updated_at",
+        ]
+        statement = insert(ThemeStats).from_select(columns, stats)
+        statement = statement.on_conflict_do_update(
+            index_elements=[ThemeStats._theme_id],
+            set_={column: statement.excluded[column] for column in columns[1:]},
+        )
+        session.execute(statement)
+
+    def _order_by_keyset(
+        self,
+        query,
+        sort_key,
+        ascending,
+        cursor=None,
+        aggregate=False,
+        include_sort_key=False,
+    ):
+        """
+        Orders by sort_key with _id as tie breaker and, given the cursor of the previous page, keeps the rows after it.
+        Null sort keys keep postgres' default placement, last ascending and first descending.
+        """
+        id_column = self.model._id
+        if cursor is not None:
+            value, last_id = decode_cursor(cursor)
+            if value is None:
+                after = and_(
+                    sort_key.is_(None),
+                    id_column > last_id if ascending else id_column < last_id,
+                )
+                after = after if ascending else or_(after, sort_key.is_not(None))
+            elif ascending:
+                after = or_(
+                    tuple_(sort_key, id_column) > tuple_(value, last_id),
+                    sort_key.is_(None),
+                )
+            else:
+                after = tuple_(sort_key, id_column) < tuple_(value, last_id)
+            query = query.having(after) if aggregate else query.where(after)
+        if include_sort_key:
+            query = query.add_columns(sort_key)
+        if ascending:
+            return query.order_by(sort_key.asc(), id_column.asc())
+        return query.order_by(sort_key.desc(), id_column.desc())
+
+    def get_page(self, limit, cursor=None, **kwargs):
+        """
+        Returns a page of get results and the cursor of the next page, None on the last page.
+        Pages are keyed on the sort key and id so a deep page costs the same as the first.
+        """
+        rows = list(
+            self.get(limit=limit + 1, cursor=cursor, include_sort_key=True, **kwargs)
+        )
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1][-1], rows[-1][0].id)
+        return [
+            row[0] if len(row) == 2 else tuple(row[:-1]) for row in rows
+        ], next_cursor
+
+    def get_all(self):
+        with self._session_scope() as session:
             return session.query(self.model).all()
 
     def get_by_id(self, id):
-        with closing(self._session()) as session:
+        with self._session_scope() as session:
             return session.query(self.model).get(id)
 
     def get_by_title(self, title):
-        with closing(self._session()) as session:
+        with self._session_scope() as session:
             return session.query(self.model).filter_by(_title=title).first()
 
     def get_or_insert(self, model):
@@ -35,34 +329,105 @@ class BasePostgresRepository:
 
     def add(self, model):
         logger.debug(f"Adding {self.model.__name__} {model}")
-        with closing(self._session()) as session:
+        with self._session_scope() as session:
             session.add(model)
-            session.commit()
+            self._commit(session)
             return session.merge(model)
 
     def delete(self, model):
         logger.debug(f"Deleting {self.model.__name__} {model}")
-        with closing(self._session()) as session:
+        with self._session_scope() as session:
             session.delete(model)
-            session.commit()
+            self._commit(session)
 
     def update(self, model):
         logger.debug(f"Updating {self.model.__name__} {model}")
-        with closing(self._session()) as session:
+        with self._session_scope() as session:
             detached = session.merge(model)
-            session.commit()
+            self._commit(session)
             return detached
 
 
 class BrowsedRepository(BasePostgresRepository):
-    def __init__(self, username, password, dbname, db_cluster_endpoint):
-        super().__init__(username, password, dbname, db_cluster_endpoint)
+    def __init__(
+        self, username, password, dbname, db_cluster_endpoint, engine_options=None
+    ):
+        super().__init__(
+            username, password, dbname, db_cluster_endpoint, engine_options
+        )
         self.model = Browsed
 
     def get_by_browse_and_article(self, browse_id, article_id):
-        with closing(self._session()) as session:
+        with self._session_scope() as session:
             return (
                 session.query(self.model)
                 .filter_by(_browse_id=browse_id, _article_id=article_id)
                 .first()
             )
+
+    def upsert_by_browse_and_article(self, browse_id, article_id, logged_at):
+        """
+        Inserts the browsed row or atomically increments its count, returning the row. The recent browse
+        counts and last recent associations of the article's themes are advanced in place when the article
+        becomes recently browsed, so concurrent navlogs add to each other's counts, refresh_stats ages them out.
+        """
+        recent_since = datetime.now() - timedelta(days=ThemeStats.RECENT_BROWSE_DAYS)
+        with self._session_scope() as session:
+            recently_browsed = session.scalar(
+                select(
+                    exists().where(
+                        self.model._article_id == article_id,
+                        self.model._logged_at > recent_since,
+                    )
+                )
+            )
+            statement = insert(self.model).values(
+                _browse_id=browse_id,
+                _article_id=article_id,
+                _logged_at=logged_at,
+                _count=1,
+                _created_at=datetime.now(),
+            )
+            statement = statement.on_conflict_do_update(
+                index_elements=[self.model._article_id, self.model._browse_id],
+                set_={
+                    "_count": self.model._count + 1,
+                    "_updated_at": datetime.now(),
+                },
+            )
+            browsed = session.scalars(
+                statement.returning(self.model),
+                execution_options={"populate_existing": True},
+            ).one()
+            if (
+                not recently_browsed
+                and browsed.logged_at is not None
+                and browsed.logged_at > recent_since
+            ):
+                session.execute(
+                    update(ThemeStats)
+                    .where(
+                        ThemeStats._theme_id.in_(
+                            select(Association.theme_id).where(
+                                Association.article_id == article_id
+                            )
+                        )
+                    )
+                    .values(
+                        _recent_browse_count=ThemeStats._recent_browse_count + 1,
+                        _recent_last_associated_at=func.greatest(
+                            ThemeStats._recent_last_associated_at,
+                            select(Association.created_at)
+                            .where(
+                                Association.theme_id == ThemeStats._theme_id,
+                                Association.article_id == article_id,
+                            )
+                            .scalar_subquery(),
+                        ),
+                        _updated_at=func.greatest(
+                            ThemeStats._updated_at, datetime.now()
+                        ),
+                    )
+                )
+            self._commit(session)
+            return browsed
@@ -34,19 +34,23 @@ def lambda_handler(
             if "query" in event["pathParameters"]
             else ""
         )
-        embedding = openai_client.get_embedding(search_query)
+        embedding = openai_client.get_query_embedding(search_query)
         articles = article_repo.get(
             filter_embedding=embedding,
             threshold=0.5,
             type=[ArticleType.ARTICLE],
             include_score_in_results=True,
             min_token_count=0,
+            two_phase=True,
+            projection=True,
+        )
+        themes = theme_repo.get(
+            filter_embedding=embedding, threshold=0.5, two_phase=True
         )
-        themes = theme_repo.get(filter_embedding=embedding, threshold=0.5)
 
         combined_results = {
             "articles": [
-                {**article.json(dump=False), "score": score}
+                {**article.json(dump=False, include_text=False), "score": score}
                 for article, score in articles
             ],
             "themes": [
@@ -1,3 +1,5 @@
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextvars import copy_context
 from datetime import datetime, timedelta
 from article_repo import ArticleRepository
 from browse_repo import BrowseRepository
@@ -5,7 +7,6 @@ from dassie_logger import logger
 from langfuse.decorators import observe
 from langfuse.decorators import langfuse_context
 from models.browse import Browse
-from models.models import Browsed
 from models.article import Article
 from repos import BrowsedRepository
 from services.neptune_client import NeptuneClient
@@ -17,6 +18,13 @@ from theme_repo import ThemeRepository
 class ArticlesService:
     # threshold for regenerating a summary
     STALE_ARTICLE_THRESHOLD = 90
+    # combined time allowed for summarisation, embedding and token counting of an article
+    LLM_TIMEOUT = 120
+    LLM_WORKERS = 12
+    # navlogs older than this, or with shorter text, are not built into articles,
+    # text is sized in UTF-8 bytes as DynamoDB sizes strings in build_articles' query filter
+    MAX_NAVLOG_AGE_DAYS = 2
+    MIN_BODY_LENGTH = 100
 
     def __init__(
         self,
@@ -35,9 +43,66 @@ class ArticlesService:
         self._llm_client = openai_client
         self._neptune_client = neptune_client
         self._opencypher_translator_client = opencypher_translator_client
+        self._llm_executor = ThreadPoolExecutor(
+            max_workers=self.LLM_WORKERS, thread_name_prefix="llm"
+        )
+
+    @classmethod
+    def should_skip(cls, navlog):
+        return (
+            len(navlog["body_text"].encode()) < cls.MIN_BODY_LENGTH
+            or "url" not in navlog
+            or datetime.strptime(navlog["created_at"], "%Y-%m-%dT%H:%M:%S.%f")
+            < datetime.now() - timedelta(days=cls.MAX_NAVLOG_AGE_DAYS)
+        )
 
     def process_navlog(self, navlog):
-        article = self._article_repo.get_or_insert(
+        # the article is committed before the LLM calls so that no transaction, nor pooled
+        # connection, is held across them, their results and the browse tracking are then
+        # applied in a second short transaction, as the ingestion pipeline splits its stages
+        with self._article_repo.unit_of_work():
+            article, summarise, build_graph = self._store_navlog(navlog)
+        llm_summarisation = (
+            self.get_llm_summarisation(article.text) if summarise else None
+        )
+        with self._article_repo.unit_of_work():
+            if llm_summarisation is not None:
+                self._add_llm_summarisation(article, *llm_summarisation)
+                logger.info("Built article", extra={"title": article.title})
+            self._track_browsing(article, navlog)
+        if build_graph:
+            self._process_article_graph(article)
+
+    def persist_navlog(self, navlog):
+        """
+        First stage of the ingestion pipeline, stores the article of the navlog and its browse tracking,
+        which a redelivered navlog already persisted skips. Returns (article, summarise, build_graph),
+        whether the article needs summarising and a graph built.
+        """
+        with self._article_repo.unit_of_work():
+            article, summarise, build_graph = self._store_navlog(navlog)
+            self._track_browsing(article, navlog)
+        return article, summarise, build_graph
+
+    def summarise_article(self, article_id):
+        """
+        Stores the summary, embedding and token count of the article, raising if summarisation fails.
+        Returns the summary, whose themes are tagged by tag_article_themes, or None.
+        """
+        article = self._article_repo.get_by_id(article_id)
+        summary, embedding, token_count = self.get_llm_summarisation(article.text)
+        self._add_summary(article, summary, embedding, token_count)
+        return summary
+
+    def tag_article_themes(self, article_id, summary_themes):
+        article = self._article_repo.get_by_id(article_id)
+        self._tag_themes(article, article.embedding, summary_themes)
+
+    def build_article_graph(self, article_id):
+        return self._process_article_graph(self._article_repo.get_by_id(article_id))
+
+    def _store_navlog(self, navlog):
+        article = self._article_repo.upsert_by_url(
             Article(
                 navlog["title"],
                 navlog["url"],
@@ -47,23 +112,72 @@ class ArticlesService:
                 ),
             )
         )
-        if article.summary is None or article.created_at < datetime.now() - timedelta(
-            days=self.STALE_ARTICLE_THRESHOLD
+        if (
+            article.summary is not None
+            and article.created_at
+            >= datetime.now() - timedelta(days=self.STALE_ARTICLE_THRESHOLD)
         ):
-            article = self._build_article_from_navlog(article, navlog)
-            self._add_llm_summarisation(
-                article,
-                self._llm_client.get_article_summarization(article.text),
-                self._llm_client.get_embedding(article.text),
-                self._llm_client.count_tokens(article.text),
+            return article, False, True
+        if self._is_unchanged(article, navlog):
+            article = self._refresh_article_from_navlog(article, navlog)
+            logger.info("Article text unchanged", extra={"title": article.title})
+            return article, False, False
+        return self._build_article_from_navlog(article, navlog), True, True
+
+    def _is_unchanged(self, article, navlog):
+        return (
+            article.summary is not None
+            and article.fingerprint is not None
+            and article.fingerprint == Article.text_fingerprint(navlog["body_text"])
+        )
+
+    def get_llm_summarisation(self, text):
+        """
+        Counts the tokens of the text once, then runs summarisation and embedding concurrently with that count.
+        Returns (summary, embedding, token_count) where any call that did not complete within
+        LLM_TIMEOUT is None. A failed embedding is None, a failed summarisation, or an embedding that ran
+        out of retries, is raised so that the navlog is retried before its summary and browse tracking are applied.
+        """
+        token_count = self._llm_client.count_tokens(text)
+        calls = {
+            "summary": self._llm_client.get_article_summarization,
+            "embedding": self._llm_client.get_embedding,
+        }
+        futures = {
+            name: self._llm_executor.submit(
+                copy_context().run, call, text, tokens=token_count
             )
-            logger.info("Built article", extra={"title": article.title})
-        self._track_browsing(article, navlog)
-        self._process_article_graph(article)
+            for name, call in calls.items()
+        }
+        wait(futures.values(), timeout=self.LLM_TIMEOUT)
+        results = {}
+        for name, future in futures.items():
+            results[name] = None
+            if not future.done():
+                future.cancel()
+                logger.error("LLM call timed out", extra={"call": name})
+            elif future.exception() is not None:
+                if name == "summary" or isinstance(
+                    future.exception(), OpenAIClient.RETRYABLE_ERRORS
+                ):
+                    raise future.exception()
+                logger.error(
+                    "LLM call failed",
+                    extra={"call": name, "error": str(future.exception())},
+                )
+            else:
+                results[name] = future.result()
+        return results["summary"], results["embedding"], token_count
 
     def _add_llm_summarisation(
         self, current_article, article_summary, embedding, token_count
     ):
+        if article_summary is None:
+            return
+        self._add_summary(current_article, article_summary, embedding, token_count)
+        self._tag_themes(current_article, embedding, article_summary.get("themes"))
+
+    def _add_summary(self, current_article, article_summary, embedding, token_count):
         if article_summary is None:
             return
         if "summary" in article_summary and article_summary["summary"] is not None:
@@ -72,25 +186,31 @@ class ArticlesService:
                 extra={
                     "summary": article_summary,
                     "token_count": token_count,
-                    "embedding_length": len(embedding),
+                    "embedding_length": 0 if embedding is None else len(embedding),
                 },
             )
             current_article.summary = article_summary["summary"]
-            current_article.embedding = embedding
-            current_article.token_count = token_count
+            # the text the summary was made from, set with it so a text committed without
+            # one, as when summarisation fails, is summarised again on the next navlog
+            current_article.fingerprint = Article.text_fingerprint(current_article.text)
+            if embedding is not None:
+                current_article.embedding = embedding
+            if token_count is not None:
+                current_article.token_count = token_count
             current_article.updated_at = datetime.now()
             self._article_repo.update(current_article)
+
+    def _tag_themes(self, current_article, embedding, summary_themes):
         themes = []
-        themes = [
-            theme.original_title
-            for theme, _ in self._theme_repo.get(filter_embedding=embedding, limit=3)
-        ]
-        if (
-            "themes" in article_summary
-            and article_summary["themes"] is not None
-            and len(themes) < 3
-        ):
-            new_themes = list(set(article_summary["themes"]).union(set(themes)))
+        if embedding is not None:
+            themes = [
+                theme.original_title
+                for theme, _ in self._theme_repo.get(
+                    filter_embedding=embedding, limit=3, two_phase=True
+                )
+            ]
+        if summary_themes is not None and len(themes) < 3:
+            new_themes = list(set(summary_themes).union(set(themes)))
             logger.info(
                 "Adding new themes",
                 extra={"themes": new_themes, "current_themes": themes},
@@ -126,30 +246,22 @@ class ArticlesService:
         return graph_opencypher
 
     def _track_browsing(self, article, navlog):
+        # the navlog is recorded on the article with its browse, so one redelivered after it was
+        # persisted, as when deleting it failed, is not counted again
+        if article.source_navlog == navlog["id"]:
+            logger.info("Browse already tracked", extra={"navlog_id": navlog["id"]})
+            return
         search = self.get_search_terms_from_article(article)
-        browse = self._browse_repo.get_or_insert(Browse(tab_id=navlog["tabId"]))
-        if search is not None and browse.title is None:
-            browse.title = search
-        if browse.logged_at is None:
-            browse.logged_at = navlog["created_at"]
-        self._browse_repo.update(browse)
-        browsed = self._browsed_repo.get_by_browse_and_article(
-            article_id=article.id, browse_id=browse.id
+        browse = self._browse_repo.upsert_by_tab_id(
+            Browse(tab_id=navlog["tabId"], title=search, logged_at=navlog["created_at"])
         )
-        if browsed is None:
-            self._browsed_repo.add(
-                Browsed(
-                    article_id=article.id,
-                    browse_id=browse.id,
-                    logged_at=navlog["created_at"],
-                )
-            )
-        else:
-            browsed.count += 1
-            self._browsed_repo.update(browsed)
+        self._browsed_repo.upsert_by_browse_and_article(
+            browse_id=browse.id, article_id=article.id, logged_at=navlog["created_at"]
+        )
+        article.source_navlog = navlog["id"]
+        self._article_repo.update(article)
 
     def _build_article_from_navlog(self, current_article, navlog):
-        current_article.source_navlog = navlog["id"]
         current_article.tab_id = navlog["tabId"]
         current_article.document_id = (
             navlog["documentId"]
@@ -171,3 +283,10 @@ class ArticlesService:
             current_article.image = navlog["image"]
         current_article = self._article_repo.update(current_article)
         return current_article
+
+    def _refresh_article_from_navlog(self, current_article, navlog):
+        current_article.logged_at = datetime.strptime(
+            navlog["created_at"], "%Y-%m-%dT%H:%M:%S.%f"
+        )
+        current_article.updated_at = datetime.now()
+        return self._article_repo.update(current_article)
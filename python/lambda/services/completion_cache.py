@@ -0,0 +1,100 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import hashlib
+from threading import Lock
+from dassie_logger import logger
+
+
+class CompletionCache:
+    """
+    Cache of parsed completion results keyed by prompt, model, temperature and a hash of the query.
+    Entries expire after a ttl; an optional repository persists them across containers.
+    """
+
+    TTL = timedelta(days=30)
+    MAX_SIZE = 256
+
+    def __init__(self, repo=None, ttl=TTL, max_size=MAX_SIZE):
+        self._repo = repo
+        self._ttl = ttl
+        self._max_size = max_size
+        self._memory = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(prompt, model, temperature, query, json_response=True):
+        query_hash = hashlib.sha256(query.encode("utf-8")).hexdigest()
+        return hashlib.sha256(
+            f"{prompt}\n{model}\n{temperature}\n{json_response}\n{query_hash}".encode(
+                "utf-8"
+            )
+        ).hexdigest()
+
+    def get(self, key):
+        now = datetime.now()
+        with self._lock:
+            if key in self._memory:
+                result, expires_at = self._memory[key]
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    logger.debug("completion cache hit", extra=self.stats())
+                    return result
+                del self._memory[key]
+        cached = self._get_persistent(key)
+        with self._lock:
+            if cached is None or cached.expires_at <= now:
+                self.misses += 1
+                logger.debug("completion cache miss", extra=self.stats())
+                return None
+            self.persistent_hits += 1
+            self._put_memory(key, cached.result, cached.expires_at)
+        logger.debug("completion cache persistent hit", extra=self.stats())
+        return cached.result
+
+    def put(self, key, model, result):
+        if result is None:
+            return
+        expires_at = datetime.now() + self._ttl
+        with self._lock:
+            self._put_memory(key, result, expires_at)
+        if self._repo is not None:
+            try:
+                self._repo.put(key, model, result, expires_at)
+            except Exception:
+                logger.exception("completion cache put error")
+
+    def invalidate(self, key):
+        with self._lock:
+            self._memory.pop(key, None)
+        if self._repo is not None:
+            try:
+                self._repo.delete(key)
+            except Exception:
+                logger.exception("completion cache invalidate error")
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "persistent_hits": self.persistent_hits,
+            "misses": self.misses,
+            "size": len(self._memory),
+        }
+
+    def _get_persistent(self, key):
+        if self._repo is None:
+            return None
+        try:
+            return self._repo.get_by_key(key)
+        except Exception:
+            logger.exception("completion cache get error")
+            return None
+
+    def _put_memory(self, key, result, expires_at):
+        self._memory[key] = (result, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self._max_size:
+            self._memory.popitem(last=False)
@@ -0,0 +1,65 @@
+import numpy as np
+from dassie_logger import logger
+
+
+class EmbeddingBackend:
+    """
+    Embeds texts into vectors comparable with the stored article and theme embeddings.
+    model names the backend in embedding cache keys.
+    """
+
+    model = None
+
+    def embed(self, texts):
+        raise NotImplementedError
+
+
+def fit_projection(source_embeddings, target_embeddings):
+    """
+    Least squares linear map from the embeddings of a local model to the stored embeddings of the same texts,
+    so local query embeddings can be searched against the existing vector indexes.
+    """
+    projection, _, _, _ = np.linalg.lstsq(
+        np.asarray(source_embeddings), np.asarray(target_embeddings), rcond=None
+    )
+    return projection
+
+
+class LocalEmbeddingBackend(EmbeddingBackend):
+    """
+    Sentence embedding model run on the CPU in process, for query embeddings without a request to OpenAI.
+    Embeddings are projected to the dimensions of the stored embeddings with a matrix fitted by fit_projection.
+    """
+
+    MODEL = "BAAI/bge-small-en-v1.5"
+
+    def __init__(
+        self, projection, model_name=MODEL, text_embedding=None, cache_dir=None
+    ):
+        if text_embedding is None:
+            # installed with the model in the docker image, not in the layers of zip functions
+            from fastembed import TextEmbedding
+
+            text_embedding = TextEmbedding(model_name, cache_dir=cache_dir)
+        self._text_embedding = text_embedding
+        self._projection = np.asarray(projection)
+        self.model = f"{model_name}->{self._projection.shape[1]}"
+        logger.info(
+            "init local embedding backend",
+            extra={"model": model_name, "projection": self._projection.shape},
+        )
+
+    @classmethod
+    def from_projection_file(cls, path, model_name=MODEL, cache_dir=None):
+        return cls(np.load(path), model_name, cache_dir=cache_dir)
+
+    @property
+    def dimensions(self):
+        return self._projection.shape[1]
+
+    def embed(self, texts):
+        embeddings = np.asarray(list(self._text_embedding.embed(texts)))
+        projected = embeddings @ self._projection
+        # stored embeddings are unit length, as OpenAI's are
+        projected /= np.linalg.norm(projected, axis=1, keepdims=True)
+        return projected.tolist()
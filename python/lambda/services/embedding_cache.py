@@ -0,0 +1,82 @@
+from collections import OrderedDict
+import hashlib
+from threading import Lock
+from dassie_logger import logger
+
+
+class EmbeddingCache:
+    """
+    Two tier cache of embeddings keyed by a hash of the model and normalized text.
+    An in-memory LRU serves warm containers, an optional repository persists embeddings across containers.
+    """
+
+    MAX_SIZE = 1024
+
+    def __init__(self, repo=None, max_size=MAX_SIZE):
+        self._repo = repo
+        self._max_size = max_size
+        self._memory = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(model, text):
+        normalized = " ".join(text.split())
+        return hashlib.sha256(f"{model}\n{normalized}".encode("utf-8")).hexdigest()
+
+    def get(self, model, text):
+        key = self.key(model, text)
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                logger.debug("embedding cache hit", extra=self.stats())
+                return self._memory[key]
+        embedding = self._get_persistent(key)
+        with self._lock:
+            if embedding is None:
+                self.misses += 1
+                logger.debug("embedding cache miss", extra=self.stats())
+                return None
+            self.persistent_hits += 1
+            self._put_memory(key, embedding)
+        logger.debug("embedding cache persistent hit", extra=self.stats())
+        return embedding
+
+    def put(self, model, text, embedding):
+        if embedding is None:
+            return
+        key = self.key(model, text)
+        with self._lock:
+            self._put_memory(key, embedding)
+        if self._repo is not None:
+            try:
+                self._repo.put(key, model, embedding)
+            except Exception:
+                logger.exception("embedding cache put error")
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "persistent_hits": self.persistent_hits,
+            "misses": self.misses,
+            "size": len(self._memory),
+        }
+
+    def _get_persistent(self, key):
+        if self._repo is None:
+            return None
+        try:
+            cached = self._repo.get_by_key(key)
+        except Exception:
+            logger.exception("embedding cache get error")
+            return None
+        return None if cached is None else list(cached.embedding)
+
+    def _put_memory(self, key, embedding):
+        self._memory[key] = embedding
+        self._memory.move_to_end(key)
+        while len(self._memory) > self._max_size:
+            self._memory.popitem(last=False)
@@ -0,0 +1,177 @@
+import json
+import os
+import boto3
+from dassie_logger import logger
+from services.articles_service import ArticlesService
+from services.ingestion_queue import InMemoryIngestionQueue, SqsIngestionQueue
+from services.navlogs_service import NavlogService
+
+
+class IngestionPipeline:
+    """
+    Article ingestion split into stages connected by queues, so each scales on its own and a slow stage,
+    usually the graph, only delays itself. Messages carry ids, every stage reads what it needs and can be
+    retried. persist stores the article and browse tracking of a navlog, summarise its summary and
+    embedding, themes tags it with themes and graph builds its Neptune graph, alongside summarise.
+    """
+
+    PERSIST = "persist"
+    SUMMARISE = "summarise"
+    THEMES = "themes"
+    GRAPH = "graph"
+    STAGES = [PERSIST, SUMMARISE, THEMES, GRAPH]
+    # messages per invocation, also the batch sizes of the event source mappings
+    BATCH_SIZES = {PERSIST: 10, SUMMARISE: 4, THEMES: 10, GRAPH: 1}
+    # receives before a message is moved to the dead letter queue
+    MAX_RECEIVE_COUNT = 3
+    # navlogs still stored this long after being queued, as when dead-lettered, are queued again by sweeps
+    REQUEUE_AFTER_HOURS = 6
+
+    def __init__(
+        self,
+        articles_service: ArticlesService,
+        navlog_service: NavlogService,
+        queues,
+    ):
+        """queues maps each stage to the IngestionQueue feeding it."""
+        self._articles_service = articles_service
+        self._navlog_service = navlog_service
+        self._queues = queues
+        self._handlers = {
+            self.PERSIST: self._persist,
+            self.SUMMARISE: self._summarise,
+            self.THEMES: self._tag_themes,
+            self.GRAPH: self._build_graph,
+        }
+
+    @classmethod
+    def queue_url_variable(cls, stage):
+        return f"{stage.upper()}_QUEUE_URL"
+
+    @classmethod
+    def from_init_context(cls, init_context, opencypher_translator_client):
+        """
+        Pipeline over the SQS queues in the <STAGE>_QUEUE_URL variables, None when
+        PERSIST_QUEUE_URL is not set and navlogs are processed in one call.
+        """
+        if cls.queue_url_variable(cls.PERSIST) not in os.environ:
+            return None
+        sqs_client = boto3.client("sqs")
+        articles_service = ArticlesService(
+            init_context.article_repo,
+            init_context.theme_repo,
+            init_context.browse_repo,
+            init_context.browsed_repo,
+            init_context.openai_client,
+            init_context.neptune_client,
+            opencypher_translator_client,
+        )
+        return cls(
+            articles_service,
+            init_context.navlog_service,
+            {
+                stage: SqsIngestionQueue(
+                    os.environ[cls.queue_url_variable(stage)], sqs_client
+                )
+                for stage in cls.STAGES
+            },
+        )
+
+    @classmethod
+    def in_memory(cls, articles_service, navlog_service):
+        return cls(
+            articles_service,
+            navlog_service,
+            {
+                stage: InMemoryIngestionQueue(cls.MAX_RECEIVE_COUNT)
+                for stage in cls.STAGES
+            },
+        )
+
+    def enqueue_navlogs(self, navlog_ids):
+        self._queues[self.PERSIST].send(
+            [{"navlog_id": navlog_id} for navlog_id in navlog_ids]
+        )
+        self._navlog_service.mark_enqueued(navlog_ids)
+
+    def handle(self, stage, event):
+        """
+        Processes the SQS records of event with the stage, returning the failed ones as a partial batch
+        response so only those are retried.
+        """
+        failures = []
+        for record in event["Records"]:
+            try:
+                self._handlers[stage](json.loads(record["body"]))
+            except Exception as error:
+                logger.exception(
+                    "Error in ingestion stage",
+                    extra={
+                        "stage": stage,
+                        "error": str(error),
+                        "message_id": record["messageId"],
+                        "receive_count": record.get("attributes", {}).get(
+                            "ApproximateReceiveCount"
+                        ),
+                    },
+                )
+                failures.append({"itemIdentifier": record["messageId"]})
+        logger.info(
+            "Ingestion batch complete",
+            extra={
+                "stage": stage,
+                "processed": len(event["Records"]) - len(failures),
+                "errors": len(failures),
+            },
+        )
+        return {"batchItemFailures": failures}
+
+    def drain(self):
+        """
+        Runs the stages over in-memory queues until all are empty, for local runs.
+        Returns the messages moved to dead letters by stage.
+        """
+        while any(len(self._queues[stage]) > 0 for stage in self.STAGES):
+            for stage in self.STAGES:
+                queue = self._queues[stage]
+                records = queue.receive(self.BATCH_SIZES[stage])
+                if len(records) == 0:
+                    continue
+                response = self.handle(stage, {"Records": records})
+                queue.settle(
+                    records,
+                    {
+                        failure["itemIdentifier"]
+                        for failure in response["batchItemFailures"]
+                    },
+                )
+        return {stage: self._queues[stage].dead_letters for stage in self.STAGES}
+
+    def _persist(self, message):
+        navlog = self._navlog_service.get_navlog(message["navlog_id"])
+        if navlog is None:
+            # deleted once persisted, so this is a redelivery
+            logger.info("Navlog already processed", extra=message)
+            return
+        article, summarise, build_graph = self._articles_service.persist_navlog(navlog)
+        article_message = {"article_id": str(article.id)}
+        if summarise:
+            self._queues[self.SUMMARISE].send([article_message])
+        if build_graph:
+            self._queues[self.GRAPH].send([article_message])
+        self._navlog_service.delete_navlog(navlog["id"])
+
+    def _summarise(self, message):
+        summary = self._articles_service.summarise_article(message["article_id"])
+        if summary is not None:
+            self._queues[self.THEMES].send(
+                [{"article_id": message["article_id"], "themes": summary.get("themes")}]
+            )
+
+    def _tag_themes(self, message):
+        self._articles_service.tag_article_themes(
+            message["article_id"], message["themes"]
+        )
+
+    def _build_graph(self, message):
+        self._articles_service.build_article_graph(message["article_id"])
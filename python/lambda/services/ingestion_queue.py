@@ -0,0 +1,88 @@
+from collections import deque
+import json
+import uuid
+import boto3
+from dassie_logger import logger
+
+
+class IngestionQueue:
+    """Queue feeding an ingestion stage, messages are dicts serialised as JSON."""
+
+    def send(self, messages):
+        raise NotImplementedError
+
+
+class SqsIngestionQueue(IngestionQueue):
+    # the most entries SQS takes in one SendMessageBatch
+    MAX_BATCH = 10
+
+    def __init__(self, queue_url, sqs_client=None):
+        self._queue_url = queue_url
+        self._sqs_client = sqs_client or boto3.client("sqs")
+
+    def send(self, messages):
+        for start in range(0, len(messages), self.MAX_BATCH):
+            batch = messages[start : start + self.MAX_BATCH]
+            response = self._sqs_client.send_message_batch(
+                QueueUrl=self._queue_url,
+                Entries=[
+                    {"Id": str(index), "MessageBody": json.dumps(message)}
+                    for index, message in enumerate(batch)
+                ],
+            )
+            failed = response.get("Failed", [])
+            if len(failed) > 0:
+                # raised so the message that produced these is retried, stages are idempotent
+                raise RuntimeError(
+                    f"Failed to send {len(failed)} messages to {self._queue_url}: "
+                    f"{failed[0].get('Message')}"
+                )
+
+
+class InMemoryIngestionQueue(IngestionQueue):
+    """
+    Stand-in for SQS in local runs and tests. Records are shaped like those of an SQS event, and a message
+    failing max_receive_count times is moved to dead_letters, as a redrive policy would.
+    """
+
+    def __init__(self, max_receive_count=3):
+        self._max_receive_count = max_receive_count
+        self._messages = deque()
+        self.dead_letters = []
+
+    def __len__(self):
+        return len(self._messages)
+
+    def send(self, messages):
+        for message in messages:
+            self._messages.append((str(uuid.uuid4()), json.dumps(message), 0))
+
+    def receive(self, max_messages):
+        records = []
+        while len(self._messages) > 0 and len(records) < max_messages:
+            message_id, body, receive_count = self._messages.popleft()
+            records.append(
+                {
+                    "messageId": message_id,
+                    "body": body,
+                    "attributes": {"ApproximateReceiveCount": str(receive_count + 1)},
+                }
+            )
+        return records
+
+    def settle(self, records, failed_ids):
+        """Returns the failed records to the queue, or to dead_letters after their last receive."""
+        for record in records:
+            if record["messageId"] not in failed_ids:
+                continue
+            receive_count = int(record["attributes"]["ApproximateReceiveCount"])
+            if receive_count >= self._max_receive_count:
+                logger.error(
+                    "Message moved to dead letters",
+                    extra={"message_id": record["messageId"], "body": record["body"]},
+                )
+                self.dead_letters.append(json.loads(record["body"]))
+            else:
+                self._messages.append(
+                    (record["messageId"], record["body"], receive_count)
+                )
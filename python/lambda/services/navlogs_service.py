@@ -1,15 +1,34 @@
+from datetime import datetime
+from functools import reduce
 import json
+import operator
 import boto3
-from boto3.dynamodb.conditions import Key
+from boto3.dynamodb.conditions import Attr, Key
+from boto3.dynamodb.types import TypeDeserializer
+from botocore.exceptions import ClientError
 from dassie_logger import logger
 
 
 class NavlogService:
+    CREATED_AT_FORMAT = "%Y-%m-%dT%H:%M:%S.%f"
+    # attributes of a content navlog read when building its article
+    CONTENT_NAVLOG_ATTRIBUTES = [
+        "id",
+        "title",
+        "url",
+        "body_text",
+        "created_at",
+        "tabId",
+        "documentId",
+        "parentDocumentId",
+        "image",
+    ]
 
     def __init__(self, bucket_name, table_name) -> None:
         self._dynamodb = boto3.resource("dynamodb")
         self._bucket_name = bucket_name
         self._table_name = table_name
+        self._deserializer = TypeDeserializer()
 
     def get_navlogs(self):
         ddb_table = self._dynamodb.Table(self._table_name)
@@ -21,27 +40,111 @@ class NavlogService:
         ddb_table.put_item(Item=navlog)
         return json.dumps(navlog)
 
+    def get_navlog(self, navlog_id):
+        ddb_table = self._dynamodb.Table(self._table_name)
+        return ddb_table.get_item(Key={"id": navlog_id}).get("Item")
+
+    def get_stream_navlog(self, record):
+        """
+        The navlog of a table stream record, read from the table rather than the record's image, so records
+        replayed after their navlog was processed and deleted return None.
+        """
+        keys = self._deserializer.deserialize({"M": record["dynamodb"]["Keys"]})
+        return self.get_navlog(keys["id"])
+
     def delete_navlog(self, navlog_id):
         ddb_table = self._dynamodb.Table(self._table_name)
         ddb_table.delete_item(Key={"id": navlog_id})
         return True
 
+    def mark_enqueued(self, navlog_ids):
+        """
+        Records when the navlogs were queued for the ingestion pipeline, so sweeps skip them while queued.
+        Navlogs already processed and deleted are not recreated.
+        """
+        ddb_table = self._dynamodb.Table(self._table_name)
+        enqueued_at = datetime.now().strftime(self.CREATED_AT_FORMAT)
+        for navlog_id in navlog_ids:
+            try:
+                ddb_table.update_item(
+                    Key={"id": navlog_id},
+                    UpdateExpression="SET enqueued_at = :enqueued_at",
+                    ConditionExpression=Attr("id").exists(),
+                    ExpressionAttributeValues={":enqueued_at": enqueued_at},
+                )
+            except ClientError as error:
+                if error.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                    raise
+                logger.debug(
+                    "Navlog processed before marked enqueued",
+                    extra={"navlog_id": navlog_id},
+                )
+
     def get_content_navlogs(self):
+        return list(self.iter_content_navlogs())
+
+    def iter_content_navlogs(self, **kwargs):
+        for items, _ in self.iter_content_navlog_pages(**kwargs):
+            yield from items
+
+    def iter_content_navlog_pages(
+        self,
+        created_after=None,
+        min_body_length=0,
+        with_url=False,
+        attributes=None,
+        start_key=None,
+        page_size=None,
+        enqueued_before=None,
+    ):
+        """
+        Yields content navlogs a page at a time, with the key to resume after the page, None after the last page.
+        The created_after, min_body_length (in UTF-8 bytes), with_url and enqueued_before filters are applied
+        by DynamoDB, so filtered navlogs are not transferred, and attributes limits the attributes returned.
+        enqueued_before leaves out navlogs marked enqueued since then.
+        """
         ddb_table = self._dynamodb.Table(self._table_name)
-        response = ddb_table.query(
-            IndexName="type-index", KeyConditionExpression=Key("type").eq("content")
-        )
-        items = response["Items"]
-
-        while "LastEvaluatedKey" in response:
-            response = ddb_table.query(
-                IndexName="type-index",
-                KeyConditionExpression=Key("type").eq("content"),
-                ExclusiveStartKey=response["LastEvaluatedKey"],
+        query = {
+            "IndexName": "type-index",
+            "KeyConditionExpression": Key("type").eq("content"),
+        }
+        conditions = []
+        if created_after is not None:
+            # created_at strings share one format, so they order as the times do
+            conditions.append(
+                Attr("created_at").gte(created_after.strftime(self.CREATED_AT_FORMAT))
             )
-            items += response["Items"]
-
-        return items
+        if min_body_length > 0:
+            conditions.append(Attr("body_text").size().gte(min_body_length))
+        if with_url:
+            conditions.append(Attr("url").exists())
+        if enqueued_before is not None:
+            conditions.append(
+                Attr("enqueued_at").not_exists()
+                | Attr("enqueued_at").lt(
+                    enqueued_before.strftime(self.CREATED_AT_FORMAT)
+                )
+            )
+        if len(conditions) > 0:
+            query["FilterExpression"] = reduce(operator.and_, conditions)
+        if attributes is not None:
+            names = {f"#p{index}": name for index, name in enumerate(attributes)}
+            query["ProjectionExpression"] = ", ".join(names)
+            query["ExpressionAttributeNames"] = names
+        if page_size is not None:
+            query["Limit"] = page_size
+        while True:
+            if start_key is not None:
+                query["ExclusiveStartKey"] = start_key
+            response = ddb_table.query(**query)
+            start_key = response.get("LastEvaluatedKey")
+            logger.debug(
+                "content navlogs page",
+                extra={"count": len(response["Items"]), "more": start_key is not None},
+            )
+            yield response["Items"], start_key
+            if start_key is None:
+                return
 
     def _add_presigned_urls(self, navlogs):
         for navlog in navlogs:
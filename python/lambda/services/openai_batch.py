@@ -0,0 +1,122 @@
+import json
+from pathlib import Path
+import uuid
+from dassie_logger import logger
+
+
+class BatchRunner:
+    """
+    Runs a JSONL file of requests to one endpoint as a batch job. Output lines are those of the OpenAI
+    Batch API, {"custom_id", "response": {"status_code", "body"}, "error"}.
+    """
+
+    # statuses after which a batch makes no further progress, expired and cancelled ones keep partial output
+    TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+    def submit(self, path, endpoint, completion_window):
+        raise NotImplementedError
+
+    def status(self, batch_id):
+        raise NotImplementedError
+
+    def results(self, batch_id):
+        raise NotImplementedError
+
+
+class OpenAIBatchRunner(BatchRunner):
+    def __init__(self, openai_client):
+        self._openai_client = openai_client
+
+    def submit(self, path, endpoint, completion_window):
+        with open(path, "rb") as requests:
+            input_file = self._openai_client.files.create(
+                file=requests, purpose="batch"
+            )
+        batch = self._openai_client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=endpoint,
+            completion_window=completion_window,
+        )
+        logger.info(
+            "Submitted batch",
+            extra={"batch_id": batch.id, "endpoint": endpoint, "path": str(path)},
+        )
+        return batch.id
+
+    def status(self, batch_id):
+        batch = self._openai_client.batches.retrieve(batch_id)
+        logger.debug(
+            "Batch status",
+            extra={
+                "batch_id": batch_id,
+                "status": batch.status,
+                "request_counts": (
+                    batch.request_counts.model_dump() if batch.request_counts else None
+                ),
+            },
+        )
+        return batch.status
+
+    def results(self, batch_id):
+        batch = self._openai_client.batches.retrieve(batch_id)
+        lines = []
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id is None:
+                continue
+            content = self._openai_client.files.content(file_id).text
+            lines += [json.loads(line) for line in content.splitlines() if line]
+        return lines
+
+
+class LocalBatchRunner(BatchRunner):
+    """
+    File based stand-in for the Batch API, for tests and local runs. Each request is answered by
+    responder(endpoint, body), returning the response body, and batches complete on submission.
+    """
+
+    def __init__(self, directory, responder):
+        self._directory = Path(directory)
+        self._responder = responder
+
+    @staticmethod
+    def chat_response(content):
+        return {
+            "choices": [
+                {"index": 0, "message": {"role": "assistant", "content": content}}
+            ]
+        }
+
+    @staticmethod
+    def embedding_response(embedding):
+        return {"data": [{"index": 0, "object": "embedding", "embedding": embedding}]}
+
+    def _output_path(self, batch_id):
+        return self._directory / f"{batch_id}_output.jsonl"
+
+    def submit(self, path, endpoint, completion_window):
+        batch_id = f"batch_{uuid.uuid4().hex}"
+        with open(path) as requests, open(self._output_path(batch_id), "w") as output:
+            for line in requests:
+                request = json.loads(line)
+                result = {
+                    "id": f"batch_req_{uuid.uuid4().hex}",
+                    "custom_id": request["custom_id"],
+                    "response": None,
+                    "error": None,
+                }
+                try:
+                    result["response"] = {
+                        "status_code": 200,
+                        "body": self._responder(request["url"], request["body"]),
+                    }
+                except Exception as error:
+                    result["error"] = {"code": "local_error", "message": str(error)}
+                output.write(json.dumps(result) + "\n")
+        return batch_id
+
+    def status(self, batch_id):
+        return "completed" if self._output_path(batch_id).exists() else "failed"
+
+    def results(self, batch_id):
+        with open(self._output_path(batch_id)) as output:
+            return [json.loads(line) for line in output if line.strip()]
@@ -1,11 +1,23 @@
 import json
-from openai import NOT_GIVEN
+import random
+import tempfile
+import time
+from pathlib import Path
+from threading import BoundedSemaphore, Lock
 import tiktoken
 from langfuse.decorators import langfuse_context
 from langfuse.decorators import observe
 from langfuse.openai import OpenAI
+from openai import (
+    APIConnectionError,
+    DefaultHttpxClient,
+    InternalServerError,
+    RateLimitError,
+)
 
 from dassie_logger import logger
+from services.openai_batch import BatchRunner, OpenAIBatchRunner
+from services.rate_limiter import RateLimiter, parse_duration
 
 
 class LLMResponseException(Exception):
@@ -19,8 +31,16 @@ class LLMResponseException(Exception):
 
 class OpenAIClient:
     MODEL = "gpt-3.5-turbo"
+    EMBEDDING_MODEL = "text-embedding-ada-002"
+    # limits per embeddings request, below the endpoint's 2048 inputs and 300k tokens
+    EMBEDDING_BATCH_SIZE = 100
+    EMBEDDING_BATCH_TOKENS = 100000
     ENCODING = tiktoken.encoding_for_model(MODEL)
     CONTEXT_WINDOW_SIZE = 15000
+    # input tokens allowed per model, leaving room for the completion, longer texts are truncated
+    CONTEXT_WINDOW_SIZES = {MODEL: CONTEXT_WINDOW_SIZE, "gpt-4o-mini": 120000}
+    EMBEDDING_MAX_TOKENS = 8191
+    TOKEN_COUNT_THREADS = 8
     MIN_TEXT_LENGTH = 1000
     THEME_SUMMARY_PROMPT = """
         Your task is to summarize the common theme, that appears in at least 2 texts, and any disagreements, between at least two texts, from the following webpages texts separated by three dashes.
@@ -44,24 +64,288 @@ class OpenAIClient:
     ARTICLE_OPEN_CYPHER_PROMPT = """Your task is to validate that each of the following entities and relations in the turtle are grounded in the text. 
     Output opencypher (Neptune-9.0.20190305-1.0) query to create only the grounded entities and relations, assume the entities and relations may already exist.Finally add SOURCE_OF relations from (a:Article {{id: \"{article_id}\"}}) to all of the entities"""
     TEMPERATURE = 0
+    # cap on in-flight requests per model, shared by every thread using this client
+    MAX_CONCURRENT_REQUESTS_PER_MODEL = 4
+    # 429, 5xx and connection errors, including timeouts, are retried with jittered exponential backoff
+    RETRYABLE_ERRORS = (RateLimitError, InternalServerError, APIConnectionError)
+    REQUEST_RETRIES = 4
+    RETRY_BASE_DELAY = 1
+    RETRY_MAX_DELAY = 30
+    # tokens pre-charged for a completion's output, settled against its usage
+    COMPLETION_TOKENS_ESTIMATE = 500
+    CHAT_COMPLETIONS_ENDPOINT = "/v1/chat/completions"
+    EMBEDDINGS_ENDPOINT = "/v1/embeddings"
+    BATCH_COMPLETION_WINDOW = "24h"
+    BATCH_POLL_INTERVAL = 60
+    # per file limits of the Batch API, 50,000 requests and 200 MB
+    BATCH_MAX_REQUESTS = 50000
+    BATCH_MAX_BYTES = 190 * 1024 * 1024
 
-    def __init__(self, api_key):
-        self.openai_client = OpenAI(api_key=api_key)
+    def __init__(
+        self,
+        api_key,
+        max_concurrent_requests_per_model=MAX_CONCURRENT_REQUESTS_PER_MODEL,
+        embedding_cache=None,
+        completion_cache=None,
+        query_embedding_backend=None,
+        batch_runner=None,
+        rate_limiter=None,
+    ):
+        self._rate_limiter = rate_limiter if rate_limiter is not None else RateLimiter()
+        # retries are made by _request, which knows about the rate limiter, rather than by the SDK
+        self.openai_client = OpenAI(
+            api_key=api_key,
+            max_retries=0,
+            http_client=DefaultHttpxClient(
+                event_hooks={"response": [self._update_rate_limits]}
+            ),
+        )
+        self._batch_runner = batch_runner
+        self._embedding_cache = embedding_cache
+        self._query_embedding_backend = query_embedding_backend
+        self._completion_cache = completion_cache
+        self._max_concurrent_requests_per_model = max_concurrent_requests_per_model
+        self._model_semaphores = {}
+        self._model_semaphores_lock = Lock()
+
+    @property
+    def batch_runner(self) -> BatchRunner:
+        if self._batch_runner is None:
+            self._batch_runner = OpenAIBatchRunner(self.openai_client)
+        return self._batch_runner
+
+    def _model_semaphore(self, model) -> BoundedSemaphore:
+        with self._model_semaphores_lock:
+            if model not in self._model_semaphores:
+                self._model_semaphores[model] = BoundedSemaphore(
+                    self._max_concurrent_requests_per_model
+                )
+            return self._model_semaphores[model]
+
+    def _update_rate_limits(self, response):
+        """Feeds the x-ratelimit-* headers of every response to the rate limiter, under the model requested."""
+        if "x-ratelimit-limit-requests" not in response.headers:
+            return
+        try:
+            model = json.loads(response.request.content).get("model")
+        except Exception:
+            # file uploads and other non JSON requests
+            return
+        if model is not None:
+            self._rate_limiter.update(model, response.headers)
+
+    def _retry_delay(self, attempt, error):
+        """
+        Seconds to wait before retrying a failed request, from the retry-after or x-ratelimit-reset-* headers
+        of the error when present, otherwise full jitter exponential backoff.
+        """
+        response = getattr(error, "response", None)
+        headers = response.headers if response is not None else {}
+        hint = None
+        try:
+            if "retry-after-ms" in headers:
+                hint = float(headers["retry-after-ms"]) / 1000
+            elif "retry-after" in headers:
+                hint = float(headers["retry-after"])
+        except ValueError:
+            pass
+        if hint is None:
+            resets = [
+                parse_duration(headers.get(f"x-ratelimit-reset-{kind}"))
+                for kind in ("requests", "tokens")
+                if headers.get(f"x-ratelimit-remaining-{kind}") == "0"
+            ]
+            resets = [reset for reset in resets if reset is not None]
+            hint = max(resets) if resets else None
+        if hint is None:
+            return random.uniform(
+                0, min(self.RETRY_MAX_DELAY, self.RETRY_BASE_DELAY * 2**attempt)
+            )
+        return min(self.RETRY_MAX_DELAY, hint) + random.uniform(
+            0, self.RETRY_BASE_DELAY
+        )
+
+    def _request(self, model, estimated_tokens, create):
+        """
+        Calls create once the rate limiter allows a request of estimated_tokens for model, retrying
+        retryable errors. The estimate is settled against the usage of the response.
+        """
+        for attempt in range(self.REQUEST_RETRIES + 1):
+            self._rate_limiter.acquire(model, estimated_tokens)
+            try:
+                with self._model_semaphore(model):
+                    response = create()
+            except self.RETRYABLE_ERRORS as error:
+                self._rate_limiter.settle(model, estimated_tokens, 0)
+                if attempt == self.REQUEST_RETRIES:
+                    raise
+                delay = self._retry_delay(attempt, error)
+                logger.warning(
+                    "Retrying request",
+                    extra={
+                        "model": model,
+                        "attempt": attempt,
+                        "delay": delay,
+                        "error": str(error),
+                    },
+                )
+                time.sleep(delay)
+                continue
+            except Exception:
+                self._rate_limiter.settle(model, estimated_tokens, 0)
+                raise
+            used_tokens = getattr(
+                getattr(response, "usage", None), "total_tokens", None
+            )
+            if isinstance(used_tokens, int):
+                self._rate_limiter.settle(model, estimated_tokens, used_tokens)
+            return response
 
     @observe()
-    def get_embedding(self, article, model="text-embedding-ada-002"):
+    def get_embedding(self, article, model=EMBEDDING_MODEL, tokens=None):
+        """Embeds article, tokens is its token count when the caller already has one."""
         article = article.replace("\n", " ")
+        if self._embedding_cache is not None:
+            cached = self._embedding_cache.get(model, article)
+            if cached is not None:
+                return cached
         try:
             logger.debug("get_embedding")
-            response = self.openai_client.embeddings.create(
-                input=[article],
-                model=model,
+            text, tokens = self._fit_for_embedding(article, model, tokens)
+            response = self._request(
+                model,
+                tokens,
+                lambda: self.openai_client.embeddings.create(
+                    input=[text],
+                    model=model,
+                ),
             )
-            return response.data[0].embedding
+            embedding = response.data[0].embedding
+            if self._embedding_cache is not None:
+                self._embedding_cache.put(model, article, embedding)
+            return embedding
+        except self.RETRYABLE_ERRORS:
+            logger.exception("get_embedding retries exhausted")
+            raise
         except Exception as error:
             logger.exception("get_embedding error")
             return None
 
+    @observe()
+    def get_query_embedding(self, query, model=EMBEDDING_MODEL):
+        """
+        Embeds a search query with the query embedding backend when one is configured, avoiding the request
+        to OpenAI on interactive paths, otherwise with get_embedding.
+        """
+        backend = self._query_embedding_backend
+        if backend is None:
+            return self.get_embedding(query, model)
+        query = query.replace("\n", " ")
+        if self._embedding_cache is not None:
+            cached = self._embedding_cache.get(backend.model, query)
+            if cached is not None:
+                return cached
+        try:
+            embedding = backend.embed([query])[0]
+        except Exception:
+            logger.exception("get_query_embedding error, falling back to openai")
+            return self.get_embedding(query, model)
+        if self._embedding_cache is not None:
+            self._embedding_cache.put(backend.model, query, embedding)
+        return embedding
+
+    def _fit_for_embedding(self, text, model, tokens=None):
+        """
+        Truncates text to the input limit of the embedding model, returning it and its tokens. Without a
+        count, texts whose estimate is within the limit are not encoded and the estimate is returned.
+        """
+        if tokens is None:
+            estimate = self.estimate_tokens(text)
+            if estimate <= self.EMBEDDING_MAX_TOKENS:
+                return text, estimate
+        elif tokens <= self.EMBEDDING_MAX_TOKENS:
+            return text, tokens
+        return self._truncate(text, self.EMBEDDING_MAX_TOKENS, model)
+
+    def _chunk_for_embedding(self, token_counts, max_items, max_tokens):
+        """Groups the indexes of texts into chunks within the limits, skipping texts without a count."""
+        chunks = []
+        chunk = []
+        chunk_tokens = 0
+        for index, tokens in enumerate(token_counts):
+            if tokens is None:
+                continue
+            if chunk and (
+                len(chunk) >= max_items or chunk_tokens + tokens > max_tokens
+            ):
+                chunks.append(chunk)
+                chunk = []
+                chunk_tokens = 0
+            chunk.append(index)
+            chunk_tokens += tokens
+        if chunk:
+            chunks.append(chunk)
+        return chunks
+
+    @observe()
+    def get_embeddings(
+        self,
+        texts,
+        model=EMBEDDING_MODEL,
+        max_items=EMBEDDING_BATCH_SIZE,
+        max_tokens=EMBEDDING_BATCH_TOKENS,
+    ):
+        """
+        Embeds a list of texts in as few requests as the item and token limits allow.
+        Returns embeddings in the order of the input, with None for texts whose chunk failed. Transient errors
+        are retried per chunk by _request.
+        """
+        texts = [text.replace("\n", " ") for text in texts]
+        embeddings = [None] * len(texts)
+        if self._embedding_cache is not None:
+            embeddings = [
+                self._embedding_cache.get(model, text) if text != "" else None
+                for text in texts
+            ]
+        # only non empty texts missing from the cache are sent, counted in one batch
+        uncached = [
+            index
+            for index, (text, embedding) in enumerate(zip(texts, embeddings))
+            if text != "" and embedding is None
+        ]
+        inputs = list(texts)
+        token_counts = [None] * len(texts)
+        counts = self.count_tokens_batch([texts[index] for index in uncached], model)
+        for index, tokens in zip(uncached, counts):
+            inputs[index], token_counts[index] = self._fit_for_embedding(
+                texts[index], model, tokens
+            )
+        chunks = self._chunk_for_embedding(token_counts, max_items, max_tokens)
+        logger.debug(
+            "get_embeddings", extra={"count": len(texts), "chunks": len(chunks)}
+        )
+        for chunk in chunks:
+            try:
+                response = self._request(
+                    model,
+                    sum(token_counts[index] for index in chunk),
+                    lambda: self.openai_client.embeddings.create(
+                        input=[inputs[index] for index in chunk],
+                        model=model,
+                    ),
+                )
+            except Exception:
+                logger.exception(
+                    "get_embeddings error", extra={"chunk_size": len(chunk)}
+                )
+                continue
+            for item in response.data:
+                index = chunk[item.index]
+                embeddings[index] = item.embedding
+                if self._embedding_cache is not None:
+                    self._embedding_cache.put(model, texts[index], item.embedding)
+        return embeddings
+
     @observe()
     def get_completion(
         self,
@@ -70,41 +354,87 @@ class OpenAIClient:
         model=MODEL,
         min_text_length=MIN_TEXT_LENGTH,
         json_response=True,
+        tokens=None,
     ):
+        """Completes query after prompt, tokens is the token count of query when the caller already has one."""
         if len(query) < min_text_length:
             logger.info("query too short")
             return None
-        messages = [
-            {"role": "system", "content": prompt},
-            {"role": "user", "content": query},
-        ]
+        cache_key = None
+        if self._completion_cache is not None:
+            cache_key = self._completion_cache.key(
+                prompt, model, self.TEMPERATURE, query, json_response
+            )
+            cached = self._completion_cache.get(cache_key)
+            if cached is not None:
+                return cached
+        query, input_tokens = self._fit_to_context(prompt, query, model, tokens)
+        estimated_tokens = input_tokens + self.COMPLETION_TOKENS_ESTIMATE
         try:
-            response = None
-            try:
-                response = self.openai_client.chat.completions.create(
-                    model=model,
-                    messages=messages,
-                    temperature=self.TEMPERATURE,
-                    response_format=(
-                        {"type": "json_object"} if json_response else NOT_GIVEN
-                    ),
-                )
-                logger.debug("get_completion response")
-            except Exception as error:
-                logger.exception("get_completion Error")
-                response = error
-            return (
+            response = self._request(
+                model,
+                estimated_tokens,
+                lambda: self.openai_client.chat.completions.create(
+                    **self._completion_request(prompt, query, model, json_response)
+                ),
+            )
+            logger.debug("get_completion response")
+            result = (
                 json.loads(response.choices[0].message.content)
                 if json_response
                 else response.choices[0].message.content
             )
+            if cache_key is not None:
+                self._completion_cache.put(cache_key, model, result)
+            return result
         except json.decoder.JSONDecodeError as error:
             logger.exception("get_completion JSON decoding Error")
             raise LLMResponseException(error)
+        except self.RETRYABLE_ERRORS:
+            # raised rather than dropped, so queued work is retried later
+            logger.exception("get_completion retries exhausted")
+            raise
         except Exception as error:
             logger.exception("get_completion Error")
         return None
 
+    def _fit_to_context(self, prompt, query, model, tokens=None):
+        """
+        Truncates query to fit the context window of model after prompt, returning it and the input tokens,
+        which the rate limiter is charged. Without a count, query is encoded once to be both counted and cut.
+        """
+        prompt_tokens = self.count_tokens(prompt, model)
+        context_window = self.CONTEXT_WINDOW_SIZES.get(model)
+        if context_window is None:
+            if tokens is None:
+                tokens = self.count_tokens(query, model)
+            return query, prompt_tokens + tokens
+        if tokens is None or prompt_tokens + tokens > context_window:
+            query, tokens = self._truncate(query, context_window - prompt_tokens, model)
+        return query, prompt_tokens + tokens
+
+    def _completion_request(self, prompt, query, model, json_response):
+        request = {
+            "model": model,
+            "messages": [
+                {"role": "system", "content": prompt},
+                {"role": "user", "content": query},
+            ],
+            "temperature": self.TEMPERATURE,
+        }
+        if json_response:
+            request["response_format"] = {"type": "json_object"}
+        return request
+
+    def invalidate_completion(self, prompt, query, model=MODEL, json_response=True):
+        if self._completion_cache is None:
+            return
+        self._completion_cache.invalidate(
+            self._completion_cache.key(
+                prompt, model, self.TEMPERATURE, query, json_response
+            )
+        )
+
     @observe()
     def get_article_entities(self, article, article_id, model="gpt-4o-mini"):
         langfuse_context.update_current_trace(
@@ -119,11 +449,13 @@ class OpenAIClient:
         return entities
 
     @observe()
-    def get_article_summarization(self, article, model=MODEL):
+    def get_article_summarization(self, article, model=MODEL, tokens=None):
         if len(article) < self.MIN_TEXT_LENGTH:
             logger.info("article too short")
             return None
-        return self.get_completion(self.ARTICLE_SUMMARY_PROMPT, article, model=model)
+        return self.get_completion(
+            self.ARTICLE_SUMMARY_PROMPT, article, model=model, tokens=tokens
+        )
 
     @observe()
     def get_theme_summarization(self, texts, model=MODEL):
@@ -133,10 +465,221 @@ class OpenAIClient:
             self.THEME_SUMMARY_PROMPT, "\n---\n".join(texts), model=model
         )
 
+    def _encoding(self, model):
+        if model == self.MODEL:
+            return self.ENCODING
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return self.ENCODING
+
     def count_tokens(self, text, model=MODEL):
-        encoding = (
-            self.ENCODING if model == self.MODEL else tiktoken.encoding_for_model(model)
-        )
-        num_tokens = len(encoding.encode(text))
+        # encode_ordinary treats special tokens such as <|endoftext|> in page text as plain text
+        num_tokens = len(self._encoding(model).encode_ordinary(text))
         logger.debug("count_tokens", extra={"num_tokens": num_tokens})
         return num_tokens
+
+    def count_tokens_batch(self, texts, model=MODEL, num_threads=TOKEN_COUNT_THREADS):
+        """Counts the tokens of each text, encoding them across num_threads threads."""
+        tokens = self._encoding(model).encode_ordinary_batch(
+            list(texts), num_threads=num_threads
+        )
+        return [len(text_tokens) for text_tokens in tokens]
+
+    @staticmethod
+    def estimate_tokens(text):
+        """Upper bound of the tokens of text without encoding it, as every token is at least one byte."""
+        return len(text.encode())
+
+    def truncate_to_tokens(self, text, max_tokens, model=MODEL):
+        """Returns text cut to its first max_tokens tokens, texts whose estimate is within it are not encoded."""
+        if self.estimate_tokens(text) <= max_tokens:
+            return text
+        return self._truncate(text, max_tokens, model)[0]
+
+    def _truncate(self, text, max_tokens, model):
+        """Encodes text once, returning it cut to max_tokens tokens and its tokens after the cut."""
+        tokens = self._encoding(model).encode_ordinary(text)
+        if len(tokens) <= max_tokens:
+            return text, len(tokens)
+        logger.info(
+            "Truncating text", extra={"tokens": len(tokens), "max_tokens": max_tokens}
+        )
+        # a token split within a character decodes to a replacement character
+        return (
+            self._encoding(model).decode(tokens[:max_tokens]).rstrip("\ufffd"),
+            max_tokens,
+        )
+
+    def _write_batch_files(self, requests, endpoint, directory):
+        """Writes (custom_id, body) requests as JSONL files within the Batch API limits, returning their paths."""
+        paths = []
+        output = None
+        count = 0
+        size = 0
+        try:
+            for custom_id, body in requests:
+                line = (
+                    json.dumps(
+                        {
+                            "custom_id": custom_id,
+                            "method": "POST",
+                            "url": endpoint,
+                            "body": body,
+                        }
+                    )
+                    + "\n"
+                )
+                line_size = len(line.encode())
+                if (
+                    output is None
+                    or count >= self.BATCH_MAX_REQUESTS
+                    or size + line_size > self.BATCH_MAX_BYTES
+                ):
+                    if output is not None:
+                        output.close()
+                    paths.append(Path(directory) / f"batch_{len(paths)}.jsonl")
+                    output = open(paths[-1], "w")
+                    count = 0
+                    size = 0
+                output.write(line)
+                count += 1
+                size += line_size
+        finally:
+            if output is not None:
+                output.close()
+        return paths
+
+    def run_batch(
+        self, requests, endpoint, directory=None, poll_interval=BATCH_POLL_INTERVAL
+    ):
+        """
+        Runs (custom_id, body) requests to endpoint as Batch API jobs and waits for them to finish,
+        polling every poll_interval seconds. Request files are kept in directory when one is given.
+        Returns response bodies by custom_id, None for requests that failed or did not complete.
+        """
+        requests = list(requests)
+        if len(requests) == 0:
+            return {}
+        with tempfile.TemporaryDirectory() as temporary_directory:
+            paths = self._write_batch_files(
+                requests, endpoint, directory or temporary_directory
+            )
+            batch_ids = [
+                self.batch_runner.submit(path, endpoint, self.BATCH_COMPLETION_WINDOW)
+                for path in paths
+            ]
+        statuses = {}
+        while len(statuses) < len(batch_ids):
+            for batch_id in batch_ids:
+                if batch_id not in statuses:
+                    status = self.batch_runner.status(batch_id)
+                    if status in BatchRunner.TERMINAL_STATUSES:
+                        statuses[batch_id] = status
+            if len(statuses) < len(batch_ids):
+                time.sleep(poll_interval)
+        results = {custom_id: None for custom_id, _ in requests}
+        for batch_id, status in statuses.items():
+            if status == "failed":
+                logger.error("Batch failed", extra={"batch_id": batch_id})
+                continue
+            for line in self.batch_runner.results(batch_id):
+                response = line.get("response")
+                if response is None or response.get("status_code") != 200:
+                    logger.error(
+                        "Batch request failed",
+                        extra={
+                            "batch_id": batch_id,
+                            "custom_id": line.get("custom_id"),
+                            "error": line.get("error"),
+                        },
+                    )
+                    continue
+                results[line["custom_id"]] = response["body"]
+        logger.info(
+            "Batch run complete",
+            extra={
+                "requests": len(requests),
+                "succeeded": sum(body is not None for body in results.values()),
+                "statuses": statuses,
+            },
+        )
+        return results
+
+    def get_article_summarizations_batch(self, articles, model=MODEL, **kwargs):
+        """
+        Summarises article texts by id with the Batch API, for backfills, at a lower cost than
+        get_article_summarization. Returns summaries by id, None for texts that are too short or failed.
+        Results are stored in the completion cache, where get_article_summarization finds them.
+        """
+        summaries = {}
+        cache_keys = {}
+        requests = []
+        for custom_id, text in articles.items():
+            summaries[custom_id] = None
+            if len(text) < self.MIN_TEXT_LENGTH:
+                continue
+            if self._completion_cache is not None:
+                cache_keys[custom_id] = self._completion_cache.key(
+                    self.ARTICLE_SUMMARY_PROMPT, model, self.TEMPERATURE, text, True
+                )
+                summaries[custom_id] = self._completion_cache.get(cache_keys[custom_id])
+                if summaries[custom_id] is not None:
+                    continue
+            text, _ = self._fit_to_context(self.ARTICLE_SUMMARY_PROMPT, text, model)
+            requests.append(
+                (
+                    custom_id,
+                    self._completion_request(
+                        self.ARTICLE_SUMMARY_PROMPT, text, model, True
+                    ),
+                )
+            )
+        results = self.run_batch(requests, self.CHAT_COMPLETIONS_ENDPOINT, **kwargs)
+        for custom_id, body in results.items():
+            if body is None:
+                continue
+            try:
+                summaries[custom_id] = json.loads(
+                    body["choices"][0]["message"]["content"]
+                )
+            except (json.decoder.JSONDecodeError, KeyError, IndexError):
+                logger.exception(
+                    "Batch summarization decoding error", extra={"custom_id": custom_id}
+                )
+                continue
+            if custom_id in cache_keys:
+                self._completion_cache.put(
+                    cache_keys[custom_id], model, summaries[custom_id]
+                )
+        return summaries
+
+    def get_embeddings_batch(self, texts, model=EMBEDDING_MODEL, **kwargs):
+        """
+        Embeds texts by id with the Batch API, for backfills. Returns embeddings by id, None for failed
+        requests, and stores them in the embedding cache.
+        """
+        texts = {
+            custom_id: text.replace("\n", " ") for custom_id, text in texts.items()
+        }
+        embeddings = {}
+        requests = []
+        for custom_id, text in texts.items():
+            embeddings[custom_id] = None
+            if text == "":
+                continue
+            if self._embedding_cache is not None:
+                embeddings[custom_id] = self._embedding_cache.get(model, text)
+                if embeddings[custom_id] is not None:
+                    continue
+            requests.append((custom_id, {"model": model, "input": text}))
+        results = self.run_batch(requests, self.EMBEDDINGS_ENDPOINT, **kwargs)
+        for custom_id, body in results.items():
+            if body is None:
+                continue
+            embeddings[custom_id] = body["data"][0]["embedding"]
+            if self._embedding_cache is not None:
+                self._embedding_cache.put(
+                    model, texts[custom_id], embeddings[custom_id]
+                )
+        return embeddings
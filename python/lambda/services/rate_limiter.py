@@ -0,0 +1,129 @@
+import re
+import time
+from threading import Lock
+from dassie_logger import logger
+
+
+class TokenBucket:
+    """
+    Holds up to capacity units, refilled continuously over a minute. Units may be taken beyond what is held,
+    as long as the bucket could hold them, leaving a debt that delays later takers.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._available = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now):
+        rate = self.capacity / 60
+        self._available = min(
+            self.capacity, self._available + (now - self._updated) * rate
+        )
+        self._updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until amount can be taken, 0 when it can be now."""
+        self._refill(now)
+        needed = min(amount, self.capacity) - self._available
+        return max(0.0, needed / (self.capacity / 60))
+
+    def take(self, amount):
+        self._available -= amount
+
+    def give(self, amount):
+        self._available = min(self.capacity, self._available + amount)
+
+    def update(self, limit, remaining, now):
+        """Trusts the server's view of the limit and of what remains, when it has less than assumed."""
+        self._refill(now)
+        self.capacity = limit
+        self._available = min(self._available, remaining)
+
+
+class RateLimiter:
+    """
+    Request and token buckets per model, shared by the threads using a client. Buckets start at the
+    default limits and follow the x-ratelimit-* headers of responses. Tokens are charged up front from
+    an estimate and corrected by settle once usage is known.
+    Callers that cannot block, such as asyncio tasks, can poll try_acquire and sleep for the wait it returns.
+    """
+
+    DEFAULT_REQUESTS_PER_MINUTE = 500
+    DEFAULT_TOKENS_PER_MINUTE = 200000
+
+    def __init__(
+        self,
+        requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE,
+        tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE,
+    ):
+        self._requests_per_minute = requests_per_minute
+        self._tokens_per_minute = tokens_per_minute
+        self._buckets = {}
+        self._lock = Lock()
+
+    def _model_buckets(self, model):
+        if model not in self._buckets:
+            self._buckets[model] = (
+                TokenBucket(self._requests_per_minute),
+                TokenBucket(self._tokens_per_minute),
+            )
+        return self._buckets[model]
+
+    def try_acquire(self, model, tokens):
+        """Takes a request and tokens for model, returning 0, or the seconds to wait before trying again."""
+        with self._lock:
+            requests, token_bucket = self._model_buckets(model)
+            now = time.monotonic()
+            wait = max(requests.wait_time(1, now), token_bucket.wait_time(tokens, now))
+            if wait == 0:
+                requests.take(1)
+                token_bucket.take(tokens)
+            return wait
+
+    def acquire(self, model, tokens):
+        while True:
+            wait = self.try_acquire(model, tokens)
+            if wait == 0:
+                return
+            logger.debug(
+                "Rate limited", extra={"model": model, "tokens": tokens, "wait": wait}
+            )
+            time.sleep(wait)
+
+    def settle(self, model, estimated_tokens, used_tokens):
+        """Corrects the up front charge of a request by the tokens it used, 0 for requests that failed."""
+        with self._lock:
+            _, token_bucket = self._model_buckets(model)
+            difference = estimated_tokens - used_tokens
+            if difference > 0:
+                token_bucket.give(difference)
+            else:
+                token_bucket.take(-difference)
+
+    def update(self, model, headers):
+        """Updates the buckets of model from the x-ratelimit-limit-* and x-ratelimit-remaining-* headers."""
+        with self._lock:
+            buckets = self._model_buckets(model)
+            now = time.monotonic()
+            for bucket, kind in zip(buckets, ("requests", "tokens")):
+                limit = headers.get(f"x-ratelimit-limit-{kind}")
+                remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+                if limit is None or remaining is None:
+                    continue
+                try:
+                    bucket.update(int(limit), int(remaining), now)
+                except ValueError:
+                    logger.warning(
+                        "Invalid rate limit headers",
+                        extra={"model": model, "limit": limit, "remaining": remaining},
+                    )
+
+
+def parse_duration(value):
+    """Seconds of a duration header such as 6m0s, 1.5s or 20ms, None when it has no such form."""
+    parts = re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", value or "")
+    if len(parts) == 0:
+        return None
+    units = {"h": 3600, "m": 60, "s": 1, "ms": 0.001}
+    return sum(float(amount) * units[unit] for amount, unit in parts)
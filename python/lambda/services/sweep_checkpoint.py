@@ -0,0 +1,36 @@
+import json
+import boto3
+from botocore.exceptions import ClientError
+from dassie_logger import logger
+
+
+class SweepCheckpoint:
+    """
+    Key a paged sweep resumes from in its next invocation, kept in an SSM parameter as JSON,
+    an empty object once a sweep reached its last page.
+    """
+
+    def __init__(self, parameter_name, ssm_client=None):
+        self._parameter_name = parameter_name
+        self._ssm_client = ssm_client or boto3.client("ssm")
+
+    def load(self):
+        try:
+            value = self._ssm_client.get_parameter(Name=self._parameter_name)[
+                "Parameter"
+            ]["Value"]
+            return json.loads(value) or None
+        except (ClientError, json.decoder.JSONDecodeError):
+            logger.exception(
+                "Error loading sweep checkpoint",
+                extra={"parameter_name": self._parameter_name},
+            )
+            return None
+
+    def save(self, key):
+        self._ssm_client.put_parameter(
+            Name=self._parameter_name,
+            Value=json.dumps(key or {}),
+            Type="String",
+            Overwrite=True,
+        )
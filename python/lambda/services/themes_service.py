@@ -1,12 +1,14 @@
 from typing import List
 from urllib.parse import quote_plus
 from dassie_logger import logger
+from sqlalchemy import inspect
 from models.article import Article
 from models.theme import Theme, ThemeType
-from services.openai_client import LLMResponseException, OpenAIClient
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+from services.openai_client import LLMResponseException
 
 CONTEXT_WINDOW_SIZE = 15000
+# get_theme_summarization joins texts with this separator
+TEXT_SEPARATOR = "\n---\n"
 
 
 class ThemesService:
@@ -109,10 +111,12 @@ class ThemesService:
             existing_related_themes = self.theme_repo.get_by_original_titles(
                 related_theme_titles
             )
-            related_theme_titles = set(related_theme_titles) - set(
-                [theme.original_title for theme in existing_related_themes]
+            related_theme_titles = list(
+                set(related_theme_titles)
+                - set([theme.original_title for theme in existing_related_themes])
             )
-            for related_theme_title in related_theme_titles:
+            embeddings = self.openai_client.get_embeddings(related_theme_titles)
+            for related_theme_title, embedding in zip(related_theme_titles, embeddings):
                 related_theme = Theme(
                     related_theme_title,
                     ("Similar to {}" if recurrent else "Dissimilar to {}").format(
@@ -122,6 +126,7 @@ class ThemesService:
                 related_theme.source = (
                     ThemeType.RECURRENT if recurrent else ThemeType.SPORADIC
                 )
+                related_theme.embedding = embedding
                 related_theme = self.theme_repo.upsert(related_theme)
                 existing_related_themes.append(related_theme)
             return existing_related_themes
@@ -129,6 +134,41 @@ class ThemesService:
             logger.exception("build_related_themes Error")
             return []
 
+    def _article_texts(self, articles):
+        """
+        Texts of the articles, in order. Those loaded with their text deferred, as by relationship
+        loads, are fetched in one query rather than a lazy load each.
+        """
+        deferred_ids = [a.id for a in articles if "_text" in inspect(a).unloaded]
+        deferred_texts = (
+            self.article_repo.get_texts(deferred_ids) if len(deferred_ids) > 0 else {}
+        )
+        return [
+            deferred_texts.get(a.id) if a.id in deferred_ids else a.text
+            for a in articles
+        ]
+
+    def _article_tokens(self, article, text):
+        # stored when the article was summarised, counted for articles without one
+        if article.token_count:
+            return article.token_count
+        return self.openai_client.count_tokens(text)
+
+    def _fit_articles(self, texts, token_counts):
+        """Texts that fit the context window, in order, truncating the first that does not."""
+        separator_tokens = self.openai_client.count_tokens(TEXT_SEPARATOR)
+        remaining = CONTEXT_WINDOW_SIZE
+        fitted = []
+        for text, tokens in zip(texts, token_counts):
+            if tokens > remaining:
+                fitted.append(self.openai_client.truncate_to_tokens(text, remaining))
+                break
+            fitted.append(text)
+            remaining -= tokens + separator_tokens
+            if remaining <= 0:
+                break
+        return fitted
+
     def build_theme_from_related_articles(
         self,
         articles: List[Article],
@@ -136,7 +176,9 @@ class ThemesService:
         original_title=None,
         given_embedding=None,
     ):
-        total_tokens = sum([a.token_count for a in articles])
+        texts = self._article_texts(articles)
+        token_counts = [self._article_tokens(a, t) for a, t in zip(articles, texts)]
+        total_tokens = sum(token_counts)
         logger.info(
             "Got articles",
             extra={
@@ -148,30 +190,17 @@ class ThemesService:
         try:
             if total_tokens > CONTEXT_WINDOW_SIZE:
                 logger.debug(
-                    "Recursively splitting articles to fit context window size",
+                    "Truncating articles to fit context window size",
                     extra={
                         "total_tokens": total_tokens,
                         "context_window_size": CONTEXT_WINDOW_SIZE,
                     },
                 )
-                text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
-                    encoding_name=OpenAIClient.ENCODING.name,
-                    chunk_size=CONTEXT_WINDOW_SIZE,
-                    chunk_overlap=0,
-                )
-                texts = text_splitter.create_documents(
-                    ["\n---\n".join([a.text for a in articles])]
-                )
-                logger.debug(
-                    "Recursively split articles", extra={"num_texts": len(texts)}
-                )
-                summary = self.openai_client.get_theme_summarization(
-                    texts[0].page_content
-                )
+                texts = self._fit_articles(texts, token_counts)
+                logger.debug("Truncated articles", extra={"num_texts": len(texts)})
+                summary = self.openai_client.get_theme_summarization(texts)
             elif total_tokens <= CONTEXT_WINDOW_SIZE:
-                summary = self.openai_client.get_theme_summarization(
-                    [a.text for a in articles]
-                )
+                summary = self.openai_client.get_theme_summarization(texts)
             if summary is not None:
                 theme = self.upsert_theme_from_summary(
                     summary,
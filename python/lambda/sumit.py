@@ -75,17 +75,31 @@ def main():
     #         )
     articles = article_repo.get(days=30, limit=400)
     logger.info(f"Found {len(articles)} articles")
+    articles = [article for article in articles if article.summary is None]
+    # one batch job each for embeddings and summaries rather than a request per article
+    texts = {str(article.id): article.text or "" for article in articles}
+    embeddings = openai_client.get_embeddings_batch(texts)
+    summaries = openai_client.get_article_summarizations_batch(texts)
+    # stored counts are reused, the rest are counted in one batch
+    uncounted = [article for article in articles if not article.token_count]
+    token_counts = {str(article.id): article.token_count for article in articles}
+    token_counts.update(
+        zip(
+            [str(article.id) for article in uncounted],
+            openai_client.count_tokens_batch(
+                [texts[str(article.id)] for article in uncounted]
+            ),
+        )
+    )
+    logger.info(f"Embedded and summarised {len(articles)} articles without summaries")
     for article in articles:
-        if article.summary is not None:
-            logger.info(f"Skipping {article.title}")
-            continue
         logger.info(f"Article: {article.title}")
         try:
             article_service._add_llm_summarisation(
                 article,
-                openai_client.get_article_summarization(article.text),
-                openai_client.get_embedding(article.text),
-                openai_client.count_tokens(article.text),
+                summaries[str(article.id)],
+                embeddings[str(article.id)],
+                token_counts[str(article.id)],
             )
         except Exception as error:
             logger.exception(
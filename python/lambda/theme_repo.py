@@ -1,23 +1,27 @@
-from models.models import Association, Browsed, Recurrent, Sporadic
+from models.models import Association, Browsed, Recurrent, Sporadic, ThemeStats
 from models.article import Article
 from models.theme import Theme, ThemeType
 from repos import BasePostgresRepository
 from dassie_logger import logger
 
 
-from sqlalchemy import func
-from sqlalchemy.orm import joinedload
+from sqlalchemy import func, null, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import joinedload, undefer
 from sqlalchemy.orm.exc import NoResultFound
 
-from contextlib import closing
 from datetime import datetime, timedelta
 from typing import List
-from urllib.parse import quote_plus
+from urllib.parse import quote_plus, unquote_plus
 
 
 class ThemeRepository(BasePostgresRepository):
-    def __init__(self, username, password, dbname, db_cluster_endpoint):
-        super().__init__(username, password, dbname, db_cluster_endpoint)
+    def __init__(
+        self, username, password, dbname, db_cluster_endpoint, engine_options=None
+    ):
+        super().__init__(
+            username, password, dbname, db_cluster_endpoint, engine_options
+        )
         self.model = Theme
 
     def get_all(self):
@@ -33,7 +37,18 @@ class ThemeRepository(BasePostgresRepository):
         filter_embedding: List[float] = None,
         threshold: float = 0.8,
         sort_by=None,
+        ef_search: int = BasePostgresRepository.EF_SEARCH,
+        two_phase: bool = False,
+        cursor: str = None,
+        include_sort_key: bool = False,
+        with_stats: bool = False,
     ):
+        """
+        Themes are joined to their association count and last association time, from theme_stats or, for
+        windows it does not keep, a CTE over the associations, so one statement returns them without grouping.
+        With with_stats rows are (theme, association_count, last_associated_at, score), score None without
+        filter_embedding; otherwise themes, or (theme, score) with filter_embedding.
+        """
         logger.debug(
             "get",
             extra={
@@ -44,88 +59,162 @@ class ThemeRepository(BasePostgresRepository):
                 "filter_embedding": filter_embedding,
                 "threshold": threshold,
                 "sort_by": sort_by,
+                "two_phase": two_phase,
             },
         )
-        with closing(self._session()) as session:
-            if recent_browsed_days > 0:
-                articles_ids = (
-                    session.query(Article._id)
-                    .join(Browsed)
-                    .filter(
-                        Browsed._logged_at
-                        > datetime.now() - timedelta(days=recent_browsed_days)
-                    )
-                    .group_by(Article._id)
-                    .all()
+        if sort_by is None:
+            sort_by = "count_association"
+            if filter_embedding is not None:
+                sort_by = "embedding"
+        with self._session_scope() as session:
+
+            def run_query(candidates=None):
+                stats = self._association_stats(
+                    recent_browsed_days, association_days, candidates
                 )
-                articles_ids = [article_id for (article_id,) in articles_ids]
-                query = (
-                    session.query(self.model)
-                    .join(Association)
-                    .filter(Association.article_id.in_(articles_ids))
-                    .group_by(self.model._id)
+
+                score = (
+                    1 - Theme._embedding.cosine_distance(filter_embedding)
+                    if filter_embedding is not None
+                    else null()
                 )
-            else:
-                query = (
-                    session.query(self.model).join(Association).group_by(self.model._id)
-                    if filter_embedding is None
-                    else session.query(
-                        self.model,
-                        1 - Theme._embedding.cosine_distance(filter_embedding),
-                    )
-                    .join(Association)
-                    .group_by(self.model._id)
+                columns = [self.model]
+                if with_stats:
+                    columns += [
+                        stats.c.association_count,
+                        stats.c.last_associated_at,
+                        score.label("score"),
+                    ]
+                elif filter_embedding is not None:
+                    columns.append(score)
+                query = session.query(*columns).join(
+                    stats, stats.c.theme_id == self.model._id
                 )
 
-            if source is not None:
-                query = query.filter(self.model._source.in_(source))
+                if source is not None:
+                    query = query.filter(self.model._source.in_(source))
 
-            if association_days > 0:
-                query = query.filter(
-                    Association.created_at
-                    > datetime.now() - timedelta(days=association_days)
+                if filter_embedding is not None:
+                    query = query.where(
+                        Theme._embedding.cosine_distance(filter_embedding)
+                        < 1 - threshold
+                    )
+                if min_associations > 0:
+                    query = query.where(stats.c.association_count > min_associations)
+                ascending = False
+                if sort_by in ("updated_at", "created_at", "title"):
+                    sort_key = self.model.__dict__["_" + sort_by]
+                elif sort_by == "recently_browsed":
+                    sort_key = stats.c.last_associated_at
+                elif sort_by == "embedding":
+                    sort_key = Theme._embedding.cosine_distance(filter_embedding)
+                    ascending = True
+                else:
+                    sort_key = stats.c.association_count
+                query = self._order_by_keyset(
+                    query,
+                    sort_key,
+                    ascending,
+                    cursor,
+                    include_sort_key=include_sort_key,
                 )
 
-            if filter_embedding is not None:
-                query = query.where(
-                    (1 - Theme._embedding.cosine_distance(filter_embedding)) > threshold
-                )
-            if min_associations > 0:
-                query = query.having(
-                    func.count(Association.article_id) > min_associations
-                )
-            if sort_by is None:
-                sort_by = "count_association"
-                if filter_embedding is not None:
-                    sort_by = "embedding"
-            if sort_by == "count_association":
-                query = query.order_by(func.count(Association.article_id).desc())
-            elif sort_by == "updated_at":
-                query = query.order_by(self.model._updated_at.desc())
-            elif sort_by == "recently_browsed":
-                query = query.order_by(func.max(Association.created_at).desc())
-            elif sort_by == "embedding":
-                query = query.order_by(
-                    (1 - Theme._embedding.cosine_distance(filter_embedding)).desc()
+                # bound parameters are not rendered, embeddings have no literal form
+                logger.debug("get_query", extra={"query": str(query.statement)})
+
+                # run within the session, the ef_search setting is local to its transaction
+                return query.limit(limit).all()
+
+            if filter_embedding is None:
+                return run_query()
+            if two_phase:
+                return self._two_phase_search(
+                    session, run_query, filter_embedding, limit, ef_search
                 )
+            self._set_ef_search(session, ef_search)
+            return run_query()
 
-            logger.debug(
-                "get_query",
-                extra={
-                    "query": query.statement.compile(
-                        compile_kwargs={"literal_binds": True}
-                    )
-                },
+    def _association_stats(self, recent_browsed_days, association_days, candidates):
+        """
+        Association count and last association time per theme, read from theme_stats when it covers
+        the requested windows, otherwise counted from the associations in a CTE. For recently browsed
+        themes both only count associations of recently browsed articles.
+        """
+        recent = recent_browsed_days > 0
+        if association_days == 0 and recent_browsed_days in (
+            0,
+            ThemeStats.RECENT_BROWSE_DAYS,
+        ):
+            stats = select(
+                ThemeStats._theme_id.label("theme_id"),
+                (
+                    ThemeStats._recent_browse_count
+                    if recent
+                    else ThemeStats._association_count
+                ).label("association_count"),
+                (
+                    ThemeStats._recent_last_associated_at
+                    if recent
+                    else ThemeStats._last_associated_at
+                ).label("last_associated_at"),
             )
-
-            return query.limit(limit)
+            if candidates is not None:
+                stats = stats.where(ThemeStats._theme_id.in_(candidates))
+            return stats.subquery("theme_association")
+        associations = select(
+            Association.theme_id.label("theme_id"),
+            func.count(Association.article_id).label("association_count"),
+            func.max(Association.created_at).label("last_associated_at"),
+        )
+        if recent:
+            recently_browsed = (
+                select(Browsed._article_id.label("article_id"))
+                .where(
+                    Browsed._logged_at
+                    > datetime.now() - timedelta(days=recent_browsed_days)
+                )
+                .distinct()
+                .cte("recently_browsed")
+            )
+            associations = associations.join(
+                recently_browsed,
+                recently_browsed.c.article_id == Association.article_id,
+            )
+        if association_days > 0:
+            associations = associations.where(
+                Association.created_at
+                > datetime.now() - timedelta(days=association_days)
+            )
+        if candidates is not None:
+            associations = associations.where(Association.theme_id.in_(candidates))
+        return associations.group_by(Association.theme_id).cte("theme_association")
 
     def add(self, model):
         logger.debug(f"Adding theme {model.title}")
-        return super().add(model)
+        with self._session_scope() as session:
+            session.add(model)
+            session.flush()
+            self._refresh_theme_stats(session, [model.id])
+            self._commit(session)
+            return session.merge(model)
+
+    def update(self, model):
+        # related articles assigned to the theme are written as associations
+        with self._session_scope() as session:
+            detached = session.merge(model)
+            session.flush()
+            self._refresh_theme_stats(session, [detached.id])
+            self._commit(session)
+            return detached
+
+    def refresh_stats(self, theme_ids=None):
+        """Recomputes theme_stats, for every theme when theme_ids is None, so recent browse counts age out."""
+        with self._session_scope() as session:
+            self._refresh_theme_stats(session, theme_ids)
+            self._commit(session)
 
     def get_by_id(self, id):
-        with closing(self._session()) as session:
+        with self._session_scope() as session:
             return (
                 session.query(self.model)
                 .options(
@@ -138,11 +227,12 @@ class ThemeRepository(BasePostgresRepository):
             )
 
     def get_by_title(self, title: str):
-        with closing(self._session()) as session:
+        with self._session_scope() as session:
             logger.debug(f"Retrieving theme {title}")
             theme = (
                 session.query(self.model)
                 .options(
+                    undefer(self.model._embedding),
                     joinedload(self.model._related).selectinload(Article._themes),
                     joinedload(self.model._recurrent),
                     joinedload(self.model._sporadic),
@@ -154,67 +244,94 @@ class ThemeRepository(BasePostgresRepository):
             return theme
 
     def get_by_original_titles(self, original_titles: List[str]):
-        with closing(self._session()) as session:
+        with self._session_scope() as session:
             titles = [quote_plus(title) for title in original_titles]
             return session.query(self.model).filter(self.model._title.in_(titles)).all()
 
     """
-        Adds a new association between an article and a list of themes.
+        Adds associations between an article and a list of themes, creating missing themes.
+        Themes are resolved in one query, missing ones inserted with ON CONFLICT DO NOTHING on the unique
+        title so concurrent writers share a theme, and associations written in one INSERT ... ON CONFLICT DO NOTHING.
 
         Args:
             article (Article): The article to associate with the themes.
             theme_titles (List[str]): A list of theme titles to associate with the article.
 
         Returns:
-            Association: The newly created association.
+            List[Association]: An association per theme, including ones that already existed.
     """
 
     def add_related(self, article: Article, theme_original_titles: List[str]):
-        with closing(self._session()) as session:
-            associations = []
-            for theme_title in theme_original_titles:
-                theme = self.get_by_title(quote_plus(theme_title.lower()))
-                if theme is None:
-                    theme = Theme(theme_title)
-                    theme = self.add(theme)
-                    logger.debug(
-                        "Adding new theme",
-                        extra={"theme": theme.title},
+        with self._session_scope() as session:
+            titles = list(
+                dict.fromkeys(
+                    quote_plus(title.lower()) for title in theme_original_titles
+                )
+            )
+            themes = self._get_by_titles(session, titles)
+            new_titles = [title for title in titles if title not in themes]
+            if len(new_titles) > 0:
+                # a theme another writer creates with the same title meanwhile is kept, and read back below
+                created = session.scalars(
+                    insert(self.model)
+                    .values(
+                        [
+                            self._column_values(Theme(unquote_plus(title)))
+                            for title in new_titles
+                        ]
                     )
-                association = Association(article.id, theme._id)
-                duplicate_association = (
-                    session.query(Association)
-                    .filter(
-                        Association.article_id == article.id,
-                        Association.theme_id == theme._id,
+                    .on_conflict_do_nothing(index_elements=[self.model._title])
+                    .returning(self.model._title)
+                ).all()
+                themes.update(self._get_by_titles(session, new_titles))
+                logger.debug("Adding new themes", extra={"themes": created})
+            associations = [
+                Association(article.id, themes[title]._id) for title in titles
+            ]
+            if len(associations) > 0:
+                session.execute(
+                    insert(Association)
+                    .values(
+                        [
+                            {
+                                "article_id": association.article_id,
+                                "theme_id": association.theme_id,
+                                "created_at": datetime.now(),
+                            }
+                            for association in associations
+                        ]
                     )
-                    .first()
+                    .on_conflict_do_nothing()
                 )
-                if duplicate_association is not None:
-                    associations.append(duplicate_association)
-                    break
-                session.add(association)
-                session.commit()
-                associations.append(association)
-                logger.debug(
-                    "Added association between article and theme",
-                    extra={
-                        "article": article.title,
-                        "theme": theme.title,
-                    },
+                self._refresh_theme_stats(
+                    session, [association.theme_id for association in associations]
                 )
+            self._commit(session)
+            logger.debug(
+                "Added associations between article and themes",
+                extra={"article": article.title, "themes": titles},
+            )
             return associations
 
+    def _get_by_titles(self, session, titles):
+        return {
+            theme.title: theme
+            for theme in session.query(self.model)
+            .filter(self.model._title.in_(titles))
+            .all()
+        }
+
     def del_related(self, article_id, theme):
-        with closing(self._session()) as session:
+        with self._session_scope() as session:
             session.query(Association).filter(
                 Association.article_id == article_id,
                 Association.theme_id == theme.id,
             ).delete()
-            session.commit()
+            self._refresh_theme_stats(session, [theme.id])
+            self._commit(session)
 
     def delete(self, model):
-        with closing(self._session()) as session:
+        with self._session_scope() as session:
             model = session.merge(model)
             model.recurrent = []
             model.sporadic = []
@@ -223,7 +340,7 @@ class ThemeRepository(BasePostgresRepository):
             session.query(Recurrent).filter(Recurrent.related_id == model.id).delete()
             session.query(Sporadic).filter(Sporadic.related_id == model.id).delete()
             session.delete(model)
-            session.commit()
+            self._commit(session)
             session.flush()
 
     def upsert(self, model):
@@ -24,6 +24,9 @@ class PermissionsStack(Stack):
         self.build_article = python_stack.functions["build_articles"]
         self.ddb = infra_stack.ddb
         self.ddb.grant_read_write_data(self.build_article)
+        self.ddb.grant_read_write_data(python_stack.functions["build_articles_stream"])
+        # reads and deletes the navlogs queued by build_articles
+        self.ddb.grant_read_write_data(python_stack.functions["ingest_persist"])
         if dev_env_instance_role_arn is not None:
             self.dev_env_instance_role = aws_iam.Role.from_role_arn(
                 self,
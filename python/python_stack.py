@@ -2,9 +2,11 @@ import json
 from os import path
 import os
 import subprocess
+import sys
 from aws_cdk import Stack, CfnOutput, Duration, TimeZone
 from constructs import Construct
 import aws_cdk.aws_lambda as lambda_
+import aws_cdk.aws_lambda_event_sources as lambda_event_sources
 import aws_cdk.aws_applicationautoscaling as appscaling
 import aws_cdk.aws_apigateway as apigateway
 import aws_cdk.aws_dynamodb as dynamodb
@@ -17,13 +19,30 @@ import datadog_cdk_constructs_v2 as datadog
 import aws_cdk.aws_iam as iam
 import aws_cdk.aws_events as events
 import aws_cdk.aws_events_targets as targets
+import aws_cdk.aws_sqs as sqs
+import aws_cdk.aws_ssm as ssm
 from infra_stack import InfraStack
 from python_dependencies_stack import PythonDependenciesStack
 import aws_cdk.aws_lambda_python_alpha as lambda_python
 
+# the ingestion stages and their batch sizes are defined by the pipeline the functions run
+sys.path.append(path.join(path.dirname(path.abspath(__file__)), "lambda"))
+from services.ingestion_pipeline import IngestionPipeline
+
 ApiGatewayEndpointStackOutput = "ApiEndpoint"
 ApiGatewayDomainStackOutput = "ApiDomain"
 ApiGatewayStageStackOutput = "ApiStage"
+# ingestion stage -> function timeout in minutes
+INGESTION_TIMEOUTS = {
+    IngestionPipeline.PERSIST: 1,
+    IngestionPipeline.SUMMARISE: 5,
+    IngestionPipeline.THEMES: 1,
+    IngestionPipeline.GRAPH: 5,
+}
+# written by ops/fit_embedding_projection.py, relative to python/, copied to /opt in the docker image
+LOCAL_EMBEDDING_PROJECTION_FILE = "local_embedding/projection.npy"
+NAVLOG_STREAM_BATCH_SIZE = 10
+NAVLOG_STREAM_BATCHING_WINDOW_SECONDS = 30
 
 
 class PythonStack(Stack):
@@ -68,11 +87,20 @@ class PythonStack(Stack):
             self.lambdas_env,
         )
 
+        self.create_ingestion_pipeline(self.functions, lambda_function_props)
+        self.create_build_articles_checkpoint(self.functions)
+        self.enable_local_query_embeddings(self.functions)
+        self.connect_navlog_stream(self.functions, infra_stack.ddb)
+
         self.archive_navlog = self.create_archive_function(
             infra_stack.ddb, self.lambdas_env, self.layers[0], architecture
         )
         functions_to_dd_instrument = self.functions.copy()
         del functions_to_dd_instrument["build_articles"]
+        del functions_to_dd_instrument["build_articles_stream"]
+        del functions_to_dd_instrument["search"]
+        for stage in IngestionPipeline.STAGES:
+            del functions_to_dd_instrument[f"ingest_{stage}"]
         functions_to_dd_instrument = list(functions_to_dd_instrument.values())
         functions_to_dd_instrument.append(self.archive_navlog)
         self.instrument_with_datadog(functions_to_dd_instrument)
@@ -164,6 +192,124 @@ class PythonStack(Stack):
             ],
         )
 
+    def create_ingestion_pipeline(self, functions, lambda_function_props):
+        """
+        A queue and function per article ingestion stage, with build_articles feeding the first.
+        Each function runs ingest_stage with the stage in its environment. Failed messages are retried
+        alone, via partial batch responses, and moved to the stage's dead letter queue after
+        IngestionPipeline.MAX_RECEIVE_COUNT receives.
+        """
+        queues = {}
+        for stage in IngestionPipeline.STAGES:
+            name = f"ingest_{stage}"
+            timeout = INGESTION_TIMEOUTS[stage]
+            functions[name] = self.create_lambda_docker_function(
+                name,
+                {**lambda_function_props, "timeout": Duration.minutes(timeout)},
+                handler="ingest_stage",
+            )
+            functions[name].add_environment("INGESTION_STAGE", stage)
+            dead_letter_queue = sqs.Queue(
+                self,
+                f"Ingest{stage.capitalize()}DeadLetterQueue",
+                retention_period=Duration.days(14),
+            )
+            queues[stage] = sqs.Queue(
+                self,
+                f"Ingest{stage.capitalize()}Queue",
+                # six times the function timeout, as recommended for SQS event sources
+                visibility_timeout=Duration.minutes(6 * timeout),
+                dead_letter_queue=sqs.DeadLetterQueue(
+                    max_receive_count=IngestionPipeline.MAX_RECEIVE_COUNT,
+                    queue=dead_letter_queue,
+                ),
+            )
+            functions[name].add_event_source(
+                lambda_event_sources.SqsEventSource(
+                    queues[stage],
+                    batch_size=IngestionPipeline.BATCH_SIZES[stage],
+                    report_batch_item_failures=True,
+                )
+            )
+        producers = ["build_articles", "build_articles_stream"] + [
+            f"ingest_{stage}" for stage in queues
+        ]
+        for stage, queue in queues.items():
+            for name in producers:
+                functions[name].add_environment(
+                    IngestionPipeline.queue_url_variable(stage), queue.queue_url
+                )
+                queue.grant_send_messages(functions[name])
+        return queues
+
+    def create_build_articles_checkpoint(self, functions):
+        """The key an interrupted build_articles sweep resumes from, an empty object when there is none."""
+        checkpoint = ssm.StringParameter(
+            self,
+            "BuildArticlesCheckpoint",
+            string_value="{}",
+            description="navlog key the next build_articles run resumes from",
+        )
+        functions["build_articles"].add_environment(
+            "BUILD_ARTICLES_CHECKPOINT_PARAMETER", checkpoint.parameter_name
+        )
+        checkpoint.grant_read(functions["build_articles"])
+        checkpoint.grant_write(functions["build_articles"])
+        return checkpoint
+
+    def enable_local_query_embeddings(self, functions):
+        """
+        Embeds search queries in process once a projection has been fitted. Only search runs from the docker
+        image with fastembed and the projection, the zip functions keep embedding queries with OpenAI.
+        """
+        if not path.exists(
+            path.join(os.getcwd(), "python", LOCAL_EMBEDDING_PROJECTION_FILE)
+        ):
+            return
+        functions["search"].add_environment(
+            "LOCAL_EMBEDDING_PROJECTION", f"/opt/{LOCAL_EMBEDDING_PROJECTION_FILE}"
+        )
+
+    def connect_navlog_stream(self, functions, ddb):
+        """
+        Builds articles from navlog inserts as they arrive. A failing record is retried with the records
+        after it, then sent to a dead letter queue so the shard moves on, build_articles sweeps it up.
+        """
+        dead_letter_queue = sqs.Queue(
+            self,
+            "NavlogStreamDeadLetterQueue",
+            retention_period=Duration.days(14),
+        )
+        functions["build_articles_stream"].add_event_source(
+            lambda_event_sources.DynamoEventSource(
+                ddb,
+                starting_position=lambda_.StartingPosition.LATEST,
+                batch_size=NAVLOG_STREAM_BATCH_SIZE,
+                max_batching_window=Duration.seconds(
+                    NAVLOG_STREAM_BATCHING_WINDOW_SECONDS
+                ),
+                report_batch_item_failures=True,
+                bisect_batch_on_error=True,
+                retry_attempts=3,
+                max_record_age=Duration.days(1),
+                on_failure=lambda_event_sources.SqsDlq(dead_letter_queue),
+                filters=[
+                    lambda_.FilterCriteria.filter(
+                        {
+                            "eventName": lambda_.FilterRule.is_equal("INSERT"),
+                            "dynamodb": {
+                                "NewImage": {
+                                    "type": {
+                                        "S": lambda_.FilterRule.is_equal("content")
+                                    }
+                                }
+                            },
+                        }
+                    )
+                ],
+            )
+        )
+
     def _get_lambdas(
         self,
         lambda_function_props,
@@ -177,6 +323,10 @@ class PythonStack(Stack):
                 "build_articles",
                 {**lambda_function_props, "timeout": Duration.minutes(5)},
             ),
+            "build_articles_stream": self.create_lambda_docker_function(
+                "build_articles_stream",
+                {**lambda_function_props, "timeout": Duration.minutes(5)},
+            ),
             "build_themes": self.create_lambda_function(
                 "build_themes",
                 {**lambda_function_props, "timeout": Duration.seconds(120)},
@@ -213,7 +363,8 @@ class PythonStack(Stack):
                 "del_related",
                 lambda_function_props,
             ),
-            "search": self.create_lambda_function(
+            # docker, for fastembed and its model, see enable_local_query_embeddings
+            "search": self.create_lambda_docker_function(
                 "search",
                 lambda_function_props,
             ),
@@ -248,10 +399,12 @@ class PythonStack(Stack):
         self,
         function_name,
         lambda_function_props,
+        handler=None,
     ):
+        """handler names the module of the lambda_handler, the function name by default."""
         lambda_function_props["environment"][
             "DD_LAMBDA_HANDLER"
-        ] = f"{function_name.lower()}.lambda_handler"
+        ] = f"{(handler or function_name).lower()}.lambda_handler"
         lambda_function = lambda_.DockerImageFunction(
             self,
             function_name,
@@ -385,7 +538,8 @@ class PythonStack(Stack):
             ),
             billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
             time_to_live_attribute="ttl",
-            stream=dynamodb.StreamViewType.OLD_IMAGE,  # Enable DynamoDB Streams
+            # new images for build_articles_stream, old ones for archive_navlog
+            stream=dynamodb.StreamViewType.NEW_AND_OLD_IMAGES,
         )
         ddb.add_global_secondary_index(
             partition_key=dynamodb.Attribute(
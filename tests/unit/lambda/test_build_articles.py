@@ -5,6 +5,7 @@ from datetime import datetime, timedelta
 import pytest
 from build_articles import lambda_handler
 from models.article import Article
+from services.ingestion_pipeline import IngestionPipeline
 
 
 @pytest.fixture(scope="function")
@@ -14,7 +15,9 @@ def navlog_service():
 
 @pytest.fixture(scope="function")
 def mock_context():
-    return MagicMock()
+    context = MagicMock()
+    context.get_remaining_time_in_millis.return_value = 900000
+    return context
 
 
 @pytest.fixture(scope="function")
@@ -73,7 +76,7 @@ def test_build_articles_success(
         "title": "Test Title",
         "tabId": "123",
     }
-    navlog_service.get_content_navlogs.return_value = [navlog]
+    navlog_service.iter_content_navlog_pages.return_value = [([navlog], None)]
     new_article = Article(
         navlog["title"], navlog["url"], navlog["body_text"], navlog["created_at"]
     )
@@ -83,7 +86,7 @@ def test_build_articles_success(
     new_article._updated_at = datetime.strptime(
         navlog["created_at"], "%Y-%m-%dT%H:%M:%S.%f"
     )
-    article_repo.get_or_insert.return_value = new_article
+    article_repo.upsert_by_url.return_value = new_article
     neptune_client.get_article_graph.return_value = []
     response = lambda_handler(
         event,
@@ -123,7 +126,7 @@ def test_build_articles_skip_short_text(
         "url": "https://example.com",
         "created_at": datetime.now().strftime("%Y-%m-%dT%H:%M:%S.%f"),
     }
-    navlog_service.get_content_navlogs.return_value = [navlog]
+    navlog_service.iter_content_navlog_pages.return_value = [([navlog], None)]
 
     response = lambda_handler(
         event,
@@ -162,7 +165,7 @@ def test_build_articles_skip_old_navlog(
         "url": "https://example.com",
         "created_at": old_date,
     }
-    navlog_service.get_content_navlogs.return_value = [navlog]
+    navlog_service.iter_content_navlog_pages.return_value = [([navlog], None)]
 
     response = lambda_handler(
         event,
@@ -200,8 +203,8 @@ def test_build_articles_error_handling(
         "url": "https://example.com",
         "created_at": datetime.now().strftime("%Y-%m-%dT%H:%M:%S.%f"),
     }
-    navlog_service.get_content_navlogs.return_value = [navlog]
-    article_repo.get_or_insert.side_effect = Exception("Test error")
+    navlog_service.iter_content_navlog_pages.return_value = [([navlog], None)]
+    article_repo.upsert_by_url.side_effect = Exception("Test error")
 
     response = lambda_handler(
         event,
@@ -223,3 +226,233 @@ def test_build_articles_error_handling(
     body = json.loads(response["body"])
     assert str(body["message"]) == "Articles processed successfully"
     assert str(body["errors"]) == "1"
+
+
+def test_build_articles_processes_navlogs_concurrently(
+    navlog_service,
+    mock_context,
+    article_repo,
+    theme_repo,
+    browse_repo,
+    browsed_repo,
+    openai_client,
+    neptune_client,
+    opencypher_translator_client,
+):
+    event = {}
+    navlogs = [
+        {
+            "body_text": "This is a test body text that is long enough to be processed. this must be longer than 100 characters",
+            "url": f"https://example.com/{i}",
+            "created_at": datetime.now().strftime("%Y-%m-%dT%H:%M:%S.%f"),
+            "id": str(i),
+            "title": f"Test Title {i}",
+            "tabId": "123",
+        }
+        for i in range(4)
+    ]
+    navlog_service.iter_content_navlog_pages.return_value = [(navlogs, None)]
+
+    def get_or_insert(article):
+        if article.url.endswith("/2"):
+            raise Exception("Test error")
+        article._created_at = datetime.now()
+        article._updated_at = datetime.now()
+        return article
+
+    article_repo.upsert_by_url.side_effect = get_or_insert
+    neptune_client.get_article_graph.return_value = []
+    openai_client.get_article_entities.return_value = "entities"
+    opencypher_translator_client.generate_article_graph.return_value = "graph"
+    response = lambda_handler(
+        event,
+        mock_context,
+        navlog_service=navlog_service,
+        article_repo=article_repo,
+        theme_repo=theme_repo,
+        browse_repo=browse_repo,
+        browsed_repo=browsed_repo,
+        openai_client=openai_client,
+        neptune_client=neptune_client,
+        opencypher_translator_client=opencypher_translator_client,
+        max_workers=3,
+        useGlobal=False,
+    )
+
+    assert response["statusCode"] == 207
+    body = json.loads(response["body"])
+    assert body["processed"] == 4
+    assert body["errors"] == 1
+    assert "navlogs_per_minute" in body
+    assert navlog_service.delete_navlog.call_count == 3
+    assert opencypher_translator_client.generate_article_graph.call_count == 3
+
+
+def test_build_articles_returns_next_key_when_time_runs_out(
+    navlog_service,
+    mock_context,
+    article_repo,
+    theme_repo,
+    browse_repo,
+    browsed_repo,
+    openai_client,
+    neptune_client,
+    opencypher_translator_client,
+):
+    event = {"startKey": {"id": "0"}}
+    pages = [
+        ([{"id": "1", "body_text": "short"}], {"id": "1"}),
+        ([{"id": "2", "body_text": "short"}], {"id": "2"}),
+    ]
+    navlog_service.iter_content_navlog_pages.return_value = iter(pages)
+    mock_context.get_remaining_time_in_millis.return_value = 1000
+    response = lambda_handler(
+        event,
+        mock_context,
+        navlog_service=navlog_service,
+        article_repo=article_repo,
+        theme_repo=theme_repo,
+        browse_repo=browse_repo,
+        browsed_repo=browsed_repo,
+        openai_client=openai_client,
+        neptune_client=neptune_client,
+        opencypher_translator_client=opencypher_translator_client,
+        useGlobal=False,
+    )
+
+    assert response["statusCode"] == 200
+    body = json.loads(response["body"])
+    assert body["nextKey"] == {"id": "1"}
+    assert body["skipped"] == 1
+    kwargs = navlog_service.iter_content_navlog_pages.call_args.kwargs
+    assert kwargs["start_key"] == {"id": "0"}
+    assert kwargs["min_body_length"] == 100
+    assert kwargs["with_url"]
+    assert kwargs["created_after"] < datetime.now() - timedelta(days=1)
+    assert kwargs["enqueued_before"] is None
+
+
+def test_build_articles_queues_navlogs_for_pipeline(
+    navlog_service,
+    mock_context,
+    article_repo,
+    theme_repo,
+    browse_repo,
+    browsed_repo,
+    openai_client,
+    neptune_client,
+    opencypher_translator_client,
+):
+    navlog = {
+        "body_text": "This is a test body text that is long enough to be processed. this must be longer than 100 characters",
+        "url": "https://example.com",
+        "created_at": datetime.now().strftime("%Y-%m-%dT%H:%M:%S.%f"),
+        "id": "123",
+    }
+    navlog_service.iter_content_navlog_pages.return_value = [
+        ([navlog, {"id": "456", "body_text": "short"}], None)
+    ]
+    ingestion_pipeline = MagicMock()
+    response = lambda_handler(
+        {},
+        mock_context,
+        navlog_service=navlog_service,
+        article_repo=article_repo,
+        theme_repo=theme_repo,
+        browse_repo=browse_repo,
+        browsed_repo=browsed_repo,
+        openai_client=openai_client,
+        neptune_client=neptune_client,
+        opencypher_translator_client=opencypher_translator_client,
+        ingestion_pipeline=ingestion_pipeline,
+        useGlobal=False,
+    )
+
+    assert response["statusCode"] == 200
+    body = json.loads(response["body"])
+    assert body["processed"] == 1
+    assert body["skipped"] == 1
+    ingestion_pipeline.enqueue_navlogs.assert_called_once_with(["123"])
+    # navlogs still queued are left out of the sweep
+    kwargs = navlog_service.iter_content_navlog_pages.call_args.kwargs
+    assert kwargs["enqueued_before"] < datetime.now() - timedelta(
+        hours=IngestionPipeline.REQUEUE_AFTER_HOURS - 1
+    )
+    article_repo.upsert_by_url.assert_not_called()
+    navlog_service.delete_navlog.assert_not_called()
+
+
+def test_build_articles_resumes_from_saved_checkpoint(
+    navlog_service,
+    mock_context,
+    article_repo,
+    theme_repo,
+    browse_repo,
+    browsed_repo,
+    openai_client,
+    neptune_client,
+    opencypher_translator_client,
+):
+    sweep_checkpoint = MagicMock()
+    sweep_checkpoint.load.return_value = {"id": "0"}
+    navlog_service.iter_content_navlog_pages.return_value = iter(
+        [
+            ([{"id": "1", "body_text": "short"}], {"id": "1"}),
+            ([{"id": "2", "body_text": "short"}], {"id": "2"}),
+        ]
+    )
+    mock_context.get_remaining_time_in_millis.return_value = 1000
+
+    lambda_handler(
+        {},
+        mock_context,
+        navlog_service=navlog_service,
+        article_repo=article_repo,
+        theme_repo=theme_repo,
+        browse_repo=browse_repo,
+        browsed_repo=browsed_repo,
+        openai_client=openai_client,
+        neptune_client=neptune_client,
+        opencypher_translator_client=opencypher_translator_client,
+        sweep_checkpoint=sweep_checkpoint,
+        useGlobal=False,
+    )
+
+    kwargs = navlog_service.iter_content_navlog_pages.call_args.kwargs
+    assert kwargs["start_key"] == {"id": "0"}
+    sweep_checkpoint.save.assert_called_once_with({"id": "1"})
+
+
+def test_build_articles_clears_checkpoint_after_last_page(
+    navlog_service,
+    mock_context,
+    article_repo,
+    theme_repo,
+    browse_repo,
+    browsed_repo,
+    openai_client,
+    neptune_client,
+    opencypher_translator_client,
+):
+    sweep_checkpoint = MagicMock()
+    sweep_checkpoint.load.return_value = {"id": "0"}
+    navlog_service.iter_content_navlog_pages.return_value = [
+        ([{"id": "1", "body_text": "short"}], None)
+    ]
+
+    lambda_handler(
+        {},
+        mock_context,
+        navlog_service=navlog_service,
+        article_repo=article_repo,
+        theme_repo=theme_repo,
+        browse_repo=browse_repo,
+        browsed_repo=browsed_repo,
+        openai_client=openai_client,
+        neptune_client=neptune_client,
+        opencypher_translator_client=opencypher_translator_client,
+        sweep_checkpoint=sweep_checkpoint,
+        useGlobal=False,
+    )
+
+    sweep_checkpoint.save.assert_called_once_with(None)
@@ -0,0 +1,170 @@
+from datetime import datetime
+from unittest.mock import MagicMock
+
+import pytest
+from build_articles_stream import lambda_handler
+
+BODY_TEXT = "This is a test body text that is long enough to be processed. this must be longer than 100 characters"
+
+
+def stream_record(navlog_id, sequence_number, event_name="INSERT"):
+    return {
+        "eventName": event_name,
+        "dynamodb": {
+            "Keys": {"id": {"S": navlog_id}},
+            "SequenceNumber": sequence_number,
+        },
+    }
+
+
+def navlog(navlog_id, **attributes):
+    return {
+        "id": navlog_id,
+        "type": "content",
+        "title": "Test Title",
+        "url": f"https://example.com/{navlog_id}",
+        "body_text": BODY_TEXT,
+        "created_at": datetime.now().strftime("%Y-%m-%dT%H:%M:%S.%f"),
+        "tabId": "123",
+        **attributes,
+    }
+
+
+@pytest.fixture
+def navlog_service():
+    return MagicMock()
+
+
+def upsert_by_url(article):
+    # a current article, so only its graph is checked
+    article._summary = "summary"
+    article._created_at = datetime.now()
+    article._updated_at = datetime.now()
+    return article
+
+
+@pytest.fixture
+def article_repo():
+    repo = MagicMock()
+    repo.upsert_by_url.side_effect = upsert_by_url
+    return repo
+
+
+def handle(event, navlog_service, article_repo, browsed_repo=None, **kwargs):
+    return lambda_handler(
+        event,
+        MagicMock(),
+        navlog_service=navlog_service,
+        article_repo=article_repo,
+        theme_repo=MagicMock(),
+        browse_repo=MagicMock(),
+        browsed_repo=browsed_repo or MagicMock(),
+        openai_client=MagicMock(),
+        neptune_client=MagicMock(),
+        opencypher_translator_client=MagicMock(),
+        useGlobal=False,
+        **kwargs,
+    )
+
+
+def test_stream_builds_inserted_navlogs(navlog_service, article_repo):
+    navlogs = {"1": navlog("1"), "2": navlog("2", body_text="short")}
+    navlog_service.get_stream_navlog.side_effect = lambda record: navlogs[
+        record["dynamodb"]["Keys"]["id"]["S"]
+    ]
+    event = {
+        "Records": [
+            stream_record("1", "100"),
+            stream_record("2", "101"),
+            stream_record("3", "102", event_name="REMOVE"),
+        ]
+    }
+
+    response = handle(event, navlog_service, article_repo)
+
+    assert response == {"batchItemFailures": []}
+    assert navlog_service.get_stream_navlog.call_count == 2
+    article_repo.upsert_by_url.assert_called_once()
+    navlog_service.delete_navlog.assert_called_once_with("1")
+
+
+def test_stream_fails_only_bad_records(navlog_service, article_repo):
+    navlogs = {"1": navlog("1"), "2": navlog("2")}
+    navlog_service.get_stream_navlog.side_effect = lambda record: navlogs[
+        record["dynamodb"]["Keys"]["id"]["S"]
+    ]
+
+    def failing_upsert_by_url(article):
+        if article.url.endswith("/2"):
+            raise Exception("Test error")
+        return upsert_by_url(article)
+
+    article_repo.upsert_by_url.side_effect = failing_upsert_by_url
+    event = {"Records": [stream_record("1", "100"), stream_record("2", "101")]}
+
+    response = handle(event, navlog_service, article_repo)
+
+    assert response == {"batchItemFailures": [{"itemIdentifier": "101"}]}
+    navlog_service.delete_navlog.assert_called_once_with("1")
+
+
+def test_stream_queues_navlogs_for_pipeline(navlog_service, article_repo):
+    navlog_service.get_stream_navlog.return_value = navlog("1")
+    ingestion_pipeline = MagicMock()
+
+    response = handle(
+        {"Records": [stream_record("1", "100")]},
+        navlog_service,
+        article_repo,
+        ingestion_pipeline=ingestion_pipeline,
+    )
+
+    assert response == {"batchItemFailures": []}
+    ingestion_pipeline.enqueue_navlogs.assert_called_once_with(["1"])
+    article_repo.upsert_by_url.assert_not_called()
+
+
+def test_stream_replay_skips_processed_navlogs(navlog_service, article_repo):
+    navlogs = {"1": navlog("1"), "2": navlog("2"), "3": navlog("3")}
+    navlog_service.get_stream_navlog.side_effect = lambda record: navlogs.get(
+        record["dynamodb"]["Keys"]["id"]["S"]
+    )
+    navlog_service.delete_navlog.side_effect = lambda navlog_id: navlogs.pop(navlog_id)
+    browsed_repo = MagicMock()
+
+    failed = set()
+
+    def failing_once_upsert_by_url(article):
+        if article.url.endswith("/2") and article.url not in failed:
+            failed.add(article.url)
+            raise Exception("Test error")
+        return upsert_by_url(article)
+
+    article_repo.upsert_by_url.side_effect = failing_once_upsert_by_url
+    event = {
+        "Records": [
+            stream_record("1", "100"),
+            stream_record("2", "101"),
+            stream_record("3", "102"),
+        ]
+    }
+
+    first = handle(event, navlog_service, article_repo, browsed_repo=browsed_repo)
+    # the stream retries from the earliest failed record
+    replayed = {"Records": event["Records"][1:]}
+    second = handle(replayed, navlog_service, article_repo, browsed_repo=browsed_repo)
+
+    assert first == {"batchItemFailures": [{"itemIdentifier": "101"}]}
+    assert second == {"batchItemFailures": []}
+    assert navlogs == {}
+    # navlog 3 succeeded in the first invocation and is not built or tracked again
+    upserted_urls = [
+        call.args[0].url for call in article_repo.upsert_by_url.call_args_list
+    ]
+    assert sorted(upserted_urls) == [
+        "https://example.com/1",
+        "https://example.com/2",
+        "https://example.com/2",
+        "https://example.com/3",
+    ]
+    assert browsed_repo.upsert_by_browse_and_article.call_count == 3
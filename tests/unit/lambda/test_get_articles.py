@@ -9,6 +9,7 @@ from models.article import Article
 @pytest.fixture(scope="function")
 def article_repo():
     article_repo = MagicMock()
+    article_repo.get_page.return_value = ([], None)
     return article_repo
 
 
@@ -91,7 +92,10 @@ def test_get_articles_with_invalid_query_params(
 
 def test_get_articles_with_no_query_params(article_repo, openai_client, mock_context):
     event = {"path": "/articles"}
-    article_repo.get.return_value = [Article("test article", "https://bob.com")]
+    article_repo.get_page.return_value = (
+        [Article("test article", "https://bob.com")],
+        None,
+    )
     response = lambda_handler(
         event,
         mock_context,
@@ -107,7 +111,7 @@ def test_get_articles_with_no_query_params(article_repo, openai_client, mock_con
 
 def test_get_articles_with_database_error(article_repo, openai_client, mock_context):
     event = {"path": "/articles"}
-    article_repo.get.side_effect = Exception("Database connection error")
+    article_repo.get_page.side_effect = Exception("Database connection error")
     response = lambda_handler(
         event,
         mock_context,
@@ -125,7 +129,10 @@ def test_get_articles_with_sort_order(article_repo, openai_client, mock_context)
         "queryStringParameters": {"sortField": "created_at", "sortOrder": "ASC"},
         "path": "/articles",
     }
-    article_repo.get.return_value = [Article("test article", "https://example.com")]
+    article_repo.get_page.return_value = (
+        [Article("test article", "https://example.com")],
+        None,
+    )
     response = lambda_handler(
         event,
         mock_context,
@@ -134,12 +141,15 @@ def test_get_articles_with_sort_order(article_repo, openai_client, mock_context)
         useGlobal=False,
     )
     assert response["statusCode"] == 200
-    article_repo.get.assert_called_with(
-        limit=10,
+    article_repo.get_page.assert_called_with(
+        10,
+        cursor=None,
         sort_by="created_at",
         descending=False,
         filter_embedding=None,
         min_token_count=0,
+        projection=True,
+        snippet_length=0,
     )
 
 
@@ -181,7 +191,10 @@ def test_get_articles_with_invalid_sort_field(
 
 def test_get_articles_with_default_params(article_repo, openai_client, mock_context):
     event = {"path": "/articles", "queryStringParameters": None}
-    article_repo.get.return_value = [Article("test article", "https://example.com")]
+    article_repo.get_page.return_value = (
+        [Article("test article", "https://example.com")],
+        None,
+    )
     response = lambda_handler(
         event,
         mock_context,
@@ -190,18 +203,21 @@ def test_get_articles_with_default_params(article_repo, openai_client, mock_cont
         useGlobal=False,
     )
     assert response["statusCode"] == 200
-    article_repo.get.assert_called_with(
-        limit=10,
+    article_repo.get_page.assert_called_with(
+        10,
+        cursor=None,
         sort_by="updated_at",
         descending=True,
         filter_embedding=None,
         min_token_count=0,
+        projection=True,
+        snippet_length=0,
     )
 
 
 def test_get_articles_empty_result(article_repo, openai_client, mock_context):
     event = {"path": "/articles"}
-    article_repo.get.return_value = []
+    article_repo.get_page.return_value = ([], None)
     response = lambda_handler(
         event,
         mock_context,
@@ -216,7 +232,7 @@ def test_get_articles_empty_result(article_repo, openai_client, mock_context):
 def test_get_articles_with_filter_embedding(article_repo, openai_client, mock_context):
     event = {"path": "/articles"}
     test_article = Article("test article", "https://example.com")
-    article_repo.get.return_value = [test_article]
+    article_repo.get_page.return_value = ([test_article], None)
     response = lambda_handler(
         event,
         mock_context,
@@ -225,7 +241,7 @@ def test_get_articles_with_filter_embedding(article_repo, openai_client, mock_co
         useGlobal=False,
     )
     assert response["statusCode"] == 200
-    assert response["body"] == f"[{test_article.json()}]"
+    assert response["body"] == f"[{test_article.json(include_text=False)}]"
 
 
 def test_get_articles_by_browse(article_repo, openai_client, mock_context):
@@ -234,7 +250,49 @@ def test_get_articles_by_browse(article_repo, openai_client, mock_context):
         "queryStringParameters": {"sortField": "browse"},
     }
     test_article = Article("test article", "https://example.com")
-    article_repo.get.return_value = [test_article]
+    article_repo.get_page.return_value = ([test_article], None)
+    response = lambda_handler(
+        event,
+        mock_context,
+        article_repo=article_repo,
+        openai_client=openai_client,
+        useGlobal=False,
+    )
+    assert response["statusCode"] == 200
+    assert response["body"] == f"[{test_article.json(include_text=False)}]"
+
+
+def test_get_articles_with_snippet(article_repo, openai_client, mock_context):
+    event = {
+        "queryStringParameters": {"snippet": "200"},
+        "path": "/articles",
+    }
+    test_article = Article("test article", "https://example.com", text="full text")
+    test_article._snippet = "full"
+    article_repo.get_page.return_value = ([test_article], None)
+    response = lambda_handler(
+        event,
+        mock_context,
+        article_repo=article_repo,
+        openai_client=openai_client,
+        useGlobal=False,
+    )
+    assert response["statusCode"] == 200
+    assert article_repo.get_page.call_args.kwargs["snippet_length"] == 200
+    body = json.loads(response["body"])
+    assert body[0]["snippet"] == "full"
+    assert "text" not in body[0]
+
+
+def test_get_articles_returns_next_cursor(article_repo, openai_client, mock_context):
+    event = {
+        "queryStringParameters": {"max": "1", "cursor": "previous"},
+        "path": "/articles",
+    }
+    article_repo.get_page.return_value = (
+        [Article("test article", "https://example.com")],
+        "next",
+    )
     response = lambda_handler(
         event,
         mock_context,
@@ -243,4 +301,34 @@ def test_get_articles_by_browse(article_repo, openai_client, mock_context):
         useGlobal=False,
     )
     assert response["statusCode"] == 200
-    assert response["body"] == f"[{test_article.json()}]"
+    assert article_repo.get_page.call_args.kwargs["cursor"] == "previous"
+    assert response["headers"]["X-Next-Cursor"] == "next"
+    assert response["headers"]["Access-Control-Expose-Headers"] == "X-Next-Cursor"
+    assert len(json.loads(response["body"])) == 1
+
+
+def test_get_articles_last_page_has_no_cursor(
+    article_repo, openai_client, mock_context
+):
+    response = lambda_handler(
+        {"path": "/articles"},
+        mock_context,
+        article_repo=article_repo,
+        openai_client=openai_client,
+        useGlobal=False,
+    )
+    assert response["statusCode"] == 200
+    assert "X-Next-Cursor" not in response["headers"]
+
+
+def test_get_articles_with_invalid_cursor(article_repo, openai_client, mock_context):
+    article_repo.get_page.side_effect = ValueError("Invalid cursor")
+    response = lambda_handler(
+        {"path": "/articles", "queryStringParameters": {"cursor": "bad"}},
+        mock_context,
+        article_repo=article_repo,
+        openai_client=openai_client,
+        useGlobal=False,
+    )
+    assert response["statusCode"] == 400
+    assert response["body"]["message"] == "Invalid cursor"
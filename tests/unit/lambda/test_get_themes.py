@@ -1,8 +1,10 @@
+from datetime import datetime
+import json
 from unittest.mock import MagicMock
 import pytest
 from get_themes import lambda_handler
 
-from models.theme import ThemeType
+from models.theme import Theme, ThemeType
 
 
 @pytest.fixture
@@ -12,7 +14,9 @@ def mock_context():
 
 @pytest.fixture
 def theme_repo():
-    return MagicMock()
+    theme_repo = MagicMock()
+    theme_repo.get_page.return_value = ([], None)
+    return theme_repo
 
 
 @pytest.fixture(scope="function")
@@ -80,12 +84,14 @@ def test_get_themes_with_params(theme_repo, openai_client, mock_context):
         useGlobal=False,
     )
     assert response["statusCode"] == 200
-    theme_repo.get.assert_called_with(
+    theme_repo.get_page.assert_called_with(
         20,
-        [ThemeType.TOP],  # default is TOP
+        cursor=None,
+        source=[ThemeType.TOP],  # default is TOP
         filter_embedding=None,
         sort_by="count_association",
         recent_browsed_days=0,
+        with_stats=True,
     )
     response = lambda_handler(
         {
@@ -98,12 +104,14 @@ def test_get_themes_with_params(theme_repo, openai_client, mock_context):
         useGlobal=False,
     )
     assert response["statusCode"] == 200
-    theme_repo.get.assert_called_with(
+    theme_repo.get_page.assert_called_with(
         20,
-        [ThemeType.TOP],  # default is TOP
+        cursor=None,
+        source=[ThemeType.TOP],  # default is TOP
         filter_embedding=None,
         sort_by="updated_at",
         recent_browsed_days=0,
+        with_stats=True,
     )
     response = lambda_handler(
         {
@@ -118,12 +126,14 @@ def test_get_themes_with_params(theme_repo, openai_client, mock_context):
     assert (
         response["statusCode"] == 200
     ), "should be able to get themes by recently browsed"
-    theme_repo.get.assert_called_with(
+    theme_repo.get_page.assert_called_with(
         20,
-        [ThemeType.TOP],  # default is TOP
+        cursor=None,
+        source=[ThemeType.TOP],  # default is TOP
         filter_embedding=None,
         sort_by="recently_browsed",
         recent_browsed_days=14,
+        with_stats=True,
     )
     response = lambda_handler(
         {
@@ -139,12 +149,14 @@ def test_get_themes_with_params(theme_repo, openai_client, mock_context):
         openai_client,
         useGlobal=False,
     )
-    theme_repo.get.assert_called_with(
+    theme_repo.get_page.assert_called_with(
         2,
-        [ThemeType.CUSTOM],
+        cursor=None,
+        source=[ThemeType.CUSTOM],
         filter_embedding=None,
         sort_by="updated_at",
         recent_browsed_days=0,
+        with_stats=True,
     )
     assert response["statusCode"] == 200
     response = lambda_handler(
@@ -161,11 +173,48 @@ def test_get_themes_with_params(theme_repo, openai_client, mock_context):
         openai_client,
         useGlobal=False,
     )
-    theme_repo.get.assert_called_with(
+    theme_repo.get_page.assert_called_with(
         2,
-        [ThemeType.CUSTOM, ThemeType.TOP],
+        cursor=None,
+        source=[ThemeType.CUSTOM, ThemeType.TOP],
         filter_embedding=None,
         sort_by="updated_at",
         recent_browsed_days=0,
+        with_stats=True,
+    )
+    assert response["statusCode"] == 200
+
+
+def test_get_themes_with_cursor(theme_repo, openai_client, mock_context):
+    theme_repo.get_page.return_value = ([], "next")
+    response = lambda_handler(
+        {"path": "/themes", "queryStringParameters": {"cursor": "previous"}},
+        mock_context,
+        theme_repo,
+        openai_client,
+        useGlobal=False,
+    )
+    assert response["statusCode"] == 200
+    assert theme_repo.get_page.call_args.kwargs["cursor"] == "previous"
+    assert response["headers"]["X-Next-Cursor"] == "next"
+
+
+def test_get_themes_includes_aggregates(theme_repo, openai_client, mock_context):
+    theme = Theme(original_title="Test Theme")
+    theme_repo.get_page.return_value = (
+        [(theme, 5, datetime(2024, 5, 1, 12, 0), None)],
+        None,
+    )
+    response = lambda_handler(
+        {"path": "/themes"},
+        mock_context,
+        theme_repo,
+        openai_client,
+        useGlobal=False,
     )
     assert response["statusCode"] == 200
+    body = json.loads(response["body"])
+    assert body[0]["title"] == theme.title
+    assert body[0]["association_count"] == 5
+    assert body[0]["last_associated_at"] == "2024-05-01T12:00:00"
+    assert body[0]["score"] is None
@@ -0,0 +1,17 @@
+from unittest.mock import MagicMock, patch
+
+from ingest_stage import lambda_handler
+from services.ingestion_pipeline import IngestionPipeline
+
+
+@patch.dict("os.environ", {"INGESTION_STAGE": IngestionPipeline.SUMMARISE})
+def test_handles_the_configured_stage():
+    pipeline = MagicMock()
+    event = {"Records": []}
+
+    response = lambda_handler(
+        event, MagicMock(), ingestion_pipeline=pipeline, useGlobal=False
+    )
+
+    pipeline.handle.assert_called_once_with(IngestionPipeline.SUMMARISE, event)
+    assert response == pipeline.handle.return_value
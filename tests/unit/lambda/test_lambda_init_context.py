@@ -65,6 +65,41 @@ class TestLambdaInitContext(unittest.TestCase):
         self.assertIsNotNone(context.article_repo)
         self.assertEqual(context.article_repo, context.article_repo)  # Test caching
 
+    @patch.dict("os.environ", {"DB_CLUSTER_ENDPOINT": "test_cluster_endpoint"})
+    def test_embedding_cache_property(self):
+        context = LambdaInitContext(db_secrets=("user", "pass", "db"))
+        self.assertIsNotNone(context.embedding_cache._repo)
+        self.assertEqual(context.embedding_cache, context.embedding_cache)
+
+    def test_query_embedding_backend_is_opt_in(self):
+        context = LambdaInitContext()
+        self.assertIsNone(context.query_embedding_backend)
+
+    @patch.dict(
+        "os.environ",
+        {
+            "LOCAL_EMBEDDING_PROJECTION": "/opt/projection.npy",
+            "LOCAL_EMBEDDING_CACHE_DIR": "/opt/fastembed",
+        },
+    )
+    @patch("lambda_init_context.LocalEmbeddingBackend")
+    def test_query_embedding_backend_property(self, mock_backend):
+        context = LambdaInitContext()
+        self.assertEqual(
+            context.query_embedding_backend,
+            mock_backend.from_projection_file.return_value,
+        )
+        mock_backend.from_projection_file.assert_called_once_with(
+            "/opt/projection.npy", mock_backend.MODEL, cache_dir="/opt/fastembed"
+        )
+
+    @patch.dict("os.environ", {"LOCAL_EMBEDDING_PROJECTION": "/opt/projection.npy"})
+    @patch("lambda_init_context.LocalEmbeddingBackend")
+    def test_query_embedding_backend_falls_back_to_openai(self, mock_backend):
+        mock_backend.from_projection_file.side_effect = ImportError("fastembed")
+        context = LambdaInitContext()
+        self.assertIsNone(context.query_embedding_backend)
+
     @patch.dict("os.environ", {"DB_SECRET_ARN": "test_db_secret_arn"})
     def test_theme_service_property(self):
         context = LambdaInitContext(
@@ -73,6 +108,21 @@ class TestLambdaInitContext(unittest.TestCase):
         self.assertIsNotNone(context.theme_service)
         self.assertEqual(context.theme_service, context.theme_service)  # Test caching
 
+    @patch.dict(
+        "os.environ",
+        {"DB_POOL_SIZE": "2", "DB_POOL_RECYCLE": "60", "DB_POOL_PRE_PING": "false"},
+    )
+    def test_db_engine_options_from_env(self):
+        context = LambdaInitContext()
+        self.assertEqual(
+            context.db_engine_options,
+            {"pool_size": 2, "pool_recycle": 60, "pool_pre_ping": False},
+        )
+
+    def test_db_engine_options_given(self):
+        context = LambdaInitContext(db_engine_options={"pool_size": 1})
+        self.assertEqual(context.db_engine_options, {"pool_size": 1})
+
     def test_navlog_service_property(self):
         context = LambdaInitContext()
         self.assertIsNotNone(context.navlog_service)
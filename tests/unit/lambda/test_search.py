@@ -31,7 +31,7 @@ def test_search_with_query(
 ):
     event = {"pathParameters": {"query": "test query"}}
 
-    mock_openai_client.get_embedding.return_value = [0.1, 0.2, 0.3]
+    mock_openai_client.get_query_embedding.return_value = [0.1, 0.2, 0.3]
 
     mock_article = MagicMock()
     mock_article.json.return_value = {"id": "1", "title": "Test Article"}
@@ -63,7 +63,7 @@ def test_search_without_query(
 ):
     event = {"pathParameters": {}}
 
-    mock_openai_client.get_embedding.return_value = [0.1, 0.2, 0.3]
+    mock_openai_client.get_query_embedding.return_value = [0.1, 0.2, 0.3]
 
     mock_article_repo.get.return_value = []
     mock_theme_repo.get.return_value = []
@@ -90,7 +90,7 @@ def test_search_with_exception(
 ):
     event = {"pathParameters": {"query": "test query"}}
 
-    mock_openai_client.get_embedding.side_effect = Exception("Test exception")
+    mock_openai_client.get_query_embedding.side_effect = Exception("Test exception")
 
     response = lambda_handler(
         event,
@@ -1,8 +1,8 @@
 from urllib.parse import quote_plus
 import pytest
 from datetime import datetime
-from sqlalchemy.orm import sessionmaker, joinedload
-from sqlalchemy import create_engine, func
+from sqlalchemy.orm import sessionmaker, joinedload, undefer
+from sqlalchemy import create_engine, func, inspect
 from sqlalchemy.exc import IntegrityError
 
 
@@ -66,6 +66,36 @@ def test_create_article(session):
     assert isinstance(retrieved_article._created_at, datetime)
 
 
+def test_article_text_is_deferred(session):
+    article = Article(
+        original_title="Deferred Article",
+        url="https://example.com/deferred",
+        text="page text",
+    )
+    session.add(article)
+    session.commit()
+    session.expunge_all()
+
+    retrieved_article = (
+        session.query(Article)
+        .options(joinedload(Article._themes))
+        .filter_by(_url="https://example.com/deferred")
+        .one()
+    )
+    assert "_text" in inspect(retrieved_article).unloaded
+    assert "_embedding" in inspect(retrieved_article).unloaded
+    session.expunge(retrieved_article)
+    assert "text" not in retrieved_article.json(dump=False)
+
+    undeferred_article = (
+        session.query(Article)
+        .options(undefer(Article._text))
+        .filter_by(_url="https://example.com/deferred")
+        .one()
+    )
+    assert undeferred_article.json(dump=False)["text"] == "page text"
+
+
 def test_create_theme(session):
     # Create a new theme
     theme = Theme(original_title="Test Theme", summary="This is a test theme")
@@ -179,17 +209,15 @@ def test_theme_title_case_insensitivity(session):
     # Test theme title case insensitivity
     theme1 = Theme(original_title="Test Theme", summary="This is a test theme")
     theme2 = Theme(original_title="TEST THEME", summary="This is another test theme")
+    assert theme1._title == theme2._title == quote_plus("test theme")
     session.add(theme1)
-    session.add(theme2)
     session.commit()
 
-    retrieved_themes = (
-        session.query(Theme).filter_by(_title=quote_plus("test theme")).all()
-    )
-
-    assert len(retrieved_themes) == 2
-    assert retrieved_themes[0]._title == quote_plus("test theme")
-    assert retrieved_themes[1]._title == quote_plus("test theme")
+    # titles are unique, so both spellings name the same theme
+    session.add(theme2)
+    with pytest.raises(IntegrityError):
+        session.commit()
+    session.rollback()
 
 
 def test_article_without_summary(session):
@@ -1,13 +1,16 @@
 from datetime import datetime
 from unittest.mock import MagicMock
+import uuid
 from urllib.parse import quote_plus
 import pytest
-from sqlalchemy import func
+from sqlalchemy import func, tuple_
 from models.article import Article
 from models.models import Browsed
 from models.browse import Browse
 from models.theme import Theme
 from article_repo import ArticleRepository
+from repos import decode_cursor, encode_cursor
+from sqlalchemy.dialects import postgresql
 
 
 @pytest.fixture
@@ -79,11 +82,17 @@ def test_get_articles_by_theme(article_repo, mock_where):
     )
     assert len(articles) > 0
     assert mock_where.call_args[0][0].compare(
-        (1 - Article._embedding.cosine_distance(query_embedding)) > 0.8
+        Article._embedding.cosine_distance(query_embedding) < 1 - 0.8
     )
     assert mock_where.return_value.where.return_value.order_by.call_args[0][0].compare(
-        (1 - Article._embedding.cosine_distance(query_embedding)).desc()
+        Article._embedding.cosine_distance(query_embedding).asc()
     )
+    assert "hnsw.ef_search" in str(
+        article_repo._session.return_value.execute.call_args[0][0]
+    )
+    assert article_repo._session.return_value.execute.call_args[0][1] == {
+        "ef_search": "40"
+    }
 
 
 def test_enhance_article():
@@ -151,10 +160,21 @@ def test_get_articles_exception_handling(article_repo):
 def test_get_articles_with_embedding(article_repo, mock_where):
     embedding = [0.1, 0.2, 0.3]
     article_repo.get(
-        filter_embedding=embedding, threshold=0.7, include_score_in_results=True
+        filter_embedding=embedding,
+        threshold=0.7,
+        include_score_in_results=True,
+        ef_search=100,
     )
 
     mock_where.assert_called()
+    assert article_repo._session.return_value.execute.call_args[0][1] == {
+        "ef_search": "100"
+    }
+
+
+def test_get_articles_without_embedding_keeps_ef_search(article_repo, mock_query):
+    article_repo.get()
+    article_repo._session.return_value.execute.assert_not_called()
 
 
 def test_upsert_article():
@@ -467,3 +487,113 @@ def test_get_with_negative_min_token_count(article_repo, mock_query):
     assert len(result) == len(articles)
     # Should not call where() when min_token_count is negative
     mock_query.where.assert_not_called()
+
+
+def test_get_two_phase_widens_candidates(article_repo, mock_query):
+    article = Article(
+        "the aul article", "https://example.com", "This is a test article"
+    )
+    limit_query = (
+        mock_query.where.return_value.where.return_value.where.return_value.order_by.return_value.options.return_value.limit
+    )
+    limit_query.return_value.all.side_effect = [[article], [article, article]]
+
+    result = article_repo.get(filter_embedding=[0.1, 0.2, 0.3], limit=2, two_phase=True)
+
+    assert len(result) == 2
+    candidates = mock_query.where.return_value.where.call_args_list
+    assert "LIMIT" in str(candidates[0][0][0].compile())
+    ef_search = [
+        call[0][1]["ef_search"]
+        for call in article_repo._session.return_value.execute.call_args_list
+    ]
+    assert ef_search == ["40", "40"]
+
+
+def test_get_two_phase_stops_at_max_candidates(article_repo, mock_query):
+    article_repo.MAX_CANDIDATES = 100
+    limit_query = (
+        mock_query.where.return_value.where.return_value.where.return_value.order_by.return_value.options.return_value.limit
+    )
+    limit_query.return_value.all.return_value = []
+
+    result = article_repo.get(filter_embedding=[0.1, 0.2, 0.3], two_phase=True)
+
+    assert result == []
+    ef_search = [
+        call[0][1]["ef_search"]
+        for call in article_repo._session.return_value.execute.call_args_list
+    ]
+    assert ef_search == ["80", "100"]
+
+
+def test_upsert_by_url(article_repo):
+    article = Article("the aul article", "https://example.com", text="text")
+    article_repo._session.return_value.scalars.return_value.one.return_value = article
+
+    result = article_repo.upsert_by_url(article)
+
+    assert result is article
+    statement = article_repo._session.return_value.scalars.call_args[0][0]
+    compiled = str(statement.compile(dialect=postgresql.dialect()))
+    assert "ON CONFLICT (_url) DO UPDATE SET _url = excluded._url" in compiled
+    assert "RETURNING" in compiled
+    assert statement.compile().params["_url"] == "https://example.com"
+
+
+def test_get_projection_defers_text_and_embedding(article_repo, mock_query):
+    article_repo.get(projection=True, snippet_length=100)
+
+    options = mock_query.where.return_value.order_by.return_value.options
+    deferred = [
+        str(option.context[0].path) for option in options.call_args_list[0][0][:2]
+    ]
+    assert "_text" in deferred[0]
+    assert "_embedding" in deferred[1]
+    snippet = options.return_value.options.call_args[0][0]
+    assert "_snippet" in str(snippet.context[0].path)
+
+
+def test_get_page_returns_cursor_of_last_row(article_repo):
+    articles = [Article(f"article {i}", f"https://example.com/{i}") for i in range(3)]
+    for i, article in enumerate(articles):
+        article._id = uuid.uuid4()
+        article._logged_at = datetime(2024, 5, 3 - i)
+    article_repo.get = MagicMock(
+        return_value=[(article, article._logged_at) for article in articles]
+    )
+
+    page, next_cursor = article_repo.get_page(2, sort_by="logged_at")
+
+    assert page == articles[:2]
+    assert decode_cursor(next_cursor) == (articles[1]._logged_at, articles[1]._id)
+    article_repo.get.assert_called_once_with(
+        limit=3, cursor=None, include_sort_key=True, sort_by="logged_at"
+    )
+
+
+def test_get_page_last_page_has_no_cursor(article_repo):
+    article = Article("article", "https://example.com")
+    article_repo.get = MagicMock(return_value=[(article, datetime(2024, 5, 1))])
+
+    page, next_cursor = article_repo.get_page(2)
+
+    assert page == [article]
+    assert next_cursor is None
+
+
+def test_get_with_cursor_filters_after_last_row(article_repo, mock_where):
+    logged_at = datetime(2024, 5, 1)
+    id = uuid.uuid4()
+
+    article_repo.get(cursor=encode_cursor(logged_at, id), include_sort_key=True)
+
+    after = mock_where.return_value.where.call_args[0][0]
+    assert (tuple_(Article._logged_at, Article._id) < tuple_(logged_at, id)).compare(
+        after
+    )
+    order_by = (
+        mock_where.return_value.where.return_value.add_columns.return_value.order_by
+    )
+    assert Article._logged_at.desc().compare(order_by.call_args[0][0])
+    assert Article._id.desc().compare(order_by.call_args[0][1])
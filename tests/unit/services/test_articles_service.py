@@ -1,7 +1,10 @@
+import threading
 from datetime import datetime, timedelta
 from unittest.mock import ANY, MagicMock
 
+import httpx
 import pytest
+from openai import APIConnectionError
 from models.browse import Browse
 from services.articles_service import ArticlesService
 from models.article import Article
@@ -56,7 +59,7 @@ def articles_service(
     neptune_client,
     opencypher_translator_client,
 ):
-    return ArticlesService(
+    service = ArticlesService(
         articles_repo,
         themes_repo,
         browse_repo,
@@ -65,6 +68,9 @@ def articles_service(
         neptune_client,
         opencypher_translator_client,
     )
+    yield service
+    # joins calls still running, such as timed out ones, so they do not outlive the test
+    service._llm_executor.shutdown(wait=True)
 
 
 def test_build_article(
@@ -86,15 +92,16 @@ def test_build_article(
     themes_repo.get_by_titles.return_value = [mock_theme]
     browse = Browse(tab_id="12234")
     browse._id = 1
-    browse_repo.upsert.return_value = browse
-    browsed_repo.get_by_browse_and_article.return_value = None
+    browse_repo.upsert_by_tab_id.return_value = browse
     # action
     article = articles_service._build_article_from_navlog(article, navlog)
     articles_service._track_browsing(article, navlog)
     # assert
     assert article.text == navlog["body_text"]
     assert article.source_navlog == navlog["id"]
-    browsed_repo.add.assert_called_once()
+    browsed_repo.upsert_by_browse_and_article.assert_called_once_with(
+        browse_id=1, article_id=1, logged_at=navlog["created_at"]
+    )
 
 
 def test_build_article_from_navlog_without_existing_article(
@@ -129,15 +136,17 @@ def test_track_browsing_with_existing_browsed(
     }
     browse = Browse(tab_id="98765")
     browse._id = 2
-    browse_repo.get_or_insert.return_value = browse
-    existing_browsed = MagicMock()
-    browsed_repo.get_by_browse_and_article.return_value = existing_browsed
+    browse_repo.upsert_by_tab_id.return_value = browse
 
     articles_service._track_browsing(article, navlog)
 
-    browse_repo.get_or_insert.assert_called_once()
-    browsed_repo.get_by_browse_and_article.assert_called_once()
-    browsed_repo.update.assert_called_once()
+    upserted_browse = browse_repo.upsert_by_tab_id.call_args[0][0]
+    assert upserted_browse.tab_id == "98765"
+    assert upserted_browse.title is None
+    assert upserted_browse.logged_at == navlog["created_at"]
+    browsed_repo.upsert_by_browse_and_article.assert_called_once_with(
+        browse_id=2, article_id=2, logged_at=navlog["created_at"]
+    )
 
 
 def test_add_llm_summarisation(articles_service, articles_repo, themes_repo):
@@ -305,3 +314,378 @@ def test_add_llm_summarisation_with_existing_themes(
     # Test with None summary
     articles_service._add_llm_summarisation(article, None, embedding, token_count)
     assert articles_repo.update.call_count == 1  # No additional updated
+
+
+def test_track_browsing_skips_persisted_navlog(
+    articles_service, articles_repo, browse_repo, browsed_repo
+):
+    article = Article(original_title="Test Article 3", url="https://example.org")
+    article._id = 3
+    article.source_navlog = "3"
+    navlog = {
+        "id": "3",
+        "created_at": "2022-03-01T00:00:00.00",
+        "tabId": "98765",
+    }
+
+    articles_service._track_browsing(article, navlog)
+
+    browse_repo.upsert_by_tab_id.assert_not_called()
+    browsed_repo.upsert_by_browse_and_article.assert_not_called()
+    articles_repo.update.assert_not_called()
+
+
+def test_persist_navlog_redelivered(
+    articles_service, articles_repo, browse_repo, browsed_repo
+):
+    navlog = {
+        "id": "6",
+        "title": "Navlog 6",
+        "url": "https://example.com",
+        "body_text": "This is a sixth test article body",
+        "created_at": "2022-06-01T00:00:00.00",
+        "tabId": "6543",
+    }
+    article = Article(original_title="Test Article 6", url="https://example.com")
+    article._id = 6
+    articles_repo.upsert_by_url.return_value = article
+    articles_repo.update.return_value = article
+    browse = Browse(tab_id="6543")
+    browse._id = 6
+    browse_repo.upsert_by_tab_id.return_value = browse
+
+    articles_service.persist_navlog(navlog)
+    articles_service.persist_navlog(navlog)
+
+    # the browse of the navlog is counted once
+    browsed_repo.upsert_by_browse_and_article.assert_called_once()
+    assert article.source_navlog == "6"
+
+
+def test_process_navlog_in_unit_of_work(
+    articles_service, articles_repo, browse_repo, browsed_repo, neptune_client
+):
+    navlog = {
+        "id": "4",
+        "title": "Navlog 4",
+        "url": "https://example.com",
+        "body_text": "This is a fourth test article body",
+        "created_at": "2022-04-01T00:00:00.00",
+        "tabId": "4321",
+    }
+    article = Article(original_title="Test Article 4", url="https://example.com")
+    article._id = 4
+    article._summary = "summary"
+    article._created_at = datetime.now()
+    article._updated_at = datetime.now()
+    articles_repo.upsert_by_url.return_value = article
+    neptune_client.get_article_graph.return_value = "graph"
+
+    articles_service.process_navlog(navlog)
+
+    # the stored article, then its summary and browse tracking, in separate transactions
+    assert articles_repo.unit_of_work.call_count == 2
+    assert articles_repo.unit_of_work.return_value.__exit__.call_count == 2
+    browse_repo.upsert_by_tab_id.assert_called_once()
+    neptune_client.get_article_graph.assert_called_once_with(4)
+
+
+def test_process_navlog_propagates_llm_failure(
+    articles_service, articles_repo, browse_repo, llm_client, neptune_client
+):
+    navlog = {
+        "id": "5",
+        "title": "Navlog 5",
+        "url": "https://example.com",
+        "body_text": "This is a fifth test article body",
+        "created_at": "2022-05-01T00:00:00.00",
+        "tabId": "5432",
+    }
+    article = Article(original_title="Test Article 5", url="https://example.com")
+    article._id = 5
+    articles_repo.upsert_by_url.return_value = article
+    articles_repo.update.return_value = article
+    llm_client.get_article_summarization.side_effect = Exception("LLM error")
+
+    with pytest.raises(Exception):
+        articles_service.process_navlog(navlog)
+
+    # the failure is outside any transaction, the article is committed untracked and unsummarised
+    articles_repo.unit_of_work.assert_called_once()
+    exit_args = articles_repo.unit_of_work.return_value.__exit__.call_args[0]
+    assert exit_args[0] is None
+    assert article.fingerprint is None
+    browse_repo.upsert_by_tab_id.assert_not_called()
+    neptune_client.get_article_graph.assert_not_called()
+
+
+def test_process_navlog_calls_llm_outside_unit_of_work(
+    articles_service, articles_repo, llm_client
+):
+    navlog = {
+        "id": "9",
+        "title": "Navlog 9",
+        "url": "https://example.com",
+        "body_text": "This is a ninth test article body",
+        "created_at": "2022-09-01T00:00:00.00",
+        "tabId": "9876",
+    }
+    article = Article(original_title="Test Article 9", url="https://example.com")
+    article._id = 9
+    articles_repo.upsert_by_url.return_value = article
+    articles_repo.update.return_value = article
+    open_units = []
+    unit_of_work = articles_repo.unit_of_work.return_value
+    unit_of_work.__enter__.side_effect = lambda: open_units.append(1)
+    unit_of_work.__exit__.side_effect = lambda *args: open_units.pop()
+    open_at_call = []
+    llm_client.get_article_summarization.side_effect = (
+        lambda text, tokens: open_at_call.append(len(open_units)) or None
+    )
+
+    articles_service.process_navlog(navlog)
+
+    assert open_at_call == [0]
+    assert articles_repo.unit_of_work.call_count == 2
+
+
+def test_get_llm_summarisation_runs_calls_concurrently(articles_service, llm_client):
+    barrier = threading.Barrier(2, timeout=5)
+
+    def call(result):
+        def wrapped(text, tokens=None):
+            barrier.wait()
+            return result
+
+        return wrapped
+
+    llm_client.get_article_summarization.side_effect = call({"summary": "summary"})
+    llm_client.get_embedding.side_effect = call([0.1, 0.2])
+    llm_client.count_tokens.return_value = 42
+
+    summary, embedding, token_count = articles_service.get_llm_summarisation("text")
+
+    assert summary == {"summary": "summary"}
+    assert embedding == [0.1, 0.2]
+    assert token_count == 42
+
+
+def test_get_llm_summarisation_counts_tokens_once(articles_service, llm_client):
+    llm_client.get_article_summarization.return_value = {"summary": "summary"}
+    llm_client.get_embedding.return_value = [0.1, 0.2]
+    llm_client.count_tokens.return_value = 42
+
+    articles_service.get_llm_summarisation("text")
+
+    llm_client.count_tokens.assert_called_once_with("text")
+    llm_client.get_article_summarization.assert_called_once_with("text", tokens=42)
+    llm_client.get_embedding.assert_called_once_with("text", tokens=42)
+
+
+def test_get_llm_summarisation_partial_failure(articles_service, llm_client):
+    llm_client.get_article_summarization.return_value = {"summary": "summary"}
+    llm_client.get_embedding.side_effect = Exception("embedding error")
+    llm_client.count_tokens.return_value = 42
+
+    summary, embedding, token_count = articles_service.get_llm_summarisation("text")
+
+    assert summary == {"summary": "summary"}
+    assert embedding is None
+    assert token_count == 42
+
+
+def test_get_llm_summarisation_raises_exhausted_embedding_retries(
+    articles_service, llm_client
+):
+    llm_client.get_article_summarization.return_value = {"summary": "summary"}
+    llm_client.get_embedding.side_effect = APIConnectionError(
+        request=httpx.Request("POST", "https://api")
+    )
+    llm_client.count_tokens.return_value = 42
+
+    with pytest.raises(APIConnectionError):
+        articles_service.get_llm_summarisation("text")
+
+
+def test_get_llm_summarisation_timeout(articles_service, llm_client):
+    articles_service.LLM_TIMEOUT = 0.1
+    llm_client.get_article_summarization.return_value = {"summary": "summary"}
+    released = threading.Event()
+    llm_client.get_embedding.side_effect = lambda text, tokens=None: released.wait(5)
+    llm_client.count_tokens.return_value = 42
+
+    summary, embedding, token_count = articles_service.get_llm_summarisation("text")
+    released.set()
+
+    assert summary == {"summary": "summary"}
+    assert embedding is None
+    assert token_count == 42
+
+
+def test_add_llm_summarisation_without_embedding(
+    articles_service, articles_repo, themes_repo
+):
+    article = Article(original_title="Test Article", url="https://example.com")
+    article._id = 1
+
+    articles_service._add_llm_summarisation(
+        article, {"summary": "Test summary", "themes": ["theme1"]}, None, 100
+    )
+
+    assert article.summary == "Test summary"
+    assert article.embedding is None
+    articles_repo.update.assert_called_once_with(article)
+    themes_repo.get.assert_not_called()
+    themes_repo.add_related.assert_called_once_with(article, ["theme1"])
+
+
+def test_process_navlog_skips_unchanged_stale_article(
+    articles_service, articles_repo, llm_client, neptune_client
+):
+    navlog = {
+        "id": "6",
+        "title": "Navlog 6",
+        "url": "https://example.com",
+        "body_text": "This is a sixth  test article body\n",
+        "created_at": "2022-06-01T00:00:00.00",
+        "tabId": "6543",
+    }
+    article = Article(original_title="Test Article 6", url="https://example.com")
+    article._id = 6
+    article._summary = "summary"
+    article._created_at = datetime.now() - timedelta(days=365)
+    article.fingerprint = Article.text_fingerprint("This is a sixth test article body")
+    articles_repo.upsert_by_url.return_value = article
+    articles_repo.update.return_value = article
+
+    articles_service.process_navlog(navlog)
+
+    llm_client.get_article_summarization.assert_not_called()
+    llm_client.get_embedding.assert_not_called()
+    neptune_client.get_article_graph.assert_not_called()
+    assert article.logged_at == datetime(2022, 6, 1)
+
+
+def test_process_navlog_rebuilds_changed_stale_article(
+    articles_service, articles_repo, themes_repo, llm_client, neptune_client
+):
+    navlog = {
+        "id": "7",
+        "title": "Navlog 7",
+        "url": "https://example.com",
+        "body_text": "This is a changed test article body",
+        "created_at": "2022-07-01T00:00:00.00",
+        "tabId": "7654",
+    }
+    article = Article(original_title="Test Article 7", url="https://example.com")
+    article._id = 7
+    article._summary = "summary"
+    article._created_at = datetime.now() - timedelta(days=365)
+    article.fingerprint = Article.text_fingerprint("This is the old article body")
+    articles_repo.upsert_by_url.return_value = article
+    articles_repo.update.return_value = article
+    llm_client.get_article_summarization.return_value = {"summary": "new summary"}
+    llm_client.get_embedding.return_value = None
+    themes_repo.get.return_value = []
+    neptune_client.get_article_graph.return_value = "graph"
+
+    articles_service.process_navlog(navlog)
+
+    llm_client.get_article_summarization.assert_called_once()
+    assert article.summary == "new summary"
+    assert article.fingerprint == Article.text_fingerprint(navlog["body_text"])
+
+
+def test_process_navlog_keeps_fingerprint_without_summary(
+    articles_service, articles_repo, llm_client, neptune_client
+):
+    navlog = {
+        "id": "7",
+        "title": "Navlog 7",
+        "url": "https://example.com",
+        "body_text": "This is a changed test article body",
+        "created_at": "2022-07-01T00:00:00.00",
+        "tabId": "7654",
+    }
+    article = Article(original_title="Test Article 7", url="https://example.com")
+    article._id = 7
+    article._summary = "summary"
+    article._created_at = datetime.now() - timedelta(days=365)
+    old_fingerprint = Article.text_fingerprint("This is the old article body")
+    article.fingerprint = old_fingerprint
+    articles_repo.upsert_by_url.return_value = article
+    articles_repo.update.return_value = article
+    llm_client.get_article_summarization.return_value = None
+    neptune_client.get_article_graph.return_value = "graph"
+
+    articles_service.process_navlog(navlog)
+
+    # the next navlog of the url summarises the changed text again
+    assert article.text == navlog["body_text"]
+    assert article.fingerprint == old_fingerprint
+
+
+def test_persist_navlog_without_summarisation(
+    articles_service, articles_repo, browse_repo, llm_client, neptune_client
+):
+    navlog = {
+        "id": "8",
+        "title": "Navlog 8",
+        "url": "https://example.com",
+        "body_text": "This is an eighth test article body",
+        "created_at": "2022-08-01T00:00:00.00",
+        "tabId": "8765",
+    }
+    article = Article(original_title="Test Article 8", url="https://example.com")
+    article._id = 8
+    articles_repo.upsert_by_url.return_value = article
+    articles_repo.update.return_value = article
+
+    persisted, summarise, build_graph = articles_service.persist_navlog(navlog)
+
+    assert persisted is article
+    assert summarise and build_graph
+    articles_repo.unit_of_work.return_value.__exit__.assert_called_once()
+    browse_repo.upsert_by_tab_id.assert_called_once()
+    llm_client.get_article_summarization.assert_not_called()
+    neptune_client.get_article_graph.assert_not_called()
+
+
+def test_summarise_and_tag_article(
+    articles_service, articles_repo, themes_repo, llm_client
+):
+    article = Article(original_title="Test Article", url="https://example.com")
+    article._id = 1
+    article._text = "text"
+    articles_repo.get_by_id.return_value = article
+    llm_client.get_article_summarization.return_value = {
+        "summary": "Test summary",
+        "themes": ["theme1"],
+    }
+    llm_client.get_embedding.return_value = [0.1, 0.2]
+    llm_client.count_tokens.return_value = 10
+    themes_repo.get.return_value = []
+
+    summary = articles_service.summarise_article("1")
+
+    assert summary["themes"] == ["theme1"]
+    assert article.summary == "Test summary"
+    articles_repo.update.assert_called_once_with(article)
+    themes_repo.add_related.assert_not_called()
+
+    articles_service.tag_article_themes("1", summary["themes"])
+
+    themes_repo.get.assert_called_once_with(
+        filter_embedding=[0.1, 0.2], limit=3, two_phase=True
+    )
+    themes_repo.add_related.assert_called_once_with(article, ["theme1"])
+
+
+def test_should_skip_sizes_text_in_bytes():
+    navlog = {
+        "url": "https://example.com",
+        "created_at": datetime.now().strftime("%Y-%m-%dT%H:%M:%S.%f"),
+    }
+    # 60 characters, 120 bytes, as sized by the build_articles query filter
+    assert not ArticlesService.should_skip({**navlog, "body_text": "é" * 60})
+    assert ArticlesService.should_skip({**navlog, "body_text": "e" * 60})
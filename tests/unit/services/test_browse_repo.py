@@ -5,6 +5,7 @@ from models.browse import Browse
 from models.article import Article
 from models.theme import Theme
 from browse_repo import BrowseRepository
+from sqlalchemy.dialects import postgresql
 
 
 @pytest.fixture
@@ -100,3 +101,20 @@ def test_get_recently_browsed_date_filter(mock_datetime, browse_repo, mock_sessi
     assert (Browse._id == mock_subquery.c._browse_id).compare(
         mock_session.return_value.query.return_value.join.call_args[0][1]
     )
+
+
+def test_upsert_by_tab_id(browse_repo, mock_session):
+    browse = Browse(tab_id="tab", title="search")
+    mock_session.return_value.scalars.return_value.one.return_value = browse
+
+    result = browse_repo.upsert_by_tab_id(browse)
+
+    assert result is browse
+    statement = str(
+        mock_session.return_value.scalars.call_args[0][0].compile(
+            dialect=postgresql.dialect()
+        )
+    )
+    assert "ON CONFLICT (_tab_id) DO UPDATE" in statement
+    assert "coalesce(browse._title, excluded._title)" in statement
+    assert "RETURNING" in statement
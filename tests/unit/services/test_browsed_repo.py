@@ -3,6 +3,7 @@ import pytest
 from unittest.mock import MagicMock, patch
 from repos import BrowsedRepository
 from models.models import Browsed
+from sqlalchemy.dialects import postgresql
 
 
 @pytest.fixture
@@ -102,3 +103,67 @@ def test_delete_browsed(browsed_repo, mock_session):
     # Assert
     mock_session.return_value.delete.assert_called_once_with(mock_browsed)
     mock_session.return_value.commit.assert_called_once()
+
+
+def test_upsert_by_browse_and_article(browsed_repo, mock_session):
+    upserted = Browsed(article_id="article", browse_id="browse", logged_at=None)
+    mock_session.return_value.scalars.return_value.one.return_value = upserted
+
+    result = browsed_repo.upsert_by_browse_and_article(
+        browse_id="browse", article_id="article", logged_at=datetime.now()
+    )
+
+    assert result is upserted
+    statement = str(
+        mock_session.return_value.scalars.call_args[0][0].compile(
+            dialect=postgresql.dialect()
+        )
+    )
+    assert "ON CONFLICT (_article_id, _browse_id) DO UPDATE" in statement
+    assert "_count = (browsed._count + " in statement
+    mock_session.return_value.commit.assert_called_once()
+
+
+def test_upsert_by_browse_and_article_increments_recent_browse_counts(
+    browsed_repo, mock_session
+):
+    mock_session.return_value.scalar.return_value = False
+    upserted = Browsed(
+        article_id="article", browse_id="browse", logged_at=datetime.now()
+    )
+    mock_session.return_value.scalars.return_value.one.return_value = upserted
+
+    browsed_repo.upsert_by_browse_and_article(
+        browse_id="browse", article_id="article", logged_at=upserted.logged_at
+    )
+
+    statement = str(
+        mock_session.return_value.execute.call_args[0][0].compile(
+            dialect=postgresql.dialect()
+        )
+    )
+    assert statement.startswith("UPDATE theme_stats")
+    assert "_recent_browse_count=(theme_stats._recent_browse_count + " in statement
+    assert "greatest(theme_stats._updated_at" in statement
+    assert (
+        "_recent_last_associated_at=greatest(theme_stats._recent_last_associated_at, "
+        "(SELECT association.created_at" in statement
+    )
+    # no full recompute of the themes' aggregates
+    assert "avg" not in statement
+
+
+def test_upsert_by_browse_and_article_of_recently_browsed_article(
+    browsed_repo, mock_session
+):
+    mock_session.return_value.scalar.return_value = True
+    upserted = Browsed(
+        article_id="article", browse_id="browse", logged_at=datetime.now()
+    )
+    mock_session.return_value.scalars.return_value.one.return_value = upserted
+
+    browsed_repo.upsert_by_browse_and_article(
+        browse_id="browse", article_id="article", logged_at=upserted.logged_at
+    )
+
+    mock_session.return_value.execute.assert_not_called()
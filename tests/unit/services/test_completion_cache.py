@@ -0,0 +1,69 @@
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock, Mock
+from services.completion_cache import CompletionCache
+
+
+def test_key_includes_prompt_model_temperature_and_query():
+    key = CompletionCache.key("prompt", "model", 0, "query")
+    assert key == CompletionCache.key("prompt", "model", 0, "query")
+    assert key != CompletionCache.key("other prompt", "model", 0, "query")
+    assert key != CompletionCache.key("prompt", "other model", 0, "query")
+    assert key != CompletionCache.key("prompt", "model", 1, "query")
+    assert key != CompletionCache.key("prompt", "model", 0, "other query")
+    assert key != CompletionCache.key("prompt", "model", 0, "query", False)
+
+
+def test_memory_hit():
+    cache = CompletionCache()
+    assert cache.get("key") is None
+    cache.put("key", "model", {"summary": "test"})
+    assert cache.get("key") == {"summary": "test"}
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_expired_entries_are_misses():
+    cache = CompletionCache(ttl=timedelta(seconds=-1))
+    cache.put("key", "model", "text")
+    assert cache.get("key") is None
+
+
+def test_invalidate():
+    repo = MagicMock()
+    repo.get_by_key.return_value = None
+    cache = CompletionCache(repo)
+    cache.put("key", "model", "text")
+    cache.invalidate("key")
+    assert cache.get("key") is None
+    repo.delete.assert_called_once_with("key")
+
+
+def test_persistent_hit_populates_memory():
+    repo = MagicMock()
+    repo.get_by_key.return_value = Mock(
+        result={"summary": "test"}, expires_at=datetime.now() + timedelta(days=1)
+    )
+    cache = CompletionCache(repo)
+    assert cache.get("key") == {"summary": "test"}
+    assert cache.get("key") == {"summary": "test"}
+    repo.get_by_key.assert_called_once_with("key")
+
+
+def test_expired_persistent_entry_is_a_miss():
+    repo = MagicMock()
+    repo.get_by_key.return_value = Mock(
+        result="text", expires_at=datetime.now() - timedelta(days=1)
+    )
+    cache = CompletionCache(repo)
+    assert cache.get("key") is None
+
+
+def test_repo_errors_are_not_raised():
+    repo = MagicMock()
+    repo.get_by_key.side_effect = Exception("db down")
+    repo.put.side_effect = Exception("db down")
+    repo.delete.side_effect = Exception("db down")
+    cache = CompletionCache(repo)
+    assert cache.get("key") is None
+    cache.put("key", "model", "text")
+    cache.invalidate("key")
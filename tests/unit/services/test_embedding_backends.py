@@ -0,0 +1,28 @@
+import numpy as np
+from unittest.mock import Mock
+from services.embedding_backends import LocalEmbeddingBackend, fit_projection
+
+
+def test_fit_projection_recovers_linear_map():
+    rng = np.random.default_rng(0)
+    source = rng.normal(size=(50, 4))
+    expected = rng.normal(size=(4, 6))
+    assert np.allclose(fit_projection(source, source @ expected), expected)
+
+
+def test_local_backend_projects_to_unit_vectors():
+    text_embedding = Mock()
+    text_embedding.embed.return_value = iter(
+        [np.array([1.0, 0.0]), np.array([0.0, 2.0])]
+    )
+    projection = np.array([[3.0, 0.0, 4.0], [0.0, 1.0, 0.0]])
+    backend = LocalEmbeddingBackend(
+        projection, model_name="test-model", text_embedding=text_embedding
+    )
+
+    embeddings = backend.embed(["first", "second"])
+
+    assert np.allclose(embeddings, [[0.6, 0.0, 0.8], [0.0, 1.0, 0.0]])
+    assert backend.dimensions == 3
+    assert backend.model == "test-model->3"
+    text_embedding.embed.assert_called_once_with(["first", "second"])
@@ -0,0 +1,59 @@
+from unittest.mock import MagicMock, Mock
+from services.embedding_cache import EmbeddingCache
+
+
+def test_key_normalizes_whitespace():
+    assert EmbeddingCache.key("model", " some  text\n") == EmbeddingCache.key(
+        "model", "some text"
+    )
+    assert EmbeddingCache.key("model", "text") != EmbeddingCache.key("other", "text")
+
+
+def test_memory_hit():
+    cache = EmbeddingCache()
+    assert cache.get("model", "text") is None
+    cache.put("model", "text", [0.1, 0.2])
+    assert cache.get("model", "text") == [0.1, 0.2]
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_evicts_least_recently_used():
+    cache = EmbeddingCache(max_size=2)
+    cache.put("model", "a", [1])
+    cache.put("model", "b", [2])
+    cache.get("model", "a")
+    cache.put("model", "c", [3])
+    assert cache.get("model", "a") == [1]
+    assert cache.get("model", "b") is None
+    assert cache.get("model", "c") == [3]
+
+
+def test_persistent_hit_populates_memory():
+    repo = MagicMock()
+    repo.get_by_key.return_value = Mock(embedding=[0.3])
+    cache = EmbeddingCache(repo)
+    assert cache.get("model", "text") == [0.3]
+    assert cache.get("model", "text") == [0.3]
+    repo.get_by_key.assert_called_once_with(EmbeddingCache.key("model", "text"))
+    assert cache.stats()["persistent_hits"] == 1
+    assert cache.stats()["hits"] == 1
+
+
+def test_put_writes_through_to_repo():
+    repo = MagicMock()
+    cache = EmbeddingCache(repo)
+    cache.put("model", "text", [0.4])
+    repo.put.assert_called_once_with(
+        EmbeddingCache.key("model", "text"), "model", [0.4]
+    )
+
+
+def test_repo_errors_are_not_raised():
+    repo = MagicMock()
+    repo.get_by_key.side_effect = Exception("db down")
+    repo.put.side_effect = Exception("db down")
+    cache = EmbeddingCache(repo)
+    assert cache.get("model", "text") is None
+    cache.put("model", "text", [0.5])
+    assert cache.get("model", "text") == [0.5]
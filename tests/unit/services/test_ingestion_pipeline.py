@@ -0,0 +1,142 @@
+import json
+from unittest.mock import MagicMock
+
+import pytest
+from models.article import Article
+from services.ingestion_pipeline import IngestionPipeline
+from services.ingestion_queue import InMemoryIngestionQueue, SqsIngestionQueue
+
+
+@pytest.fixture
+def articles_service():
+    service = MagicMock()
+    article = Article(original_title="Test Article", url="https://example.com")
+    article._id = "article-1"
+    service.persist_navlog.return_value = (article, True, True)
+    service.summarise_article.return_value = {"summary": "summary", "themes": ["a"]}
+    return service
+
+
+@pytest.fixture
+def navlog_service():
+    service = MagicMock()
+    service.get_navlog.side_effect = lambda navlog_id: {"id": navlog_id}
+    return service
+
+
+@pytest.fixture
+def pipeline(articles_service, navlog_service):
+    return IngestionPipeline.in_memory(articles_service, navlog_service)
+
+
+def test_drain_runs_every_stage(pipeline, articles_service, navlog_service):
+    pipeline.enqueue_navlogs(["1"])
+
+    dead_letters = pipeline.drain()
+
+    navlog_service.mark_enqueued.assert_called_once_with(["1"])
+    navlog_service.get_navlog.assert_called_once_with("1")
+    articles_service.persist_navlog.assert_called_once_with({"id": "1"})
+    navlog_service.delete_navlog.assert_called_once_with("1")
+    articles_service.summarise_article.assert_called_once_with("article-1")
+    articles_service.tag_article_themes.assert_called_once_with("article-1", ["a"])
+    articles_service.build_article_graph.assert_called_once_with("article-1")
+    assert all(len(messages) == 0 for messages in dead_letters.values())
+
+
+def test_persist_of_current_article_only_builds_graph(pipeline, articles_service):
+    article, _, _ = articles_service.persist_navlog.return_value
+    articles_service.persist_navlog.return_value = (article, False, True)
+    pipeline.enqueue_navlogs(["1"])
+
+    pipeline.drain()
+
+    articles_service.summarise_article.assert_not_called()
+    articles_service.build_article_graph.assert_called_once_with("article-1")
+
+
+def test_persist_skips_processed_navlog(pipeline, articles_service, navlog_service):
+    navlog_service.get_navlog.side_effect = None
+    navlog_service.get_navlog.return_value = None
+    pipeline.enqueue_navlogs(["1"])
+
+    pipeline.drain()
+
+    articles_service.persist_navlog.assert_not_called()
+    navlog_service.delete_navlog.assert_not_called()
+
+
+def test_failing_stage_is_retried_then_dead_lettered(pipeline, articles_service):
+    articles_service.build_article_graph.side_effect = Exception("graph error")
+    pipeline.enqueue_navlogs(["1"])
+
+    dead_letters = pipeline.drain()
+
+    assert (
+        articles_service.build_article_graph.call_count
+        == IngestionPipeline.MAX_RECEIVE_COUNT
+    )
+    assert dead_letters[IngestionPipeline.GRAPH] == [{"article_id": "article-1"}]
+    # the other stages are not held up by the graph
+    articles_service.tag_article_themes.assert_called_once()
+
+
+def test_handle_reports_failed_records(pipeline, articles_service):
+    articles_service.build_article_graph.side_effect = [None, Exception("error")]
+    event = {
+        "Records": [
+            {"messageId": "m1", "body": json.dumps({"article_id": "1"})},
+            {"messageId": "m2", "body": json.dumps({"article_id": "2"})},
+        ]
+    }
+
+    response = pipeline.handle(IngestionPipeline.GRAPH, event)
+
+    assert response == {"batchItemFailures": [{"itemIdentifier": "m2"}]}
+
+
+def test_in_memory_queue_receive_and_settle():
+    queue = InMemoryIngestionQueue(max_receive_count=2)
+    queue.send([{"n": 1}, {"n": 2}, {"n": 3}])
+
+    records = queue.receive(2)
+    queue.settle(records, {records[0]["messageId"]})
+
+    assert [json.loads(record["body"]) for record in records] == [{"n": 1}, {"n": 2}]
+    assert len(queue) == 2
+    remaining = queue.receive(10)
+    assert [json.loads(record["body"]) for record in remaining] == [{"n": 3}, {"n": 1}]
+    assert remaining[1]["attributes"]["ApproximateReceiveCount"] == "2"
+    queue.settle(remaining, {remaining[1]["messageId"]})
+    assert len(queue) == 0
+    assert queue.dead_letters == [{"n": 1}]
+
+
+def test_sqs_queue_sends_in_batches_of_ten():
+    sqs_client = MagicMock()
+    sqs_client.send_message_batch.return_value = {"Successful": []}
+    queue = SqsIngestionQueue("https://queue", sqs_client)
+
+    queue.send([{"n": n} for n in range(12)])
+
+    calls = sqs_client.send_message_batch.call_args_list
+    assert [len(call.kwargs["Entries"]) for call in calls] == [10, 2]
+    assert calls[1].kwargs["QueueUrl"] == "https://queue"
+    assert json.loads(calls[1].kwargs["Entries"][1]["MessageBody"]) == {"n": 11}
+
+
+def test_sqs_queue_raises_on_failed_entries():
+    sqs_client = MagicMock()
+    sqs_client.send_message_batch.return_value = {
+        "Failed": [{"Id": "0", "Message": "throttled"}]
+    }
+    queue = SqsIngestionQueue("https://queue", sqs_client)
+
+    with pytest.raises(RuntimeError, match="throttled"):
+        queue.send([{"n": 1}])
+
+
+def test_from_init_context_without_queues(monkeypatch):
+    monkeypatch.delenv("PERSIST_QUEUE_URL", raising=False)
+
+    assert IngestionPipeline.from_init_context(MagicMock(), MagicMock()) is None
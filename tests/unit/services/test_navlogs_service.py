@@ -1,7 +1,11 @@
+from datetime import datetime
 from unittest.mock import MagicMock
 import os
 import sys
 
+from botocore.exceptions import ClientError
+import pytest
+
 sys.path.append(
     os.path.join(
         os.path.dirname(os.path.realpath(__file__)), "../../../python/lambda/services"
@@ -35,3 +39,143 @@ def test_get_navlogs():
         '[{"id": "1", "title": "Navlog 1"}, {"id": "2", "title": "Navlog 2"}]'
     )
     assert result == expected_result
+
+
+def test_iter_content_navlog_pages():
+    dynamodb_mock = MagicMock()
+    table_mock = MagicMock()
+    dynamodb_mock.Table.return_value = table_mock
+    table_mock.query.side_effect = [
+        {"Items": [{"id": "1"}], "LastEvaluatedKey": {"id": "1"}},
+        {"Items": [{"id": "2"}]},
+    ]
+    navlog_service = NavlogService(TABLE_NAME, BUCKET_NAME)
+    navlog_service._dynamodb = dynamodb_mock
+
+    pages = navlog_service.iter_content_navlog_pages(start_key={"id": "0"})
+
+    assert next(pages) == ([{"id": "1"}], {"id": "1"})
+    # the next page is only read when asked for
+    assert table_mock.query.call_count == 1
+    assert table_mock.query.call_args.kwargs["ExclusiveStartKey"] == {"id": "0"}
+    assert list(pages) == [([{"id": "2"}], None)]
+    assert table_mock.query.call_args.kwargs["ExclusiveStartKey"] == {"id": "1"}
+    assert "FilterExpression" not in table_mock.query.call_args.kwargs
+
+
+def test_iter_content_navlog_pages_filters_and_projection():
+    dynamodb_mock = MagicMock()
+    table_mock = MagicMock()
+    dynamodb_mock.Table.return_value = table_mock
+    table_mock.query.return_value = {"Items": [{"id": "1"}]}
+    navlog_service = NavlogService(TABLE_NAME, BUCKET_NAME)
+    navlog_service._dynamodb = dynamodb_mock
+
+    navlogs = list(
+        navlog_service.iter_content_navlogs(
+            created_after=datetime(2024, 1, 2, 3, 4, 5),
+            min_body_length=100,
+            with_url=True,
+            attributes=["id", "url"],
+            page_size=50,
+        )
+    )
+
+    assert navlogs == [{"id": "1"}]
+    kwargs = table_mock.query.call_args.kwargs
+    assert "ExclusiveStartKey" not in kwargs
+    assert kwargs["Limit"] == 50
+    assert kwargs["ProjectionExpression"] == "#p0, #p1"
+    assert kwargs["ExpressionAttributeNames"] == {"#p0": "id", "#p1": "url"}
+    expression = kwargs["FilterExpression"].get_expression()
+    assert expression["operator"] == "AND"
+    created_at, url = expression["values"][0].get_expression(), expression["values"][1]
+    assert created_at["values"][0].get_expression()["values"][1] == (
+        "2024-01-02T03:04:05.000000"
+    )
+    assert url.get_expression()["operator"] == "attribute_exists"
+
+
+def test_iter_content_navlog_pages_leaves_out_enqueued():
+    dynamodb_mock = MagicMock()
+    table_mock = MagicMock()
+    dynamodb_mock.Table.return_value = table_mock
+    table_mock.query.return_value = {"Items": []}
+    navlog_service = NavlogService(TABLE_NAME, BUCKET_NAME)
+    navlog_service._dynamodb = dynamodb_mock
+
+    list(navlog_service.iter_content_navlogs(enqueued_before=datetime(2024, 1, 2)))
+
+    expression = table_mock.query.call_args.kwargs["FilterExpression"].get_expression()
+    assert expression["operator"] == "OR"
+    not_enqueued, enqueued_before = expression["values"]
+    assert not_enqueued.get_expression()["operator"] == "attribute_not_exists"
+    assert enqueued_before.get_expression()["values"][1] == (
+        "2024-01-02T00:00:00.000000"
+    )
+
+
+def test_mark_enqueued_skips_deleted_navlogs():
+    dynamodb_mock = MagicMock()
+    table_mock = MagicMock()
+    dynamodb_mock.Table.return_value = table_mock
+    table_mock.update_item.side_effect = [
+        ClientError(
+            {"Error": {"Code": "ConditionalCheckFailedException"}}, "UpdateItem"
+        ),
+        None,
+    ]
+    navlog_service = NavlogService(TABLE_NAME, BUCKET_NAME)
+    navlog_service._dynamodb = dynamodb_mock
+
+    navlog_service.mark_enqueued(["1", "2"])
+
+    assert table_mock.update_item.call_count == 2
+    kwargs = table_mock.update_item.call_args.kwargs
+    assert kwargs["Key"] == {"id": "2"}
+    assert kwargs["UpdateExpression"] == "SET enqueued_at = :enqueued_at"
+
+
+def test_mark_enqueued_raises_other_errors():
+    dynamodb_mock = MagicMock()
+    dynamodb_mock.Table.return_value.update_item.side_effect = ClientError(
+        {"Error": {"Code": "ProvisionedThroughputExceededException"}}, "UpdateItem"
+    )
+    navlog_service = NavlogService(TABLE_NAME, BUCKET_NAME)
+    navlog_service._dynamodb = dynamodb_mock
+
+    with pytest.raises(ClientError):
+        navlog_service.mark_enqueued(["1"])
+
+
+def test_get_stream_navlog_reads_table():
+    dynamodb_mock = MagicMock()
+    table_mock = MagicMock()
+    dynamodb_mock.Table.return_value = table_mock
+    table_mock.get_item.return_value = {"Item": {"id": "1", "title": "Navlog 1"}}
+    navlog_service = NavlogService(TABLE_NAME, BUCKET_NAME)
+    navlog_service._dynamodb = dynamodb_mock
+
+    navlog = navlog_service.get_stream_navlog(
+        {
+            "dynamodb": {
+                "Keys": {"id": {"S": "1"}},
+                "NewImage": {"id": {"S": "1"}, "type": {"S": "content"}},
+            }
+        }
+    )
+
+    assert navlog == {"id": "1", "title": "Navlog 1"}
+    table_mock.get_item.assert_called_once_with(Key={"id": "1"})
+
+
+def test_get_stream_navlog_of_deleted_navlog():
+    dynamodb_mock = MagicMock()
+    dynamodb_mock.Table.return_value.get_item.return_value = {}
+    navlog_service = NavlogService(TABLE_NAME, BUCKET_NAME)
+    navlog_service._dynamodb = dynamodb_mock
+
+    assert (
+        navlog_service.get_stream_navlog({"dynamodb": {"Keys": {"id": {"S": "1"}}}})
+        is None
+    )
@@ -1,6 +1,16 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+import httpx
 import pytest
 from unittest.mock import Mock, patch
+from openai import APIConnectionError, BadRequestError, RateLimitError
+from services.completion_cache import CompletionCache
+from services.embedding_cache import EmbeddingCache
+from services.openai_batch import LocalBatchRunner, OpenAIBatchRunner
 from services.openai_client import OpenAIClient, LLMResponseException
+from services.rate_limiter import RateLimiter
 
 
 @pytest.fixture
@@ -18,6 +28,63 @@ def test_get_embedding(openai_client):
         )
 
 
+def test_get_embedding_uses_cache():
+    openai_client = OpenAIClient(
+        api_key="test_api_key", embedding_cache=EmbeddingCache()
+    )
+    with patch.object(openai_client.openai_client.embeddings, "create") as mock_create:
+        mock_create.return_value.data = [Mock(embedding=[0.1, 0.2, 0.3])]
+        assert openai_client.get_embedding("Test article") == [0.1, 0.2, 0.3]
+        assert openai_client.get_embedding("Test  article") == [0.1, 0.2, 0.3]
+        mock_create.assert_called_once()
+
+
+def test_get_embeddings_only_embeds_cache_misses():
+    cache = EmbeddingCache()
+    cache.put(OpenAIClient.EMBEDDING_MODEL, "cached", [0.9])
+    openai_client = OpenAIClient(api_key="test_api_key", embedding_cache=cache)
+    with patch.object(openai_client.openai_client.embeddings, "create") as mock_create:
+        mock_create.return_value.data = [Mock(index=0, embedding=[0.1])]
+        result = openai_client.get_embeddings(["cached", "new"])
+        assert result == [[0.9], [0.1]]
+        mock_create.assert_called_once_with(
+            input=["new"], model=OpenAIClient.EMBEDDING_MODEL
+        )
+    assert cache.get(OpenAIClient.EMBEDDING_MODEL, "new") == [0.1]
+
+
+def test_get_query_embedding_uses_backend():
+    backend = Mock(model="local")
+    backend.embed.return_value = [[0.4, 0.5]]
+    cache = EmbeddingCache()
+    openai_client = OpenAIClient(
+        api_key="test_api_key", embedding_cache=cache, query_embedding_backend=backend
+    )
+    with patch.object(openai_client.openai_client.embeddings, "create") as mock_create:
+        assert openai_client.get_query_embedding("a\nquery") == [0.4, 0.5]
+        assert openai_client.get_query_embedding("a query") == [0.4, 0.5]
+        mock_create.assert_not_called()
+    backend.embed.assert_called_once_with(["a query"])
+    assert cache.get("local", "a query") == [0.4, 0.5]
+
+
+def test_get_query_embedding_falls_back_to_openai():
+    backend = Mock(model="local")
+    backend.embed.side_effect = Exception("model error")
+    openai_client = OpenAIClient(
+        api_key="test_api_key", query_embedding_backend=backend
+    )
+    with patch.object(openai_client.openai_client.embeddings, "create") as mock_create:
+        mock_create.return_value.data = [Mock(embedding=[0.1, 0.2, 0.3])]
+        assert openai_client.get_query_embedding("a query") == [0.1, 0.2, 0.3]
+
+
+def test_get_query_embedding_without_backend(openai_client):
+    with patch.object(openai_client.openai_client.embeddings, "create") as mock_create:
+        mock_create.return_value.data = [Mock(embedding=[0.1, 0.2, 0.3])]
+        assert openai_client.get_query_embedding("a query") == [0.1, 0.2, 0.3]
+
+
 def test_get_completion_json_response(openai_client):
     mock_response = Mock()
     mock_response.choices = [Mock(message=Mock(content='{"key": "value"}'))]
@@ -33,6 +100,26 @@ def test_get_completion_json_response(openai_client):
         assert result == {"key": "value"}
 
 
+def test_get_completion_uses_cache():
+    openai_client = OpenAIClient(
+        api_key="test_api_key", completion_cache=CompletionCache()
+    )
+    mock_response = Mock()
+    mock_response.choices = [Mock(message=Mock(content='{"key": "value"}'))]
+    query = "Test query" * 100
+    with patch.object(
+        openai_client.openai_client.chat.completions,
+        "create",
+        return_value=mock_response,
+    ) as mock_create:
+        assert openai_client.get_completion("Test prompt", query) == {"key": "value"}
+        assert openai_client.get_completion("Test prompt", query) == {"key": "value"}
+        mock_create.assert_called_once()
+        openai_client.invalidate_completion("Test prompt", query)
+        assert openai_client.get_completion("Test prompt", query) == {"key": "value"}
+        assert mock_create.call_count == 2
+
+
 def test_get_completion_text_response(openai_client):
     mock_response = Mock()
     mock_response.choices = [Mock(message=Mock(content="Test response"))]
@@ -85,3 +172,398 @@ def test_count_tokens(openai_client):
     result = openai_client.count_tokens("This is a test sentence.")
     assert isinstance(result, int)
     assert result > 0
+
+
+def test_count_tokens_batch_matches_count_tokens(openai_client):
+    texts = ["This is a test sentence.", "", "Another <|endoftext|> text"]
+    assert openai_client.count_tokens_batch(texts) == [
+        openai_client.count_tokens(text) for text in texts
+    ]
+
+
+def test_estimate_tokens_is_an_upper_bound(openai_client):
+    for text in ["This is a test sentence.", "héllo 日本語", "a" * 1000]:
+        assert openai_client.estimate_tokens(text) >= openai_client.count_tokens(text)
+
+
+def test_truncate_to_tokens(openai_client):
+    text = "word " * 100
+    truncated = openai_client.truncate_to_tokens(text, 10)
+    assert openai_client.count_tokens(truncated) == 10
+    assert text.startswith(truncated)
+
+
+def test_truncate_to_tokens_skips_encoding_short_texts(openai_client):
+    with patch.object(OpenAIClient, "ENCODING") as mock_encoding:
+        assert openai_client.truncate_to_tokens("short", 10) == "short"
+    mock_encoding.encode_ordinary.assert_not_called()
+
+
+def test_get_completion_truncates_to_context_window(openai_client):
+    mock_response = Mock()
+    mock_response.choices = [Mock(message=Mock(content='{"summary": "ok"}'))]
+    with patch.object(OpenAIClient, "CONTEXT_WINDOW_SIZES", {OpenAIClient.MODEL: 50}):
+        with patch.object(
+            openai_client.openai_client.chat.completions,
+            "create",
+            return_value=mock_response,
+        ) as mock_create:
+            openai_client.get_completion("Test prompt", "word " * 1000)
+    messages = mock_create.call_args.kwargs["messages"]
+    assert (
+        openai_client.count_tokens(messages[0]["content"])
+        + openai_client.count_tokens(messages[1]["content"])
+        == 50
+    )
+
+
+def test_get_embeddings_truncates_long_texts(openai_client):
+    with patch.object(OpenAIClient, "EMBEDDING_MAX_TOKENS", 5):
+        with patch.object(
+            openai_client.openai_client.embeddings,
+            "create",
+            side_effect=_embeddings_response,
+        ) as mock_create:
+            openai_client.get_embeddings(["word " * 20, "short"])
+    inputs = mock_create.call_args.kwargs["input"]
+    assert [openai_client.count_tokens(text) for text in inputs] == [5, 1]
+
+
+def test_short_embedding_texts_are_not_encoded(openai_client):
+    with patch.object(
+        openai_client.openai_client.embeddings,
+        "create",
+        return_value=Mock(data=[Mock(embedding=[0.1])]),
+    ), patch.object(
+        openai_client, "_encoding", wraps=openai_client._encoding
+    ) as mock_encoding:
+        openai_client.get_embedding("word " * 300)
+    mock_encoding.assert_not_called()
+
+
+def test_get_completion_uses_given_token_count(openai_client):
+    mock_response = Mock()
+    mock_response.choices = [Mock(message=Mock(content='{"summary": "ok"}'))]
+    with patch.object(OpenAIClient, "CONTEXT_WINDOW_SIZES", {OpenAIClient.MODEL: 50}):
+        with patch.object(
+            openai_client.openai_client.chat.completions,
+            "create",
+            return_value=mock_response,
+        ) as mock_create:
+            openai_client.get_completion("Test prompt", "word " * 1000, tokens=10)
+    assert mock_create.call_args.kwargs["messages"][1]["content"] == "word " * 1000
+
+
+def test_get_embedding_caps_concurrent_requests_per_model():
+    client = OpenAIClient(api_key="test_api_key", max_concurrent_requests_per_model=2)
+    in_flight = 0
+    max_in_flight = 0
+    lock = threading.Lock()
+
+    def create(**kwargs):
+        nonlocal in_flight, max_in_flight
+        with lock:
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+        time.sleep(0.05)
+        with lock:
+            in_flight -= 1
+        return Mock(data=[Mock(embedding=[0.1])])
+
+    with patch.object(client.openai_client.embeddings, "create", side_effect=create):
+        with ThreadPoolExecutor(max_workers=6) as executor:
+            results = list(executor.map(client.get_embedding, ["text"] * 6))
+    assert results == [[0.1]] * 6
+    assert max_in_flight == 2
+
+
+def _embeddings_response(**kwargs):
+    return Mock(
+        data=[
+            Mock(index=index, embedding=[float(len(text))])
+            for index, text in enumerate(kwargs["input"])
+        ]
+    )
+
+
+def test_get_embeddings_batches_and_keeps_order(openai_client):
+    texts = ["a", "bb", "ccc", "dddd", "eeeee"]
+    with patch.object(
+        openai_client.openai_client.embeddings,
+        "create",
+        side_effect=_embeddings_response,
+    ) as mock_create:
+        result = openai_client.get_embeddings(texts, max_items=2)
+    assert result == [[1.0], [2.0], [3.0], [4.0], [5.0]]
+    assert mock_create.call_count == 3
+    assert mock_create.call_args_list[0].kwargs["input"] == ["a", "bb"]
+
+
+def test_get_embeddings_chunks_by_token_budget(openai_client):
+    texts = ["word " * 10, "word " * 10, "word " * 10]
+    with patch.object(
+        openai_client.openai_client.embeddings,
+        "create",
+        side_effect=_embeddings_response,
+    ) as mock_create:
+        result = openai_client.get_embeddings(texts, max_tokens=25)
+    assert len(result) == 3
+    assert mock_create.call_count == 2
+
+
+@patch("services.openai_client.time")
+def test_get_embeddings_retries_only_failed_chunks(mock_time, openai_client):
+    calls = []
+
+    def create(**kwargs):
+        calls.append(kwargs["input"])
+        if kwargs["input"] == ["ccc"] and calls.count(["ccc"]) == 1:
+            raise _status_error(RateLimitError, 429)
+        return _embeddings_response(**kwargs)
+
+    with patch.object(
+        openai_client.openai_client.embeddings, "create", side_effect=create
+    ):
+        result = openai_client.get_embeddings(["a", "bb", "ccc"], max_items=2)
+    assert result == [[1.0], [2.0], [3.0]]
+    assert calls == [["a", "bb"], ["ccc"], ["ccc"]]
+    mock_time.sleep.assert_called_once()
+
+
+def test_get_embeddings_returns_none_for_failed_chunks(openai_client):
+    with patch.object(
+        openai_client.openai_client.embeddings,
+        "create",
+        side_effect=Exception("error"),
+    ) as mock_create:
+        result = openai_client.get_embeddings(["a", "", "ccc"])
+    assert result == [None, None, None]
+    # errors that are not transient are not retried
+    assert mock_create.call_count == 1
+    assert mock_create.call_args.kwargs["input"] == ["a", "ccc"]
+
+
+@patch("services.openai_client.time")
+def test_get_embeddings_retries_chunks_only_in_request(mock_time, openai_client):
+    with patch.object(
+        openai_client.openai_client.embeddings,
+        "create",
+        side_effect=_status_error(RateLimitError, 429),
+    ) as mock_create:
+        result = openai_client.get_embeddings(["a", "bb"])
+    assert result == [None, None]
+    assert mock_create.call_count == OpenAIClient.REQUEST_RETRIES + 1
+    assert mock_time.sleep.call_count == OpenAIClient.REQUEST_RETRIES
+
+
+def _status_error(error_class, status_code, headers=None):
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    response = httpx.Response(status_code, request=request, headers=headers or {})
+    return error_class("error", response=response, body=None)
+
+
+def _completion_response(content, total_tokens=100):
+    return Mock(
+        choices=[Mock(message=Mock(content=content))],
+        usage=Mock(total_tokens=total_tokens),
+    )
+
+
+@patch("services.openai_client.time")
+def test_get_completion_retries_rate_limit_errors(mock_time, openai_client):
+    error = _status_error(RateLimitError, 429, {"retry-after": "2"})
+    with patch.object(
+        openai_client.openai_client.chat.completions,
+        "create",
+        side_effect=[error, _completion_response('{"summary": "ok"}')],
+    ) as mock_create:
+        result = openai_client.get_completion("Test prompt", "Test query" * 100)
+    assert result == {"summary": "ok"}
+    assert mock_create.call_count == 2
+    delay = mock_time.sleep.call_args_list[0].args[0]
+    assert 2 <= delay <= 2 + OpenAIClient.RETRY_BASE_DELAY
+
+
+@patch("services.openai_client.time")
+def test_get_completion_raises_when_retries_exhausted(mock_time, openai_client):
+    error = APIConnectionError(request=httpx.Request("POST", "https://api"))
+    with patch.object(
+        openai_client.openai_client.chat.completions, "create", side_effect=error
+    ) as mock_create:
+        with pytest.raises(APIConnectionError):
+            openai_client.get_completion("Test prompt", "Test query" * 100)
+    assert mock_create.call_count == OpenAIClient.REQUEST_RETRIES + 1
+
+
+def test_get_completion_does_not_retry_bad_requests(openai_client):
+    with patch.object(
+        openai_client.openai_client.chat.completions,
+        "create",
+        side_effect=_status_error(BadRequestError, 400),
+    ) as mock_create:
+        result = openai_client.get_completion("Test prompt", "Test query" * 100)
+    assert result is None
+    assert mock_create.call_count == 1
+
+
+def test_get_completion_settles_estimated_tokens():
+    rate_limiter = Mock(spec=RateLimiter)
+    client = OpenAIClient(api_key="test_api_key", rate_limiter=rate_limiter)
+    with patch.object(
+        client.openai_client.chat.completions,
+        "create",
+        return_value=_completion_response('{"summary": "ok"}', total_tokens=42),
+    ):
+        client.get_completion("Test prompt", "Test query" * 100)
+    model, estimated_tokens = rate_limiter.acquire.call_args.args
+    assert model == OpenAIClient.MODEL
+    # charged the counted tokens, not the byte length estimate
+    assert estimated_tokens == (
+        client.count_tokens("Test prompt")
+        + client.count_tokens("Test query" * 100)
+        + OpenAIClient.COMPLETION_TOKENS_ESTIMATE
+    )
+    rate_limiter.settle.assert_called_once_with(model, estimated_tokens, 42)
+
+
+def test_retry_delay_uses_rate_limit_reset(openai_client):
+    error = _status_error(
+        RateLimitError,
+        429,
+        {
+            "x-ratelimit-remaining-requests": "10",
+            "x-ratelimit-reset-requests": "1s",
+            "x-ratelimit-remaining-tokens": "0",
+            "x-ratelimit-reset-tokens": "6.5s",
+        },
+    )
+    delay = openai_client._retry_delay(0, error)
+    assert 6.5 <= delay <= 6.5 + OpenAIClient.RETRY_BASE_DELAY
+
+
+def test_retry_delay_backs_off_with_jitter(openai_client):
+    delays = [openai_client._retry_delay(10, Exception("error")) for _ in range(20)]
+    assert all(0 <= delay <= OpenAIClient.RETRY_MAX_DELAY for delay in delays)
+    assert len(set(delays)) > 1
+
+
+def test_rate_limit_headers_update_rate_limiter():
+    rate_limiter = Mock(spec=RateLimiter)
+    client = OpenAIClient(api_key="test_api_key", rate_limiter=rate_limiter)
+    request = httpx.Request(
+        "POST", "https://api.openai.com/v1/embeddings", json={"model": "embed"}
+    )
+    headers = {
+        "x-ratelimit-limit-requests": "3000",
+        "x-ratelimit-remaining-requests": "2999",
+    }
+    client._update_rate_limits(httpx.Response(200, request=request, headers=headers))
+    model, response_headers = rate_limiter.update.call_args.args
+    assert model == "embed"
+    assert response_headers["x-ratelimit-remaining-requests"] == "2999"
+
+
+def batch_client(tmp_path, responder, **kwargs):
+    return OpenAIClient(
+        api_key="test_api_key",
+        batch_runner=LocalBatchRunner(tmp_path, responder),
+        **kwargs,
+    )
+
+
+def test_get_article_summarizations_batch(tmp_path):
+    long_text = "text " * 300
+
+    def responder(endpoint, body):
+        assert endpoint == OpenAIClient.CHAT_COMPLETIONS_ENDPOINT
+        assert body["response_format"] == {"type": "json_object"}
+        if "fails" in body["messages"][1]["content"]:
+            raise Exception("server error")
+        return LocalBatchRunner.chat_response('{"summary": "summary", "themes": []}')
+
+    cache = CompletionCache()
+    openai_client = batch_client(tmp_path, responder, completion_cache=cache)
+
+    summaries = openai_client.get_article_summarizations_batch(
+        {"a": long_text, "b": "short", "c": long_text + "fails"},
+        directory=tmp_path,
+    )
+
+    assert summaries == {
+        "a": {"summary": "summary", "themes": []},
+        "b": None,
+        "c": None,
+    }
+    with open(tmp_path / "batch_0.jsonl") as requests:
+        assert [json.loads(line)["custom_id"] for line in requests] == ["a", "c"]
+    # the synchronous call reuses the batch result
+    with patch.object(
+        openai_client.openai_client.chat.completions, "create"
+    ) as mock_create:
+        assert openai_client.get_article_summarization(long_text) == summaries["a"]
+        mock_create.assert_not_called()
+
+
+def test_get_embeddings_batch_skips_cached(tmp_path):
+    cache = EmbeddingCache()
+    cache.put(OpenAIClient.EMBEDDING_MODEL, "cached text", [0.9])
+    responder = Mock(return_value=LocalBatchRunner.embedding_response([0.1]))
+    openai_client = batch_client(tmp_path, responder, embedding_cache=cache)
+
+    embeddings = openai_client.get_embeddings_batch(
+        {"a": "cached\ntext", "b": "new text", "c": ""}
+    )
+
+    assert embeddings == {"a": [0.9], "b": [0.1], "c": None}
+    responder.assert_called_once_with(
+        OpenAIClient.EMBEDDINGS_ENDPOINT,
+        {"model": OpenAIClient.EMBEDDING_MODEL, "input": "new text"},
+    )
+    assert cache.get(OpenAIClient.EMBEDDING_MODEL, "new text") == [0.1]
+
+
+@patch("services.openai_client.time")
+def test_run_batch_splits_files_and_polls(mock_time, tmp_path):
+    runner = Mock()
+    runner.submit.side_effect = ["batch_1", "batch_2"]
+    runner.status.side_effect = ["in_progress", "completed", "completed"]
+    runner.results.side_effect = [
+        [{"custom_id": "0", "response": {"status_code": 200, "body": "zero"}}],
+        [{"custom_id": "2", "response": {"status_code": 500, "body": {}}}],
+    ]
+    openai_client = OpenAIClient(api_key="test_api_key", batch_runner=runner)
+    openai_client.BATCH_MAX_REQUESTS = 2
+
+    results = openai_client.run_batch(
+        [(str(n), {"n": n}) for n in range(3)],
+        OpenAIClient.EMBEDDINGS_ENDPOINT,
+        directory=tmp_path,
+        poll_interval=5,
+    )
+
+    assert results == {"0": "zero", "1": None, "2": None}
+    assert [call.args[0].name for call in runner.submit.call_args_list] == [
+        "batch_0.jsonl",
+        "batch_1.jsonl",
+    ]
+    mock_time.sleep.assert_called_once_with(5)
+
+
+def test_openai_batch_runner():
+    openai = Mock()
+    openai.files.create.return_value.id = "file_1"
+    openai.batches.create.return_value.id = "batch_1"
+    openai.batches.retrieve.return_value.output_file_id = "file_2"
+    openai.batches.retrieve.return_value.error_file_id = None
+    openai.files.content.return_value.text = '{"custom_id": "a"}\n'
+    runner = OpenAIBatchRunner(openai)
+
+    with patch("builtins.open") as mock_open:
+        assert runner.submit("requests.jsonl", "/v1/embeddings", "24h") == "batch_1"
+        mock_open.assert_called_once_with("requests.jsonl", "rb")
+
+    openai.batches.create.assert_called_once_with(
+        input_file_id="file_1", endpoint="/v1/embeddings", completion_window="24h"
+    )
+    assert runner.results("batch_1") == [{"custom_id": "a"}]
+    openai.files.content.assert_called_once_with("file_2")
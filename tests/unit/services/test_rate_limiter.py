@@ -0,0 +1,93 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from services.rate_limiter import RateLimiter, TokenBucket, parse_duration
+
+
+def test_token_bucket_refills_over_a_minute():
+    bucket = TokenBucket(60)
+    bucket.take(60)
+
+    assert bucket.wait_time(1, bucket._updated) == pytest.approx(1)
+    assert bucket.wait_time(1, bucket._updated + 1) == 0
+
+
+def test_token_bucket_caps_amounts_above_capacity():
+    bucket = TokenBucket(60)
+
+    assert bucket.wait_time(120, bucket._updated) == 0
+
+
+def test_try_acquire_returns_wait_when_limited():
+    limiter = RateLimiter(requests_per_minute=2, tokens_per_minute=1000)
+
+    assert limiter.try_acquire("model", 10) == 0
+    assert limiter.try_acquire("model", 10) == 0
+    assert limiter.try_acquire("model", 10) > 0
+    # models are limited independently
+    assert limiter.try_acquire("other", 10) == 0
+
+
+def test_try_acquire_limits_tokens():
+    limiter = RateLimiter(requests_per_minute=100, tokens_per_minute=1000)
+
+    assert limiter.try_acquire("model", 900) == 0
+    assert limiter.try_acquire("model", 200) == pytest.approx(6, abs=0.1)
+
+
+def test_settle_returns_unused_tokens():
+    limiter = RateLimiter(requests_per_minute=100, tokens_per_minute=1000)
+    limiter.try_acquire("model", 900)
+
+    limiter.settle("model", 900, 100)
+
+    assert limiter.try_acquire("model", 800) == 0
+
+
+def test_update_follows_headers():
+    limiter = RateLimiter(requests_per_minute=100, tokens_per_minute=1000)
+
+    limiter.update(
+        "model",
+        {
+            "x-ratelimit-limit-requests": "5000",
+            "x-ratelimit-remaining-requests": "0",
+            "x-ratelimit-limit-tokens": "1000",
+            "x-ratelimit-remaining-tokens": "1000",
+        },
+    )
+
+    requests, _ = limiter._buckets["model"]
+    assert requests.capacity == 5000
+    assert limiter.try_acquire("model", 10) > 0
+
+
+def test_update_ignores_invalid_headers():
+    limiter = RateLimiter()
+
+    limiter.update(
+        "model",
+        {"x-ratelimit-limit-tokens": "many", "x-ratelimit-remaining-tokens": "1"},
+    )
+
+    assert limiter.try_acquire("model", 10) == 0
+
+
+def test_limits_are_shared_across_threads():
+    limiter = RateLimiter(requests_per_minute=5, tokens_per_minute=1000)
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(lambda _: limiter.try_acquire("model", 1), range(5)))
+
+    assert limiter.try_acquire("model", 1) > 0
+
+
+@pytest.mark.parametrize(
+    "value, seconds",
+    [("1s", 1), ("6m0s", 360), ("20ms", 0.02), ("1h2m3.5s", 3723.5), ("", None)],
+)
+def test_parse_duration(value, seconds):
+    if seconds is None:
+        assert parse_duration(value) is None
+    else:
+        assert parse_duration(value) == pytest.approx(seconds)
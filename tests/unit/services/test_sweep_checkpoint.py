@@ -0,0 +1,44 @@
+import json
+from unittest.mock import MagicMock
+
+from botocore.exceptions import ClientError
+from services.sweep_checkpoint import SweepCheckpoint
+
+
+def test_load_returns_saved_key():
+    ssm_client = MagicMock()
+    ssm_client.get_parameter.return_value = {
+        "Parameter": {"Value": json.dumps({"id": "1", "type": "content"})}
+    }
+    checkpoint = SweepCheckpoint("checkpoint", ssm_client)
+
+    assert checkpoint.load() == {"id": "1", "type": "content"}
+    ssm_client.get_parameter.assert_called_once_with(Name="checkpoint")
+
+
+def test_load_without_key():
+    ssm_client = MagicMock()
+    ssm_client.get_parameter.return_value = {"Parameter": {"Value": "{}"}}
+
+    assert SweepCheckpoint("checkpoint", ssm_client).load() is None
+
+
+def test_load_of_missing_parameter():
+    ssm_client = MagicMock()
+    ssm_client.get_parameter.side_effect = ClientError(
+        {"Error": {"Code": "ParameterNotFound"}}, "GetParameter"
+    )
+
+    assert SweepCheckpoint("checkpoint", ssm_client).load() is None
+
+
+def test_save_clears_key_with_empty_object():
+    ssm_client = MagicMock()
+    checkpoint = SweepCheckpoint("checkpoint", ssm_client)
+
+    checkpoint.save({"id": "1"})
+    checkpoint.save(None)
+
+    values = [call.kwargs["Value"] for call in ssm_client.put_parameter.call_args_list]
+    assert values == ['{"id": "1"}', "{}"]
+    assert ssm_client.put_parameter.call_args.kwargs["Overwrite"]
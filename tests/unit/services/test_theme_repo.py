@@ -1,9 +1,12 @@
 from typing import Any
+import uuid
 from unittest.mock import MagicMock
 from sqlalchemy import func
+from sqlalchemy.dialects import postgresql
 import pytest
 from theme_repo import ThemeRepository
-from models.models import Association
+from datetime import datetime, timedelta
+from models.models import Association, ThemeStats
 from models.article import Article
 from models.browse import Browse
 from models.theme import Theme, ThemeType
@@ -24,49 +27,59 @@ def mock_query(repo: ThemeRepository) -> Any:
 @pytest.fixture
 def get_top_mock_query(mock_query: Any) -> Any:
     return (
-        mock_query.join.return_value.group_by.return_value.having.return_value.order_by.return_value.limit
+        mock_query.join.return_value.where.return_value.order_by.return_value.limit.return_value.all
     )
 
 
 @pytest.fixture
 def get_filter_embedding_mock_query(mock_query: Any) -> Any:
     return (
-        mock_query.join.return_value.group_by.return_value.where.return_value.having.return_value.order_by.return_value.limit
+        mock_query.join.return_value.where.return_value.where.return_value.order_by.return_value.limit.return_value.all
     )
 
 
 @pytest.fixture
 def get_top_mock_query_with_source(mock_query: Any) -> Any:
     return (
-        mock_query.join.return_value.group_by.return_value.filter.return_value.having.return_value.order_by.return_value.limit
+        mock_query.join.return_value.filter.return_value.where.return_value.order_by.return_value.limit.return_value.all
     )
 
 
+def association_stats(mock_query: Any) -> Any:
+    stats = mock_query.join.call_args[0][0]
+    assert stats.name == "theme_association"
+    return stats
+
+
 def test_get_recently_browsed_themes(repo: ThemeRepository, mock_query: Any):
-    # Mock the query result
-    art1 = Article(original_title="Test Article 1", url="https://example.com")
-    art2 = Article(original_title="Test Article 2", url="https://example.com")
-    art1._id = 1
-    art2._id = 2
-    article_query = (
-        mock_query.join.return_value.filter.return_value.group_by.return_value.all
-    )
-    article_query.return_value = [
-        (art1._id,),
-        (art2._id,),
-    ]
     theme_query = (
-        mock_query.join.return_value.filter.return_value.group_by.return_value.having.return_value.order_by.return_value.limit
+        mock_query.join.return_value.where.return_value.order_by.return_value.limit
     )
-    theme_query.return_value = [Theme(original_title="Test Theme")]
+    theme_query.return_value.all.return_value = [Theme(original_title="Test Theme")]
     results = repo.get(1, recent_browsed_days=1, sort_by="recently_browsed")
     assert len(results) == 1
     assert results[0].original_title == "Test Theme"
-    assert (Association.article_id.in_([art1._id, art2._id])).compare(
-        mock_query.join.return_value.filter.call_args[0][0]
+    # recently browsed articles are joined in the statement, not fetched first
+    repo._session.return_value.query.assert_called_once_with(Theme)
+    stats = association_stats(mock_query)
+    assert "JOIN recently_browsed" in str(stats.element)
+    assert stats.c.last_associated_at.desc().compare(
+        mock_query.join.return_value.where.return_value.order_by.call_args[0][0]
     )
-    article_query.assert_called_once()
-    theme_query.assert_called_once()
+    theme_query.assert_called_once_with(1)
+
+
+def test_get_themes_with_stats(repo: ThemeRepository, get_top_mock_query: Any):
+    theme = Theme(original_title="Test Theme")
+    get_top_mock_query.return_value = [(theme, 3, None, None)]
+    results = repo.get(1, with_stats=True)
+    assert results == [(theme, 3, None, None)]
+    args = repo._session.return_value.query.call_args[0]
+    stats = association_stats(repo._session.return_value.query.return_value)
+    assert args[0] is Theme
+    assert args[1] is stats.c.association_count
+    assert args[2] is stats.c.last_associated_at
+    assert args[3].name == "score"
 
 
 def test_get_all_themes(repo: ThemeRepository, mock_query: Any):
@@ -112,28 +125,39 @@ def test_get_theme_by_titles(repo: ThemeRepository, mock_query: Any):
 
 
 def test_add_related_theme(repo: ThemeRepository, mock_query: Any):
-    theme = Theme(original_title="Test Theme")
-    theme._id = 1
-    mock_query.options.return_value.filter.return_value.first.return_value = None
-    repo._session.return_value.merge.return_value = theme
-    # Create a new article and theme
+    existing_theme = Theme(original_title="Existing Theme")
+    existing_theme._id = 1
+    new_theme = Theme(original_title="New Theme")
+    new_theme._id = 2
+    mock_query.filter.return_value.all.side_effect = [[existing_theme], [new_theme]]
     article = Article(
         original_title="Test Article",
         summary="This is a test article",
         url="https://example.com",
     )
     article._id = 1
-    repo._session.return_value.query.return_value.filter.return_value.first.return_value = (
-        None
+
+    associations = repo.add_related(
+        article, ["Existing Theme", "New Theme", "new theme"]
     )
-    # Call the add_related method
-    association = repo.add_related(article, ["Test Theme"])
 
-    # Assert that the theme was added and the association was created
-    repo._session.return_value.add.assert_called()
-    repo._session.return_value.commit.assert_called()
-    assert association[0].article_id == article._id
-    assert association[0].theme_id == theme._id
+    first_lookup, reselect = [call[0][0] for call in mock_query.filter.call_args_list]
+    assert (Theme._title.in_(["existing+theme", "new+theme"])).compare(first_lookup)
+    assert (Theme._title.in_(["new+theme"])).compare(reselect)
+    theme_insert = repo._session.return_value.scalars.call_args[0][0]
+    sql = str(theme_insert.compile(dialect=postgresql.dialect()))
+    assert sql.startswith("INSERT INTO theme")
+    assert "ON CONFLICT (_title) DO NOTHING RETURNING theme._title" in sql
+    assert theme_insert.compile().params["_title_m0"] == "new+theme"
+    insert, refresh = [
+        call[0][0] for call in repo._session.return_value.execute.call_args_list
+    ]
+    assert "ON CONFLICT DO NOTHING" in str(insert.compile(dialect=postgresql.dialect()))
+    assert refresh.table.name == "theme_stats"
+    repo._session.return_value.commit.assert_called_once()
+    assert [association.article_id for association in associations] == [1, 1]
+    assert associations[0].theme_id == existing_theme._id
+    assert associations[1].theme_id == new_theme._id
 
 
 def test_del_related_article(repo: ThemeRepository, mock_query: Any):
@@ -199,9 +223,6 @@ def test_get_top_themes(
     repo: ThemeRepository, get_top_mock_query: Any, mock_query: Any
 ):
     # Mock the query result
-    mock_query.join.return_value.group_by.return_value.order_by.return_value.statement.compile.return_value = (
-        "SELECT * FROM themes"
-    )
     get_top_mock_query.return_value = [
         Theme(original_title="Popular Theme 1"),
         Theme(original_title="Popular Theme 2"),
@@ -218,20 +239,11 @@ def test_get_top_themes(
     assert top_themes[2].original_title == "Popular Theme 3"
 
     # Verify the query construction
-    mock_query.join.assert_called_once_with(Association)
-    mock_query.join.return_value.group_by.assert_called_once_with(Theme._id)
-    assert (
-        func.count(Association.article_id)
-        .desc()
-        .compare(
-            mock_query.join.return_value.group_by.return_value.having.return_value.order_by.call_args[
-                0
-            ][
-                0
-            ]
-        )
+    stats = association_stats(mock_query)
+    assert stats.c.association_count.desc().compare(
+        mock_query.join.return_value.where.return_value.order_by.call_args[0][0]
     )
-    mock_query.join.return_value.group_by.return_value.having.return_value.order_by.return_value.limit.assert_called_once_with(
+    mock_query.join.return_value.where.return_value.order_by.return_value.limit.assert_called_once_with(
         3
     )
 
@@ -254,7 +266,7 @@ def test_get_top_themes_with_custom_limit(
     assert top_themes[1].original_title == "Popular Theme 2"
 
     # Verify the query construction with custom limit
-    mock_query.join.return_value.group_by.return_value.having.return_value.order_by.return_value.limit.assert_called_once_with(
+    mock_query.join.return_value.where.return_value.order_by.return_value.limit.assert_called_once_with(
         2
     )
 
@@ -288,23 +300,18 @@ def test_get_top_themes_with_source_type(
     assert top_themes[1].original_title == "Popular Theme 2"
 
     # Verify the query construction with source type filter
-    mock_query.join.assert_called_once_with(Association)
+    stats = association_stats(mock_query)
     assert (Theme._source.in_([ThemeType.ARTICLE])).compare(
-        mock_query.join.return_value.group_by.return_value.filter.call_args[0][0]
+        mock_query.join.return_value.filter.call_args[0][0]
     )
-    mock_query.join.return_value.group_by.assert_called_once_with(Theme._id)
-    assert (
-        func.count(Association.article_id)
-        .desc()
-        .compare(
-            mock_query.join.return_value.group_by.return_value.filter.return_value.having.return_value.order_by.call_args[
-                0
-            ][
-                0
-            ]
-        )
+    assert stats.c.association_count.desc().compare(
+        mock_query.join.return_value.filter.return_value.where.return_value.order_by.call_args[
+            0
+        ][
+            0
+        ]
     )
-    mock_query.join.return_value.group_by.return_value.filter.return_value.having.return_value.order_by.return_value.limit.assert_called_once_with(
+    mock_query.join.return_value.filter.return_value.where.return_value.order_by.return_value.limit.assert_called_once_with(
         2
     )
 
@@ -327,21 +334,12 @@ def test_get_top_themes_without_source_type(
     assert top_themes[1].original_title == "Popular Theme 2"
 
     # Verify the query construction without source type filter
-    mock_query.join.assert_called_once_with(Association)
+    stats = association_stats(mock_query)
     mock_query.join.return_value.filter.assert_not_called()
-    mock_query.join.return_value.group_by.assert_called_once_with(Theme._id)
-    assert (
-        func.count(Association.article_id)
-        .desc()
-        .compare(
-            mock_query.join.return_value.group_by.return_value.having.return_value.order_by.call_args[
-                0
-            ][
-                0
-            ]
-        )
+    assert stats.c.association_count.desc().compare(
+        mock_query.join.return_value.where.return_value.order_by.call_args[0][0]
     )
-    mock_query.join.return_value.group_by.return_value.having.return_value.order_by.return_value.limit.assert_called_once_with(
+    mock_query.join.return_value.where.return_value.order_by.return_value.limit.assert_called_once_with(
         2
     )
 
@@ -354,6 +352,107 @@ def test_get_query_with_embedding(
     ]
     result = repo.get(filter_embedding=[0.1, 0.2, 0.3])
 
-    (result_theme, result_score) = result[0]
+    result_theme, result_score = result[0]
     assert result_theme.original_title == "Test Theme"
     assert result_score == 0.9
+    order_by = (
+        repo._session.return_value.query.return_value.join.return_value.where.return_value.where.return_value.order_by
+    )
+    assert (
+        Theme._embedding.cosine_distance([0.1, 0.2, 0.3])
+        .asc()
+        .compare(order_by.call_args[0][0])
+    )
+    repo._session.return_value.execute.assert_called_once()
+
+
+def test_get_with_embedding_sets_ef_search_in_the_querying_session(
+    repo: ThemeRepository,
+):
+    session = repo._session.return_value
+
+    repo.get(filter_embedding=[0.1, 0.2, 0.3], ef_search=100)
+
+    # set_config(..., true) lasts for the transaction, so the select must run before the session closes
+    calls = [name for name, _, _ in session.mock_calls]
+    set_config = calls.index("execute")
+    select = next(i for i, name in enumerate(calls) if name.endswith(".all"))
+    assert set_config < select < calls.index("close")
+    statement, params = session.execute.call_args[0]
+    assert "hnsw.ef_search" in str(statement)
+    assert params == {"ef_search": "100"}
+
+
+def test_refresh_stats_of_written_themes(repo: ThemeRepository):
+    theme_id = uuid.uuid4()
+
+    repo.refresh_stats([theme_id])
+
+    statement = repo._session.return_value.execute.call_args[0][0]
+    sql = str(statement.compile(dialect=postgresql.dialect()))
+    assert sql.startswith("INSERT INTO theme_stats")
+    assert "WHERE theme._id IN" in sql
+    assert "ON CONFLICT (_theme_id) DO UPDATE" in sql
+    repo._session.return_value.commit.assert_called_once()
+
+
+def test_refresh_stats_of_all_themes(repo: ThemeRepository):
+    repo.refresh_stats()
+
+    statement = repo._session.return_value.execute.call_args[0][0]
+    assert "WHERE theme._id IN" not in str(
+        statement.compile(dialect=postgresql.dialect())
+    )
+
+
+def test_update_refreshes_stats(repo: ThemeRepository):
+    theme = Theme(original_title="Test Theme")
+    theme._id = uuid.uuid4()
+    repo._session.return_value.merge.return_value = theme
+
+    repo.update(theme)
+
+    statement = repo._session.return_value.execute.call_args[0][0]
+    assert statement.table.name == "theme_stats"
+    repo._session.return_value.commit.assert_called_once()
+
+
+def test_get_themes_reads_theme_stats(repo: ThemeRepository, mock_query: Any):
+    repo.get(5)
+    stats = association_stats(mock_query)
+    assert "FROM theme_stats" in str(stats.element)
+
+
+def test_get_recently_browsed_themes_reads_recent_browse_count(
+    repo: ThemeRepository, mock_query: Any
+):
+    repo.get(5, recent_browsed_days=14, sort_by="recently_browsed")
+    stats = association_stats(mock_query)
+    assert "theme_stats._recent_browse_count AS association_count" in str(stats.element)
+    # sorted by the last association of a recently browsed article, as the counted path does
+    assert "theme_stats._recent_last_associated_at AS last_associated_at" in str(
+        stats.element
+    )
+
+
+def test_refresh_stats_ages_out_recent_browses(repo: ThemeRepository):
+    repo.refresh_stats()
+
+    statement = repo._session.return_value.execute.call_args[0][0]
+    compiled = statement.compile(dialect=postgresql.dialect())
+    # recent counts and times are recomputed over the browses within the window
+    assert "browsed._logged_at > %(logged_at_1)s" in str(compiled)
+    since = datetime.now() - timedelta(days=ThemeStats.RECENT_BROWSE_DAYS)
+    assert abs(compiled.params["logged_at_1"] - since) < timedelta(minutes=1)
+    assert "_recent_browse_count = excluded._recent_browse_count" in str(compiled)
+    assert "_recent_last_associated_at = excluded._recent_last_associated_at" in str(
+        compiled
+    )
+
+
+def test_get_themes_counts_associations_for_other_windows(
+    repo: ThemeRepository, mock_query: Any
+):
+    repo.get(5, association_days=1)
+    stats = association_stats(mock_query)
+    assert "FROM association" in str(stats.element)
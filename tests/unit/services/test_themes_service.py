@@ -0,0 +1,79 @@
+from unittest.mock import MagicMock
+from uuid import uuid4
+
+import pytest
+from sqlalchemy.orm import make_transient_to_detached
+from models.article import Article
+from models.theme import ThemeType
+from services import themes_service
+from services.openai_client import OpenAIClient
+from services.themes_service import ThemesService
+
+
+@pytest.fixture
+def openai_client():
+    client = MagicMock()
+    real_client = OpenAIClient(api_key="test_api_key")
+    client.count_tokens.side_effect = real_client.count_tokens
+    client.truncate_to_tokens.side_effect = real_client.truncate_to_tokens
+    client.get_theme_summarization.return_value = None
+    return client
+
+
+def _article(text, token_count=None):
+    article = Article("Title", "https://example.com", text=text)
+    article.token_count = token_count
+    return article
+
+
+def test_build_theme_reuses_stored_token_counts(openai_client):
+    service = ThemesService(MagicMock(), MagicMock(), openai_client)
+    articles = [_article("first text", 2), _article("second text", 2)]
+
+    service.build_theme_from_related_articles(articles, ThemeType.ARTICLE)
+
+    openai_client.count_tokens.assert_not_called()
+    openai_client.get_theme_summarization.assert_called_once_with(
+        ["first text", "second text"]
+    )
+
+
+def test_build_theme_truncates_articles_to_context_window(openai_client, monkeypatch):
+    monkeypatch.setattr(themes_service, "CONTEXT_WINDOW_SIZE", 30)
+    service = ThemesService(MagicMock(), MagicMock(), openai_client)
+    articles = [
+        _article("word " * 20),
+        _article("other " * 20, 20),
+        _article("last text", 2),
+    ]
+
+    service.build_theme_from_related_articles(articles, ThemeType.ARTICLE)
+
+    texts = openai_client.get_theme_summarization.call_args.args[0]
+    assert len(texts) == 2
+    assert texts[0] == "word " * 20
+    assert ("other " * 20).startswith(texts[1])
+    assert sum(openai_client.count_tokens(text) for text in texts) < 30
+
+
+def test_build_theme_loads_deferred_texts_in_one_query(openai_client):
+    article_repo = MagicMock()
+    loaded = _article("loaded text", 2)
+    deferred = [_article(None, 2), _article(None, 2)]
+    for article in deferred:
+        article._id = uuid4()
+        # detached without its text, as left by a relationship load
+        del article.__dict__["_text"]
+        make_transient_to_detached(article)
+    article_repo.get_texts.return_value = {
+        deferred[0].id: "first deferred",
+        deferred[1].id: "second deferred",
+    }
+    service = ThemesService(MagicMock(), article_repo, openai_client)
+
+    service.build_theme_from_related_articles([loaded] + deferred, ThemeType.ARTICLE)
+
+    article_repo.get_texts.assert_called_once_with([a.id for a in deferred])
+    openai_client.get_theme_summarization.assert_called_once_with(
+        ["loaded text", "first deferred", "second deferred"]
+    )